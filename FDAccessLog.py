@@ -0,0 +1,118 @@
+import atexit
+import os
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+
+class AccessLog:
+    """记录查询访问的追加式日志，用于统计热门键
+
+    访问记录先缓存在内存中，攒够FLUSH_COUNT条或距上次写入超过FLUSH_INTERVAL秒时批量追加到文件；
+    文件超过max_bytes时只保留最近retention_days天的记录（仍然超出则只保留后一半）。
+    """
+
+    FLUSH_COUNT = 64
+    FLUSH_INTERVAL = 30.0
+
+    def __init__(self, log_path: str, max_bytes: int = 8 << 20, retention_days: int = 30):
+        """初始化访问日志
+
+        Args:
+            log_path: 日志文件路径，每行格式为 "时间戳\t表名\t键名"
+            max_bytes: 日志文件大小上限，超出时清理旧记录
+            retention_days: 清理时保留最近多少天的记录
+        """
+        self.log_path = log_path
+        self.max_bytes = max_bytes
+        self.retention_days = retention_days
+        self.lock = threading.Lock()
+        self.buffer: list[str] = []
+        self._last_flush = time.monotonic()
+
+    def record(self, table_name: str, key: str) -> None:
+        """记录一次访问（先写入内存缓冲区）
+
+        Args:
+            table_name: 表名
+            key: 键名（将自动转换为小写）
+        """
+        key = key.strip().lower()
+        if not key or "\t" in key or "\n" in key:
+            return
+        with self.lock:
+            self.buffer.append(f"{int(time.time())}\t{table_name}\t{key}\n")
+            if len(self.buffer) >= self.FLUSH_COUNT or time.monotonic() - self._last_flush >= self.FLUSH_INTERVAL:
+                self._flush()
+
+    def flush(self) -> None:
+        """把缓冲区中的记录写入文件"""
+        with self.lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        """批量追加缓冲区中的记录，文件超出大小上限时清理（调用方持有锁）"""
+        self._last_flush = time.monotonic()
+        if not self.buffer:
+            return
+        lines, self.buffer = self.buffer, []
+        try:
+            os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.writelines(lines)
+                size = f.tell()
+            if size > self.max_bytes:
+                self._truncate()
+        except IOError as e:
+            print(f"写入访问日志失败: {e}")
+
+    def _truncate(self) -> None:
+        """只保留最近retention_days天的记录，仍然超出大小上限时只保留后一半（调用方持有锁）"""
+        cutoff = int(time.time()) - self.retention_days * 86400
+        with open(self.log_path, "r", encoding="utf-8") as f:
+            lines = [line for line in f if line.split("\t", 1)[0].isdigit() and int(line.split("\t", 1)[0]) >= cutoff]
+        if sum(len(line.encode("utf-8")) for line in lines) > self.max_bytes:
+            lines = lines[len(lines) // 2:]
+        temp_path = f"{self.log_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.writelines(lines)
+        os.replace(temp_path, self.log_path)
+
+    def most_queried(self, count: int = 100, table_name: Optional[str] = None, since: float = 0) -> list[tuple[str, str, int]]:
+        """统计访问次数最多的键（逐行读取，不一次性载入整个日志）
+
+        Args:
+            count: 返回数量
+            table_name: 只统计指定表，None表示所有表
+            since: 只统计该时间戳之后的访问
+
+        Returns:
+            [(表名, 键名, 次数), ...]，按次数降序排列
+        """
+        self.flush()
+        counter = Counter()
+        if not os.path.exists(self.log_path):
+            return []
+        try:
+            with open(self.log_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t")
+                    if len(parts) != 3:
+                        continue
+                    timestamp, table, key = parts
+                    if table_name and table != table_name:
+                        continue
+                    if since and (not timestamp.isdigit() or int(timestamp) < since):
+                        continue
+                    counter[(table, key)] += 1
+        except IOError as e:
+            print(f"读取访问日志失败: {e}")
+            return []
+        return [(table, key, times) for (table, key), times in counter.most_common(count)]
+
+
+# 创建全局访问日志实例
+ACCESS_LOG_PATH = os.path.join(os.path.dirname(__file__), 'data', 'access_log.txt')
+access_log = AccessLog(ACCESS_LOG_PATH)
+atexit.register(access_log.flush)
@@ -0,0 +1,274 @@
+import re
+import threading
+from typing import Callable, Iterable, Optional
+
+from .FDJsonDatabase import JsonDatabase, db_instance
+
+# 厂商的各种写法 → 统一的厂商名（与flash_detector的rawVendor一致）
+VENDOR_SYNONYMS = {
+    "micron": "micron", "镁光": "micron", "美光": "micron",
+    "spectek": "spectek", "镁光降级": "spectek", "美光降级": "spectek",
+    "kioxia": "kioxia", "铠侠": "kioxia", "恺侠": "kioxia", "toshiba": "kioxia", "东芝": "kioxia", "东芝/恺侠": "kioxia",
+    "skhynix": "skhynix", "hynix": "skhynix", "海力士": "skhynix", "sk海力士": "skhynix",
+    "samsung": "samsung", "三星": "samsung",
+    "intel": "intel", "英特尔": "intel", "solidigm": "intel",
+    "ymtc": "ymtc", "长江": "ymtc", "长江存储": "ymtc",
+    "westerndigital": "westerndigital", "wd": "westerndigital", "西数": "westerndigital",
+    "sandisk": "westerndigital", "闪迪": "westerndigital", "闪迪/西数": "westerndigital",
+    "nanya": "nanya", "南亚": "nanya",
+}
+
+# 条件中可以写的属性名 → 索引中的属性名
+ATTRIBUTE_NAMES = {
+    "vendor": "vendor", "厂商": "vendor",
+    "cell": "cellLevel", "celllevel": "cellLevel", "类型": "cellLevel", "单元": "cellLevel",
+    "node": "processNode", "process": "processNode", "processnode": "processNode", "制程": "processNode",
+    "density": "density", "容量": "density",
+    "package": "package", "封装": "package",
+    "die": "die",
+    "type": "type", "speed": "speed", "速度": "speed",
+}
+
+_SPLIT = re.compile(r"[\s/,;()（），；]+")
+_PIECES = re.compile(r"[/,;()（），；]+")
+_UNITS = ("nm", "mhz", "mtps", "v")
+_DENSITY = re.compile(r"^(\d+(?:\.\d+)?)\s*([kmgt])(?:i?b(?:it)?)?$", re.IGNORECASE)
+_DIE = re.compile(r"^(\d+)\s*(?:die|d)$", re.IGNORECASE)
+_UNKNOWN = ("", "未知", "0")
+
+
+def normalize_density(text: str) -> Optional[str]:
+    """容量统一为小写的 数字+单位+b 形式（"1Tb"、"1T" → "1tb"，"4Gb, 8K/64ms" → "4gb"）"""
+    first = _SPLIT.split(str(text).strip())[0] if str(text).strip() else ""
+    match = _DENSITY.match(first)
+    if not match:
+        return None
+    number = match.group(1).rstrip("0").rstrip(".") if "." in match.group(1) else match.group(1)
+    return f"{number}{match.group(2).lower()}b"
+
+
+def _words(text) -> set[str]:
+    """把属性值拆成小写的词：按分隔符拆开的每段去掉空白后整体保留，段内的词也单独保留（纯数字和单位除外）"""
+    text = str(text).strip().lower()
+    if text in _UNKNOWN:
+        return set()
+    words = {re.sub(r"\s+", "", text)}
+    for piece in _PIECES.split(text):
+        if piece.strip() in _UNKNOWN:
+            continue
+        words.add(re.sub(r"\s+", "", piece))
+        words.update(word for word in piece.split() if not word.isdigit() and word not in _UNITS)
+    return words
+
+
+def _vendor(data: dict) -> set[str]:
+    values = set()
+    for field in ("rawVendor", "vendor"):
+        for word in _words(data.get(field, "")):
+            values.add(VENDOR_SYNONYMS.get(word, word))
+    return values
+
+
+def _density(data: dict) -> set[str]:
+    density = normalize_density(data.get("density", ""))
+    return {density} if density else set()
+
+
+def _package(data: dict) -> set[str]:
+    """封装：提取 BGA132、TSOP48 这类"字母+引脚数"以及纯字母的封装名"""
+    text = str(data.get("package", "")).lower()
+    if text in _UNKNOWN:
+        return set()
+    values = {f"{letters}{digits}" for letters, digits in re.findall(r"([a-z]{3,})[-\s]?(\d{2,3})\b", text)}
+    values.update(f"bga{digits}" for digits in re.findall(r"\b(\d{2,3})(?:/\d+)?[-\s]?ball", text))
+    values.update(word for word in re.findall(r"[a-z]{3,}", text) if word not in ("ball", "and", "free", "lead"))
+    return values
+
+
+def _flash_die(data: dict) -> set[str]:
+    classification = data.get("classification")
+    die = classification.get("die") if isinstance(classification, dict) else data.get("die")
+    return {str(die)} if str(die) not in _UNKNOWN and die is not None else set()
+
+
+def _dram_die(data: dict) -> set[str]:
+    match = re.match(r"\s*(\d+)", str(data.get("die", "")))
+    return {match.group(1)} if match else set()
+
+
+def _speed(data: dict) -> set[str]:
+    """DRAM速度：保留 ddr4-3200、pc4-25600 等原词，并把 3200MTPS 记为 3200mts"""
+    values = _words(data.get("speed", ""))
+    values.update(f"{number}mts" for number in re.findall(r"(\d+)\s*mt(?:ps|/s)", str(data.get("speed", "")).lower()))
+    return values
+
+
+# 表名 → {属性名: 从记录的data中提取属性值集合的函数}
+EXTRACTORS: dict[str, dict[str, Callable[[dict], set[str]]]] = {
+    "flash_detail": {
+        "vendor": _vendor,
+        "cellLevel": lambda data: _words(data.get("cellLevel", "")),
+        "processNode": lambda data: _words(data.get("processNode", "")),
+        "density": _density,
+        "package": _package,
+        "die": _flash_die,
+    },
+    "dram_detail": {
+        "vendor": _vendor,
+        "type": lambda data: _words(data.get("type", "")),
+        "speed": _speed,
+        "density": _density,
+        "package": _package,
+        "die": _dram_die,
+    },
+}
+
+
+class Condition:
+    """一个筛选条件：属性名为None时匹配任意属性"""
+
+    def __init__(self, text: str, attribute: Optional[str], values: set[str]):
+        self.text = text
+        self.attribute = attribute
+        self.values = values
+
+
+def parse_conditions(text: str) -> list[Condition]:
+    """解析筛选条件
+
+    支持 "BiCS5 TLC 1Tb" 这样的任意属性关键词，以及 "厂商=海力士"、"die:4"、"4die" 这样指定属性的写法。
+
+    Raises:
+        ValueError: 属性名未知
+    """
+    conditions = []
+    for word in text.replace("：", ":").replace("＝", "=").split():
+        attribute = None
+        if "=" in word or ":" in word:
+            name, value = re.split(r"[=:]", word, maxsplit=1)
+            attribute = ATTRIBUTE_NAMES.get(name.lower())
+            if attribute is None:
+                raise ValueError(f"未知的属性：{name}（可用：{'、'.join(sorted(set(ATTRIBUTE_NAMES)))}）")
+        else:
+            value = word
+            die = _DIE.match(word)
+            if die:
+                attribute, value = "die", die.group(1)
+        value = value.lower()
+        values = {value, VENDOR_SYNONYMS.get(value, value)}
+        density = normalize_density(value)
+        if density:
+            values.add(density)
+        conditions.append(Condition(word, attribute, values))
+    return conditions
+
+
+class AttributeIndex:
+    """缓存记录的属性倒排索引：{表名: {属性名: {属性值: {键}}}}
+
+    随数据库的set/delete增量维护（通过数据库监听器），多条件查询时对倒排列表求交集。
+    """
+
+    def __init__(self, extractors: dict[str, dict[str, Callable[[dict], set[str]]]] = None,
+                 db: JsonDatabase = db_instance):
+        self.extractors = extractors or EXTRACTORS
+        self.db = db
+        self.lock = threading.Lock()
+        self._postings: dict[str, dict[str, dict[str, set[str]]]] = {}
+        self._forward: dict[str, dict[str, list[tuple[str, str]]]] = {}
+        self._dirty = True
+        db.add_listener(self._on_change)
+
+    def _on_change(self, table_name: Optional[str], key: Optional[str], value: Optional[dict]) -> None:
+        if table_name is not None and table_name not in self.extractors:
+            return
+        with self.lock:
+            if key is None or table_name is None:
+                self._dirty = True
+            elif not self._dirty:
+                self._remove(table_name, key)
+                if value is not None:
+                    self._add(table_name, key, value)
+
+    def _add(self, table_name: str, key: str, record: dict) -> None:
+        data = record.get("data") if isinstance(record, dict) else None
+        if not isinstance(data, dict):
+            return
+        postings = self._postings.setdefault(table_name, {})
+        entries = []
+        for attribute, extract in self.extractors[table_name].items():
+            for value in extract(data):
+                postings.setdefault(attribute, {}).setdefault(value, set()).add(key)
+                entries.append((attribute, value))
+        self._forward.setdefault(table_name, {})[key] = entries
+
+    def _remove(self, table_name: str, key: str) -> None:
+        entries = self._forward.get(table_name, {}).pop(key, None)
+        if not entries:
+            return
+        postings = self._postings.get(table_name, {})
+        for attribute, value in entries:
+            keys = postings.get(attribute, {}).get(value)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del postings[attribute][value]
+
+    def rebuild(self) -> None:
+        """从数据库重建整个索引"""
+        records = {table_name: [(key, self.db.peek(table_name, key)) for key in self.db.list_keys(table_name)]
+                   for table_name in self.extractors}
+        with self.lock:
+            self._postings = {}
+            self._forward = {}
+            for table_name, items in records.items():
+                for key, record in items:
+                    if record:
+                        self._add(table_name, key, record)
+            self._dirty = False
+
+    def _matching(self, table_name: str, condition: Condition) -> set[str]:
+        """一个条件在一张表中匹配到的键（属性未指定时合并所有属性）"""
+        postings = self._postings.get(table_name, {})
+        attributes: Iterable[str] = [condition.attribute] if condition.attribute else postings.keys()
+        keys = set()
+        for attribute in attributes:
+            values = postings.get(attribute, {})
+            for value in condition.values:
+                keys.update(values.get(value, ()))
+        return keys
+
+    def query(self, conditions: list[Condition], table_name: str) -> tuple[list[str], Optional[Condition]]:
+        """多条件查询（条件之间为"与"）
+
+        Returns:
+            (按键排序的匹配键列表, 没有任何匹配的条件或None)
+        """
+        if self._dirty:
+            self.rebuild()
+        with self.lock:
+            matched = []
+            for condition in conditions:
+                keys = self._matching(table_name, condition)
+                if not keys:
+                    return [], condition
+                matched.append(keys)
+        # 从最小的集合开始求交集
+        matched.sort(key=len)
+        result = set(matched[0])
+        for keys in matched[1:]:
+            result &= keys
+            if not result:
+                break
+        return sorted(result), None
+
+    def values(self, table_name: str, attribute: str) -> dict[str, int]:
+        """某个属性的所有取值及记录数"""
+        if self._dirty:
+            self.rebuild()
+        with self.lock:
+            return {value: len(keys) for value, keys in self._postings.get(table_name, {}).get(attribute, {}).items()}
+
+
+# 创建全局索引实例
+attr_index = AttributeIndex()
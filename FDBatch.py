@@ -0,0 +1,294 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import IO, Iterator, Optional
+
+from . import FDQueryMethods
+
+# 查询类型 → 查询函数
+QUERY_FUNCTIONS = {
+    "id": FDQueryMethods.get_detail_from_ID,
+    "detail": FDQueryMethods.get_detail,
+    "dram": FDQueryMethods.get_dram_detail,
+}
+
+# 闪存ID常见的厂商首字节
+ID_VENDOR_PREFIXES = ("89", "45", "2C", "EC", "AD", "98", "9B", "B5")
+
+CSV_FIELDS = ["line", "type", "input", "source", "result", "error", "partNumber", "vendor", "density", "die",
+              "cellLevel", "processNode", "data"]
+
+
+def detect_type(text: str) -> str:
+    """根据输入内容判断查询类型（闪存ID/DRAM料号/闪存料号）"""
+    compact = text.upper().replace("0X", "").replace(",", "").replace(" ", "").replace("ID", "")
+    if len(compact) >= 8 and FDQueryMethods.is_hex(compact) and compact.startswith(ID_VENDOR_PREFIXES):
+        return "id"
+    if FDQueryMethods.is_dram(text):
+        return "dram"
+    return "detail"
+
+
+def iter_inputs(stream: IO[str], path: str, query_type: str = "auto") -> Iterator[tuple[int, str, str]]:
+    """逐行读取输入（常量内存）
+
+    支持的格式：
+        .jsonl - 每行 {"id": ...} / {"pn": ...} / {"arg": ..., "type": ...}
+        .csv   - 第一列为ID或料号，可选第二列为类型；表头行会被跳过
+        其他   - 每行一个ID或料号
+
+    Returns:
+        (行号, 查询类型, 查询参数) 的迭代器
+    """
+    lower_path = path.lower()
+    if lower_path.endswith(".jsonl"):
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError:
+                print(f"\n跳过第{line_number}行（格式错误）", file=sys.stderr)
+                continue
+            if "id" in item:
+                yield line_number, item.get("type", "id"), str(item["id"])
+            else:
+                arg = str(item.get("pn", item.get("arg", "")))
+                yield line_number, item.get("type") or (detect_type(arg) if query_type == "auto" else query_type), arg
+        return
+    reader = csv.reader(stream) if lower_path.endswith(".csv") else ([line.strip()] for line in stream)
+    for line_number, row in enumerate(reader, 1):
+        if not row or not row[0].strip() or row[0].startswith("#"):
+            continue
+        arg = row[0].strip()
+        if line_number == 1 and arg.lower() in ("id", "pn", "part-number", "partnumber", "flash_id"):
+            continue
+        row_type = row[1].strip().lower() if len(row) > 1 and row[1].strip().lower() in QUERY_FUNCTIONS else None
+        yield line_number, row_type or (detect_type(arg) if query_type == "auto" else query_type), arg
+
+
+def _clean(result: dict) -> dict:
+    return {k: v for k, v in result.items() if k != "accept"}
+
+
+def resolve_local(items: list[tuple[int, str, str]]) -> list[tuple[int, str, str, Optional[dict]]]:
+    """在进程池中执行：只查缓存和本地解码，不联网、不写缓存
+
+    Returns:
+        [(行号, 类型, 参数, 结果或None)]，None表示需要联网查询
+    """
+    resolved = []
+    for line_number, query_type, arg in items:
+        try:
+            result = QUERY_FUNCTIONS[query_type](arg, local=True, save=False)
+        except Exception as e:
+            result = {"result": False, "error": str(e)}
+        resolved.append((line_number, query_type, arg, _clean(result) if result.get("result", False) else None))
+    return resolved
+
+
+def resolve_remote(query_type: str, arg: str, refresh: bool) -> dict:
+    """在线程池中执行：联网查询并写入缓存（与机器人一致）"""
+    try:
+        result = QUERY_FUNCTIONS[query_type](arg, refresh=refresh, local=False)
+        if result.get("result", False) and "accept" in result:
+            result["accept"]()
+        return _clean(result)
+    except Exception as e:
+        return {"result": False, "error": str(e)}
+
+
+class ResultWriter:
+    """以JSONL或CSV流式写出结果"""
+
+    def __init__(self, stream: IO[str], output_format: str = "jsonl"):
+        self.stream = stream
+        self.output_format = output_format
+        self.csv = None
+        if output_format == "csv":
+            self.csv = csv.DictWriter(stream, CSV_FIELDS, extrasaction="ignore")
+            self.csv.writeheader()
+
+    def write(self, line_number: int, query_type: str, arg: str, source: str, result: dict) -> None:
+        if self.csv is None:
+            self.stream.write(json.dumps({"line": line_number, "type": query_type, "input": arg, "source": source,
+                                          **result}, ensure_ascii=False))
+            self.stream.write("\n")
+            return
+        data = result.get("data", {})
+        row = {"line": line_number, "type": query_type, "input": arg, "source": source,
+               "result": result.get("result", False), "error": result.get("error", "")}
+        if isinstance(data, dict):
+            row.update({field: data.get(field, "") for field in CSV_FIELDS[6:-1]})
+            row["die"] = data.get("classification", {}).get("die", "") if isinstance(data.get("classification"), dict) else ""
+        row["data"] = json.dumps(data, ensure_ascii=False)
+        self.csv.writerow(row)
+
+
+class Progress:
+    """输出到stderr的进度条"""
+
+    def __init__(self, total: Optional[int] = None, enabled: bool = True, width: int = 30):
+        self.total = total
+        self.enabled = enabled
+        self.width = width
+        self.counts = {"local": 0, "remote": 0, "failed": 0}
+        self.start = time.monotonic()
+        self._last = 0.0
+
+    def update(self, source: str, ok: bool) -> None:
+        self.counts[source if ok else "failed"] += 1
+        self.render()
+
+    def render(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not self.enabled or (not force and now - self._last < 0.2):
+            return
+        self._last = now
+        done = sum(self.counts.values())
+        rate = done / max(now - self.start, 1e-9)
+        if self.total:
+            filled = int(self.width * done / self.total)
+            bar = f"[{'#' * filled}{'-' * (self.width - filled)}] {done}/{self.total}"
+        else:
+            bar = f"{done}"
+        print(f"\r{bar} {rate:.0f}/s 本地{self.counts['local']} 联网{self.counts['remote']} "
+              f"失败{self.counts['failed']}", end="", file=sys.stderr, flush=True)
+
+    def finish(self) -> None:
+        if self.enabled:
+            self.render(force=True)
+            print(file=sys.stderr)
+
+
+def _chunks(items: Iterator, size: int) -> Iterator[list]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run_batch(inputs: Iterator[tuple[int, str, str]], writer: ResultWriter, processes: Optional[int] = None,
+              concurrency: int = 4, chunk_size: int = 256, refresh: bool = False, local_only: bool = False,
+              progress: Optional[Progress] = None) -> dict[str, int]:
+    """批量查询
+
+    缓存命中和本地解码在进程池中按块并行执行；未命中的条目交给有界线程池联网查询。
+    进行中的块和联网请求数量都有上限，内存占用与输入规模无关。
+
+    Args:
+        inputs: (行号, 类型, 参数) 的迭代器
+        writer: 结果输出
+        processes: 进程数，默认为CPU核数
+        concurrency: 同时进行的联网查询数（仍受全局上游调度器限制）
+        chunk_size: 每个进程任务处理的条目数
+        refresh: 跳过缓存，全部联网查询
+        local_only: 只查缓存和本地解码，未命中直接输出失败
+        progress: 进度条
+
+    Returns:
+        统计信息 {"local": 本地完成数, "remote": 联网完成数, "failed": 失败数}
+    """
+    progress = progress or Progress(enabled=False)
+    processes = processes or os.cpu_count() or 2
+    # 联网查询 → 等待该结果的条目；相同的查询只发一次
+    remote_futures: dict[Future, list[tuple[int, str, str]]] = {}
+    in_flight: dict[tuple[str, str], Future] = {}
+
+    def emit(line_number: int, query_type: str, arg: str, source: str, result: dict) -> None:
+        writer.write(line_number, query_type, arg, source, result)
+        progress.update(source, result.get("result", False))
+
+    def drain_remote(limit: int) -> None:
+        while len(remote_futures) > limit:
+            done, _ = wait(list(remote_futures), return_when=FIRST_COMPLETED)
+            for future in done:
+                entries = remote_futures.pop(future)
+                in_flight.pop((entries[0][1], entries[0][2].lower()), None)
+                for line_number, query_type, arg in entries:
+                    emit(line_number, query_type, arg, "remote", future.result())
+
+    def submit_remote(io_pool: ThreadPoolExecutor, line_number: int, query_type: str, arg: str) -> None:
+        key = (query_type, arg.lower())
+        if key in in_flight:
+            remote_futures[in_flight[key]].append((line_number, query_type, arg))
+            return
+        future = in_flight[key] = io_pool.submit(resolve_remote, query_type, arg, refresh)
+        remote_futures[future] = [(line_number, query_type, arg)]
+        drain_remote(concurrency * 4)
+
+    with ProcessPoolExecutor(processes) as cpu_pool, ThreadPoolExecutor(concurrency) as io_pool:
+        if refresh:
+            for line_number, query_type, arg in inputs:
+                submit_remote(io_pool, line_number, query_type, arg)
+        else:
+            local_futures: list[Future] = []
+
+            def collect(future: Future) -> None:
+                for line_number, query_type, arg, result in future.result():
+                    if result is not None:
+                        emit(line_number, query_type, arg, "local", result)
+                    elif local_only:
+                        emit(line_number, query_type, arg, "local", {"result": False, "error": "本地未命中"})
+                    else:
+                        submit_remote(io_pool, line_number, query_type, arg)
+
+            for chunk in _chunks(inputs, chunk_size):
+                local_futures.append(cpu_pool.submit(resolve_local, chunk))
+                # 按提交顺序取回，保持有界的进行中任务数
+                while len(local_futures) >= processes * 2:
+                    collect(local_futures.pop(0))
+            for future in local_futures:
+                collect(future)
+        drain_remote(0)
+    return progress.counts
+
+
+def _count_lines(path: str) -> Optional[int]:
+    if path == "-":
+        return None
+    with open(path, "rb") as f:
+        return sum(1 for line in f if line.strip())
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="FlashDetail批量查询（闪存ID/料号文件）")
+    parser.add_argument("input", help="输入文件（csv/txt/jsonl），- 表示标准输入")
+    parser.add_argument("-o", "--output", default="-", help="输出文件，默认标准输出")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="输出格式（默认按输出文件扩展名，否则jsonl）")
+    parser.add_argument("--type", choices=["auto", *QUERY_FUNCTIONS], default="auto", help="查询类型")
+    parser.add_argument("--processes", type=int, help="本地解码进程数（默认CPU核数）")
+    parser.add_argument("--concurrency", type=int, default=4, help="同时进行的联网查询数")
+    parser.add_argument("--refresh", action="store_true", help="跳过缓存，全部联网查询")
+    parser.add_argument("--local-only", action="store_true", help="只使用缓存和本地解码")
+    parser.add_argument("--no-progress", action="store_true", help="不显示进度条")
+    args = parser.parse_args(argv)
+
+    output_format = args.format or ("csv" if args.output.lower().endswith(".csv") else "jsonl")
+    progress = Progress(_count_lines(args.input), not args.no_progress)
+    in_stream = sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8", newline="")
+    out_stream = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8", newline="")
+    try:
+        counts = run_batch(iter_inputs(in_stream, args.input, args.type), ResultWriter(out_stream, output_format),
+                           args.processes, args.concurrency, refresh=args.refresh, local_only=args.local_only,
+                           progress=progress)
+    finally:
+        progress.finish()
+        if in_stream is not sys.stdin:
+            in_stream.close()
+        if out_stream is not sys.stdout:
+            out_stream.close()
+    print(f"完成：本地{counts['local']}，联网{counts['remote']}，失败{counts['failed']}，"
+          f"用时{time.monotonic() - progress.start:.1f}秒", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
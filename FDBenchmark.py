@@ -0,0 +1,275 @@
+import argparse
+import gc
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Callable, Iterator, Optional
+
+from . import FDQueryMethods
+from .FDJsonDatabase import DB_PATH, JsonDatabase
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'data', 'benchmark_baseline.json')
+
+# 本地解码支持的闪存ID厂商阵营（按ID首字节区分）
+VENDOR_FAMILIES = {
+    "toggle": ("98", "45"),
+    "hynix": ("AD",),
+    "onfi": ("2C", "89", "B5"),
+    "ymtc": ("9B",),
+}
+
+PHISON_CORPUS = ["TA7IG55AIV", "IA8BG94AYV", "HPAIGK3AOW", "CABIG94A1O", "SP8AG55AIX", "NT7IG55AIV"]
+DENSITY_CORPUS = ["1Tb", "512Gb", "128Gb", "64Mb", "8192", "1.5Tb", "256Gb,2"]
+SEARCH_LENGTHS = (2, 4, 6, 8)
+
+
+class BenchmarkCase:
+    """一个基准测试项
+
+    Args:
+        name: 测试项名称
+        func: 执行一次操作的函数，参数为第几次调用
+        threads: 并发线程数，大于1时在多个线程中同时调用func
+        background: 测量期间在后台线程中持续运行的负载（如持续写入），参数为停止事件
+    """
+
+    def __init__(self, name: str, func: Callable[[int], object], threads: int = 1,
+                 background: Optional[Callable[[threading.Event], None]] = None):
+        self.name = name
+        self.func = func
+        self.threads = threads
+        self.background = background
+
+
+def _sustained_writes(db: JsonDatabase) -> Callable[[threading.Event], None]:
+    """持续写入（每次写入都保存整个文件），用于测量写入期间的读取吞吐"""
+    def write(stop: threading.Event) -> None:
+        i = 0
+        while not stop.is_set():
+            db.set("benchmark", f"key{i % 64}", {"data": {"value": i}})
+            i += 1
+    return write
+
+
+def load_corpus(path: str = DB_PATH) -> dict:
+    """读取随插件附带的数据库作为测试语料（不经过全局数据库实例）"""
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _ids_by_family(corpus: dict) -> dict[str, list[str]]:
+    ids = {family: [] for family in VENDOR_FAMILIES}
+    for record in corpus.get("flash_detail", {}).values():
+        for flash_id in record.get("data", {}).get("flashId", []):
+            for family, prefixes in VENDOR_FAMILIES.items():
+                if flash_id[:2].upper() in prefixes:
+                    ids[family].append(flash_id)
+    return {family: values for family, values in ids.items() if values}
+
+
+def build_cases(corpus: dict, db_copy_path: str) -> Iterator[BenchmarkCase]:
+    """根据语料生成所有测试项
+
+    Args:
+        corpus: 数据库内容
+        db_copy_path: 数据库副本路径，读写测试只操作副本
+    """
+    from . import result_to_text
+
+    for family, ids in _ids_by_family(corpus).items():
+        yield BenchmarkCase(f"decode_id/{family}",
+                            lambda i, ids=ids: FDQueryMethods.get_detail_from_ID(ids[i % len(ids)], refresh=True,
+                                                                                 local=True, save=False))
+    yield BenchmarkCase("parse_phison_pn",
+                        lambda i: FDQueryMethods.parse_phison_pn(PHISON_CORPUS[i % len(PHISON_CORPUS)]))
+    yield BenchmarkCase("format_density",
+                        lambda i: FDQueryMethods.format_density(DENSITY_CORPUS[i % len(DENSITY_CORPUS)]))
+
+    records = [{"result": True, **record} for record in corpus.get("flash_detail", {}).values()]
+    if records:
+        yield BenchmarkCase("result_to_text", lambda i: result_to_text(records[i % len(records)]))
+
+    db = JsonDatabase(db_copy_path)
+    keys = list(corpus.get("flash_detail", {}))
+    if keys:
+        for threads in (1, 4):
+            yield BenchmarkCase(f"db_get/{threads}t", lambda i: db.get("flash_detail", keys[i % len(keys)]), threads)
+        for threads in (1, 4):
+            yield BenchmarkCase(f"db_set/{threads}t",
+                                lambda i: db.set("benchmark", f"key{i % 64}", {"data": {"value": i}}), threads)
+        for threads in (1, 4):
+            yield BenchmarkCase(f"db_get_during_writes/{threads}t",
+                                lambda i: db.get("flash_detail", keys[i % len(keys)]), threads, _sustained_writes(db))
+
+        for length in SEARCH_LENGTHS:
+            queries = sorted({key[:length] for key in keys if len(key) >= length})
+            if queries:
+                yield BenchmarkCase(f"search_local/{length}",
+                                    lambda i, queries=queries: FDQueryMethods.search_local_database(
+                                        queries[i % len(queries)]))
+
+
+def _run_loop(case: BenchmarkCase, iterations: int) -> float:
+    """执行iterations次操作（多线程时平均分配），返回耗时"""
+    if case.threads <= 1:
+        start = time.perf_counter()
+        for i in range(iterations):
+            case.func(i)
+        return time.perf_counter() - start
+
+    per_thread = max(1, iterations // case.threads)
+    barrier = threading.Barrier(case.threads + 1)
+
+    def worker(offset: int) -> None:
+        barrier.wait()
+        for i in range(offset, offset + per_thread):
+            case.func(i)
+
+    workers = [threading.Thread(target=worker, args=(n * per_thread,)) for n in range(case.threads)]
+    for w in workers:
+        w.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for w in workers:
+        w.join()
+    return time.perf_counter() - start
+
+
+def measure(case: BenchmarkCase, min_time: float = 0.3, repeat: int = 5) -> dict:
+    """测量一个测试项
+
+    Returns:
+        {"ops_per_sec": 每秒操作数（多次重复取最好）, "peak_bytes": 单次操作的峰值内存分配,
+         "blocks": 单次操作后残留的内存块数}
+    """
+    stop = threading.Event()
+    background = threading.Thread(target=case.background, args=(stop,), daemon=True) if case.background else None
+    if background:
+        background.start()
+    try:
+        return _measure(case, min_time, repeat)
+    finally:
+        if background:
+            stop.set()
+            background.join()
+
+
+def _measure(case: BenchmarkCase, min_time: float, repeat: int) -> dict:
+    iterations = 1
+    while True:
+        elapsed = _run_loop(case, iterations)
+        if elapsed >= min_time / 10 or iterations >= 1 << 20:
+            break
+        iterations *= 4
+    # 每次重复大约耗时min_time / repeat
+    iterations = max(case.threads, int(iterations * min_time / repeat / max(elapsed, 1e-9)))
+    best = min(_run_loop(case, iterations) for _ in range(repeat))
+    ops = (iterations // case.threads * case.threads if case.threads > 1 else iterations) / best
+
+    # 单线程跑少量操作统计内存分配，避免tracemalloc拖慢计时
+    samples = min(iterations, 200)
+    peak_total = 0
+    gc.collect()
+    tracemalloc.start()
+    try:
+        snapshot_before = tracemalloc.take_snapshot()
+        for i in range(samples):
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            case.func(i)
+            peak_total += tracemalloc.get_traced_memory()[1] - current
+        snapshot_after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in snapshot_after.compare_to(snapshot_before, "filename"))
+    return {"ops_per_sec": ops, "peak_bytes": peak_total / samples, "blocks": blocks / samples}
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """与基线比较，返回退化项的说明"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if result["ops_per_sec"] < base["ops_per_sec"] * (1 - tolerance):
+            regressions.append(f"{name}: 吞吐 {result['ops_per_sec']:.0f}/s < 基线 {base['ops_per_sec']:.0f}/s")
+        if result["peak_bytes"] > max(base["peak_bytes"] * (1 + tolerance), base["peak_bytes"] + 1024):
+            regressions.append(f"{name}: 峰值分配 {result['peak_bytes']:.0f}B > 基线 {base['peak_bytes']:.0f}B")
+    return regressions
+
+
+def run(filters: Optional[list[str]] = None, min_time: float = 0.3,
+        progress: Optional[Callable[[str, dict], None]] = None) -> dict[str, dict]:
+    """运行基准测试（数据库读写只在临时副本上进行）
+
+    Args:
+        filters: 只运行名称包含其中任一字符串的测试项
+        min_time: 每个测试项的最短计时
+        progress: 每完成一项调用一次，参数为(名称, 结果)
+
+    Returns:
+        {测试项名称: 结果}
+    """
+    corpus = load_corpus()
+    results = {}
+    temp_dir = tempfile.mkdtemp(prefix="flashdetail-bench-")
+    try:
+        db_copy_path = os.path.join(temp_dir, "flash_detail_db.json")
+        shutil.copyfile(DB_PATH, db_copy_path)
+        for case in build_cases(corpus, db_copy_path):
+            if filters and not any(f in case.name for f in filters):
+                continue
+            results[case.name] = measure(case, min_time)
+            if progress:
+                progress(case.name, results[case.name])
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return results
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="FlashDetail热点路径基准测试（离线运行）")
+    parser.add_argument("filters", nargs="*", help="只运行名称包含这些字符串的测试项")
+    parser.add_argument("--min-time", type=float, default=0.3, help="每项最短计时（秒）")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="基线文件路径")
+    parser.add_argument("--save-baseline", action="store_true", help="将本次结果保存为基线")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="允许的退化比例")
+    args = parser.parse_args(argv)
+
+    print(f"{'测试项':<22}{'ops/s':>14}{'峰值B/op':>12}{'残留块/op':>12}")
+    results = run(args.filters, args.min_time,
+                  lambda name, r: print(f"{name:<24}{r['ops_per_sec']:>14,.0f}{r['peak_bytes']:>12,.0f}{r['blocks']:>12.2f}"))
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2)
+        print(f"基线已保存到 {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print("没有基线文件，使用 --save-baseline 保存本次结果")
+        return
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+    if regressions:
+        print("性能退化：")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print("未发现性能退化")
+
+
+if __name__ == "__main__":
+    main()
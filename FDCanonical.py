@@ -0,0 +1,223 @@
+import argparse
+import time
+import unicodedata
+from typing import Callable, Optional
+
+from .FDJsonDatabase import JsonDatabase, db_instance
+
+ALIAS_TABLE = "alias"
+
+
+def canonical_part_number(arg: str) -> str:
+    """料号的规范形式：全角转半角、去掉首尾空白并把连续空白合并为一个空格（镁光料号中的空格有意义）、大写"""
+    return " ".join(unicodedata.normalize("NFKC", arg).split()).upper()
+
+
+def canonical_flash_id(arg: str) -> str:
+    """闪存ID的规范形式：12位大写十六进制
+
+    支持 "2C A4 64"、"0x2c,0xa4"、"2ca4640000" 等写法：逗号或空白分隔的单个十六进制数字前补0，
+    超过12位截断，不足12位补0。
+    """
+    text = unicodedata.normalize("NFKC", arg).upper().replace("0X", "").replace("ID", "").strip()
+    groups = text.replace(",", " ").split()
+    hex_digits = ""
+    for group in groups:
+        # 提取每个分组中的hex字符，只有一个hex数字时前补0
+        hex_chars = "".join(c for c in group if c in "0123456789ABCDEF")
+        if len(hex_chars) == 1:
+            hex_chars = "0" + hex_chars
+        hex_digits += hex_chars
+    return hex_digits[:12].ljust(12, "0")
+
+
+def canonical_dram_pn(arg: str) -> str:
+    """DRAM料号的规范形式：Crucial的CT前缀与镁光的M前缀是同一颗粒（5位FBGA代码除外）"""
+    pn = canonical_part_number(arg)
+    if len(pn) != 5 and pn.startswith("CT"):
+        pn = "M" + pn[1:]
+    return pn
+
+
+def canonical_phison_pn(arg: str) -> str:
+    """群联料号的规范形式：料号中不使用数字0，统一为字母O"""
+    return canonical_part_number(arg).replace("0", "O")
+
+
+# 缓存表 → 规范化函数
+CANONICALIZERS: dict[str, Callable[[str], str]] = {
+    "flash_detail": canonical_part_number,
+    "flash_id_detail": canonical_flash_id,
+    "dram_detail": canonical_dram_pn,
+    "micron_pn_decode": canonical_part_number,
+    "spectek_mark_decode": canonical_part_number,
+}
+
+
+class AliasTable:
+    """别名表：把其他写法、FBGA代码、商品名映射到缓存表中的规范键
+
+    存放在数据库的alias表中，键为 "<表名>:<别名>"，值为 {"data": {"target": 规范键, "source": 来源}}。
+    来源为auto（查询时自动记录）或admin（管理员添加），自动记录不会覆盖管理员添加的别名。
+    """
+
+    def __init__(self, db: JsonDatabase = db_instance, table: str = ALIAS_TABLE):
+        self.db = db
+        self.table = table
+
+    @staticmethod
+    def _key(table_name: str, alias: str) -> str:
+        return f"{table_name}:{alias}"
+
+    def resolve(self, table_name: str, key: str) -> str:
+        """查找别名对应的规范键（没有别名时原样返回）"""
+        record = self.db.peek(self.table, self._key(table_name, key))
+        if record:
+            return record.get("data", {}).get("target", key)
+        return key
+
+    def add(self, table_name: str, alias: str, target: str, source: str = "auto", save: bool = True) -> bool:
+        """添加别名（别名与目标都应为规范键）
+
+        Args:
+            save: 是否立即写文件（为False时随下一次数据库保存一起写入）
+
+        Returns:
+            是否写入（别名与目标相同、或自动别名遇到管理员别名时不写入）
+        """
+        if not alias or not target or alias == target:
+            return False
+        existing = self.db.peek(self.table, self._key(table_name, alias))
+        if existing:
+            data = existing.get("data", {})
+            if data.get("target") == target or (source == "auto" and data.get("source") == "admin"):
+                return False
+        return self.db.set_many(self.table, [(self._key(table_name, alias),
+                                              {"data": {"target": target, "source": source}, "time": int(time.time())})],
+                                save)
+
+    def remove(self, table_name: str, alias: str) -> bool:
+        return self.db.delete(self.table, self._key(table_name, alias))
+
+    def items(self, table_name: Optional[str] = None) -> list[tuple[str, str, str, str]]:
+        """列出别名
+
+        Returns:
+            [(表名, 别名, 规范键, 来源)]
+        """
+        result = []
+        for key in self.db.list_keys(self.table):
+            table, _, alias = key.partition(":")
+            if table_name and table != table_name:
+                continue
+            data = (self.db.peek(self.table, key) or {}).get("data", {})
+            result.append((table, alias, data.get("target", ""), data.get("source", "")))
+        return result
+
+
+def canonical_key(table_name: str, arg: str, resolve_alias: bool = True) -> str:
+    """缓存键：按表规范化后转小写，再经过别名表映射
+
+    Args:
+        table_name: 缓存表名
+        arg: 用户输入
+        resolve_alias: 是否查询别名表
+
+    Returns:
+        用于查询和保存缓存的键
+    """
+    key = CANONICALIZERS.get(table_name, canonical_part_number)(arg).lower()
+    return aliases.resolve(table_name, key) if resolve_alias else key
+
+
+def alias_candidates(table_name: str, data: dict) -> list[str]:
+    """从一条记录的内容中找出其他写法（规范键形式）
+
+    flash_detail: 接口返回的规范料号、镁光完整料号（记录以FBGA代码为键时）
+    dram_detail: 接口返回的料号
+    """
+    if not isinstance(data, dict):
+        return []
+    candidates = []
+    if table_name in ("flash_detail", "dram_detail") and data.get("partNumber"):
+        candidates.append(data["partNumber"])
+    extra = data.get("extraInfo")
+    if table_name == "flash_detail" and isinstance(extra, dict) and extra.get("美光料号"):
+        candidates.append(extra["美光料号"])
+    return [canonical_key(table_name, candidate, resolve_alias=False) for candidate in candidates]
+
+
+def record_aliases(table_name: str, key: str, data: dict, db: JsonDatabase = db_instance) -> int:
+    """为刚保存（或即将保存）的记录登记别名，不覆盖已存在的同名记录，不立即写文件
+
+    Returns:
+        新增的别名数
+    """
+    count = 0
+    table = aliases if db is aliases.db else AliasTable(db)
+    for alias in alias_candidates(table_name, data):
+        if alias != key and not db.peek(table_name, alias):
+            count += table.add(table_name, alias, key, save=False)
+    return count
+
+
+def merge_duplicates(db: JsonDatabase, tables: Optional[list[str]] = None, dry_run: bool = False) -> dict[str, int]:
+    """把非规范键的记录合并到规范键下（较新者胜出）
+
+    Returns:
+        {表名: 合并的记录数}
+    """
+    merged = {}
+    for table_name in tables or list(CANONICALIZERS):
+        count = 0
+        for key in db.list_keys(table_name):
+            target = CANONICALIZERS[table_name](key).lower()
+            if target == key:
+                continue
+            count += 1
+            if dry_run:
+                print(f"{table_name}: {key} -> {target}")
+                continue
+            record = db.peek(table_name, key) or {}
+            existing = db.peek(table_name, target)
+            if not existing or record.get("time", 0) > existing.get("time", 0):
+                db.set_many(table_name, [(target, record)], save=False)
+            db.delete(table_name, key)
+        merged[table_name] = count
+    return merged
+
+
+def build_aliases(db: JsonDatabase = db_instance) -> int:
+    """为已有的缓存记录补登别名
+
+    Returns:
+        新增的别名数
+    """
+    count = 0
+    for table_name in ("flash_detail", "dram_detail"):
+        for key in db.list_keys(table_name):
+            count += record_aliases(table_name, key, (db.peek(table_name, key) or {}).get("data", {}), db)
+    db.flush()
+    return count
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="合并缓存数据库中写法不同的重复记录，并为已有记录补登别名")
+    parser.add_argument("tables", nargs="*", help=f"只处理这些表（默认全部：{'、'.join(CANONICALIZERS)}）")
+    parser.add_argument("--dry-run", action="store_true", help="只列出将被合并的键")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.tables if name not in CANONICALIZERS]
+    if unknown:
+        parser.error(f"未知的表：{'、'.join(unknown)}")
+    merged = merge_duplicates(db_instance, args.tables or None, args.dry_run)
+    for table_name, count in merged.items():
+        print(f"{table_name}: {'将合并' if args.dry_run else '已合并'}{count}条")
+    if not args.dry_run:
+        print(f"新增别名{build_aliases(db_instance)}条")
+
+
+# 全局实例
+aliases = AliasTable()
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,66 @@
-from pydantic import BaseModel, field_validator, ValidationError
+from pydantic import BaseModel, PrivateAttr, field_validator, ValidationError
 import json
 from pathlib import Path
-from typing import Any
+from typing import Any, NamedTuple
 import os
 
 
+class AclSnapshot(NamedTuple):
+    """编译后的权限快照：名单转为frozenset，并附带按会话缓存的判定结果
+
+    快照创建后不再修改名单，名单变化时整体替换为新快照
+    """
+    admin_users: frozenset
+    whitelist_user: frozenset
+    blacklist_user: frozenset
+    whitelist_group: frozenset
+    blacklist_group: frozenset
+    decisions: dict  # {session_id: 是否允许}
+
+    MAX_CACHED_DECISIONS = 4096
+
+
 class Config(BaseModel):
     # 核心配置字段
     admin_users: list[str] = ["1828665870"]  # 默认管理员包含所有者
     flash_detect_api_urls: list[str] = ["https://fd.sakuracg.com"]
     flash_extra_api_urls: list[str] = ["https://fe-backend.barryblueice.cn"]    
-    configs: dict[str, Any] = {"auto_join_group": True,"repeater": 4,"cat": True}  #其他非核心配置项
+    configs: dict[str, Any] = {"auto_join_group": True,"repeater": 4,"cat": True,
+                               "user_rate_per_minute": 10,"group_rate_per_minute": 30,"max_upstream_concurrency": 4,
+                               "metrics_port": 0,"micron_api_url": "","spectek_url": "",
+                               "http_cache_mb": 64,"query_deadline": 20,
+                               "progressive_reply": False,"speculative_prefetch": 3,"speculative_concurrency": 2,
+                               "db_table_capacity": {"flash_detail": 0,"dram_detail": 0,"micron_pn_decode": 0,
+                                                     "spectek_mark_decode": 0,"flash_id_pn": 0}}  #其他非核心配置项
     whitelist_user: list[str] = []
     blacklist_user: list[str] = []
     whitelist_group: list[str] = []
     blacklist_group: list[str] = []
+    progressive_group: list[str] = []  # 开启渐进式回复的群（先回复本地结果，再补充联网结果）
 
 
     # 新增：所有者ID（拥有最高权限）
     owner: str = "1828665870"  # 默认所有者
 
+    _acl: AclSnapshot = PrivateAttr(default=None)
+
+    def model_post_init(self, __context: Any) -> None:
+        self.rebuild_acl()
+
+    def rebuild_acl(self) -> None:
+        """根据当前名单重新编译权限快照（整体替换引用，读取方不会看到中间状态）"""
+        self._acl = AclSnapshot(
+            frozenset(self.admin_users),
+            frozenset(self.whitelist_user),
+            frozenset(self.blacklist_user),
+            frozenset(self.whitelist_group),
+            frozenset(self.blacklist_group),
+            {},
+        )
+
     # 验证器
-    @field_validator("admin_users", "whitelist_user", "blacklist_user", "whitelist_group", "blacklist_group", "owner")
+    @field_validator("admin_users", "whitelist_user", "blacklist_user", "whitelist_group", "blacklist_group",
+                     "progressive_group", "owner")
     def id_must_be_str(cls, v):
         if isinstance(v, list):
             if not all(isinstance(id_, str) for id_ in v):
@@ -38,6 +77,8 @@ class Config(BaseModel):
         return v
 
     def save_all(self, path: str = None) -> None:
+        # 名单的修改都会随后调用save_all，在此重新编译权限快照
+        self.rebuild_acl()
         # 如果没有指定路径，使用插件目录下的config.json
         if path is None:
             # 获取当前文件所在目录的绝对路径
@@ -70,6 +111,9 @@ class Config(BaseModel):
                 
                 # 复制旧配置中的所有字段到新配置
                 updated_config = {**default_data, **config_data}
+                # configs中新增的非核心配置项同样补全
+                if isinstance(config_data.get("configs"), dict):
+                    updated_config["configs"] = {**default_data["configs"], **config_data["configs"]}
                 
                 # 更新额外的kwargs
                 updated_config.update(kwargs)
@@ -83,6 +127,10 @@ class Config(BaseModel):
                         if key not in config_data:
                             needs_update = True
                             print(f"自动添加配置项: {key} = {value}")
+                    for key, value in default_data["configs"].items():
+                        if isinstance(config_data.get("configs"), dict) and key not in config_data["configs"]:
+                            needs_update = True
+                            print(f"自动添加配置项: configs.{key} = {value}")
                     
                     if needs_update:
                         config.save_all(path)
@@ -144,6 +192,7 @@ class Config(BaseModel):
             for key, value in new_config.model_dump().items():
                 if hasattr(self, key):
                     setattr(self, key, value)
+            self.rebuild_acl()
             
             print(f"配置已成功重载: {path}")
         except Exception as e:
@@ -154,10 +203,36 @@ class Config(BaseModel):
                 for key, value in new_config.model_dump().items():
                     if hasattr(self, key):
                         setattr(self, key, value)
+                self.rebuild_acl()
             except Exception:
                 print("无法完全修复配置，部分设置可能使用默认值")
 
+    def is_admin(self, user_id: str) -> bool:
+        return user_id in self._acl.admin_users
+
+    def is_valid_session(self, session_id: str) -> bool:
+        """根据NoneBot的session_id（group_<群号>_<用户>或<用户>）判断是否允许使用，结果按会话缓存"""
+        acl = self._acl
+        decision = acl.decisions.get(session_id)
+        if decision is None:
+            decision = self._check_acl(acl, session_id.split("_"))
+            if len(acl.decisions) >= AclSnapshot.MAX_CACHED_DECISIONS:
+                acl.decisions.clear()
+            acl.decisions[session_id] = decision
+        return decision
+
+    def is_progressive(self, session_id: str) -> bool:
+        """会话是否使用渐进式回复：群按progressive_group判断，configs中的progressive_reply对所有会话开启"""
+        if self.configs.get("progressive_reply", False):
+            return True
+        parts = session_id.split("_")
+        return len(parts) >= 3 and parts[0] == "group" and parts[1] in self.progressive_group
+
     def is_valid_user(self, args: list[str]) -> bool:
+        return self._check_acl(self._acl, args)
+
+    @staticmethod
+    def _check_acl(acl: AclSnapshot, args: list[str]) -> bool:
         # 检查参数有效性
         if not args or len(args) < 1:
             return False
@@ -169,15 +244,15 @@ class Config(BaseModel):
             user_id = args[2]
             
             # 检查群组权限
-            if self.whitelist_group and group_id not in self.whitelist_group:
+            if acl.whitelist_group and group_id not in acl.whitelist_group:
                 return False
-            if group_id in self.blacklist_group:
+            if group_id in acl.blacklist_group:
                 return False
         
         # 检查用户权限
-        if self.whitelist_user and user_id not in self.whitelist_user:
+        if acl.whitelist_user and user_id not in acl.whitelist_user:
             return False
-        if user_id in self.blacklist_user:
+        if user_id in acl.blacklist_user:
             return False
         
         return True
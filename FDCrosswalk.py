@@ -0,0 +1,164 @@
+import bisect
+import threading
+from typing import Optional
+
+from .FDCanonical import canonical_key
+from .FDJsonDatabase import JsonDatabase, db_instance
+
+# 记录闪存ID解码返回的可能料号（ID查询结果本身不缓存，只保存对应关系）
+ID_PN_TABLE = "flash_id_pn"
+
+# ID至少需要的十六进制位数（4字节），更短的ID匹配范围过大
+MIN_ID_LENGTH = 8
+
+
+def id_key(flash_id: str) -> str:
+    """闪存ID的索引形式：只保留十六进制字符并大写，去掉末尾补齐用的00"""
+    hex_digits = "".join(c for c in flash_id.upper() if c in "0123456789ABCDEF")
+    while hex_digits.endswith("00"):
+        hex_digits = hex_digits[:-2]
+    return hex_digits
+
+
+class Crosswalk:
+    """闪存ID ↔ 料号的双向索引
+
+    数据来源：
+        flash_detail表中每条料号记录的flashId列表
+        flash_id_detail表和flash_id_pn表中每个ID的availablePn列表
+
+    ID按前缀匹配（去掉末尾的00后，一方是另一方的前缀即视为同一颗粒），
+    随数据库的set/delete增量维护。
+    """
+
+    def __init__(self, db: JsonDatabase = db_instance):
+        self.db = db
+        self.lock = threading.Lock()
+        # {ID: {料号键: 来源数}}，同一对应关系可能来自多条记录
+        self._by_id: dict[str, dict[str, int]] = {}
+        self._by_pn: dict[str, dict[str, int]] = {}
+        # {(表名, 键): [(ID, 料号键)]}，用于记录更新或删除时撤销旧的对应关系
+        self._forward: dict[tuple[str, str], list[tuple[str, str]]] = {}
+        self._sorted_ids: list[str] = []
+        self._sorted_dirty = False
+        self._dirty = True
+        db.add_listener(self._on_change)
+
+    @staticmethod
+    def _pairs(table_name: str, key: str, record: Optional[dict]) -> list[tuple[str, str]]:
+        data = record.get("data") if isinstance(record, dict) else None
+        if not isinstance(data, dict):
+            return []
+        if table_name == "flash_detail":
+            flash_ids = data.get("flashId") or []
+            return [(id_key(flash_id), key) for flash_id in flash_ids
+                    if isinstance(flash_id, str) and len(id_key(flash_id)) >= MIN_ID_LENGTH]
+        available = data.get("availablePn") or []
+        flash_id = id_key(key)
+        if len(flash_id) < MIN_ID_LENGTH:
+            return []
+        return [(flash_id, canonical_key("flash_detail", pn, resolve_alias=False)) for pn in available
+                if isinstance(pn, str) and pn.strip()]
+
+    def _on_change(self, table_name: Optional[str], key: Optional[str], value: Optional[dict]) -> None:
+        if table_name is not None and table_name not in ("flash_detail", "flash_id_detail", ID_PN_TABLE):
+            return
+        with self.lock:
+            if key is None or table_name is None:
+                self._dirty = True
+            elif not self._dirty:
+                self._remove(table_name, key)
+                if value is not None:
+                    self._add(table_name, key, value)
+
+    @staticmethod
+    def _link(mapping: dict[str, dict[str, int]], a: str, b: str, delta: int) -> bool:
+        """调整a→b的计数
+
+        Returns:
+            a是否新出现或已消失
+        """
+        created = a not in mapping
+        targets = mapping.setdefault(a, {})
+        targets[b] = targets.get(b, 0) + delta
+        if targets[b] <= 0:
+            del targets[b]
+        if not targets:
+            del mapping[a]
+            return True
+        return created
+
+    def _add(self, table_name: str, key: str, record: dict) -> None:
+        pairs = self._pairs(table_name, key, record)
+        if not pairs:
+            return
+        self._forward[(table_name, key)] = pairs
+        for flash_id, pn in pairs:
+            self._sorted_dirty |= self._link(self._by_id, flash_id, pn, 1)
+            self._link(self._by_pn, pn, flash_id, 1)
+
+    def _remove(self, table_name: str, key: str) -> None:
+        for flash_id, pn in self._forward.pop((table_name, key), ()):
+            self._sorted_dirty |= self._link(self._by_id, flash_id, pn, -1)
+            self._link(self._by_pn, pn, flash_id, -1)
+
+    def rebuild(self) -> None:
+        """从数据库重建整个索引"""
+        records = [(table_name, key, self.db.peek(table_name, key))
+                   for table_name in ("flash_detail", "flash_id_detail", ID_PN_TABLE)
+                   for key in self.db.list_keys(table_name)]
+        with self.lock:
+            self._by_id, self._by_pn, self._forward = {}, {}, {}
+            for table_name, key, record in records:
+                self._add(table_name, key, record)
+            self._sorted_ids = sorted(self._by_id)
+            self._sorted_dirty = False
+            self._dirty = False
+
+    def _ensure(self) -> None:
+        if self._dirty:
+            self.rebuild()
+        if self._sorted_dirty:
+            with self.lock:
+                self._sorted_ids = sorted(self._by_id)
+                self._sorted_dirty = False
+
+    def part_numbers(self, flash_id: str) -> list[str]:
+        """查找ID对应的已缓存料号键
+
+        Returns:
+            料号键列表（按关联的ID与查询ID越接近越靠前，其次按字母顺序）
+        """
+        query = id_key(flash_id)
+        if len(query) < MIN_ID_LENGTH:
+            return []
+        self._ensure()
+        with self.lock:
+            matched: dict[str, int] = {}
+            # 已知ID是查询ID的前缀（查询ID更完整）
+            for length in range(MIN_ID_LENGTH, len(query) + 1):
+                for pn in self._by_id.get(query[:length], ()):
+                    matched[pn] = max(matched.get(pn, 0), length)
+            # 查询ID是已知ID的前缀（查询ID被截短）
+            start = bisect.bisect_left(self._sorted_ids, query)
+            for known in self._sorted_ids[start:]:
+                if not known.startswith(query):
+                    break
+                for pn in self._by_id.get(known, ()):
+                    matched[pn] = max(matched.get(pn, 0), len(query))
+        return sorted(matched, key=lambda pn: (-matched[pn], pn))
+
+    def flash_ids(self, pn: str) -> list[str]:
+        """查找料号对应的已知闪存ID（12位，按字母顺序）"""
+        key = canonical_key("flash_detail", pn, resolve_alias=False)
+        self._ensure()
+        with self.lock:
+            return sorted(flash_id.ljust(12, "0") for flash_id in self._by_pn.get(key, ()))
+
+    def stats(self) -> dict[str, int]:
+        self._ensure()
+        return {"ids": len(self._by_id), "part_numbers": len(self._by_pn)}
+
+
+# 创建全局索引实例
+crosswalk = Crosswalk()
@@ -0,0 +1,192 @@
+import argparse
+import json
+import os
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from .FDJsonDatabase import JsonDatabase, db_instance
+
+EXPORT_DIR = os.path.join(os.path.dirname(__file__), 'data', 'export')
+
+
+def _merge_fields(existing: Any, incoming: Any) -> Any:
+    """递归合并字段：已有的有效值保留，缺失或"未知"的值用另一方补全"""
+    if isinstance(existing, dict) and isinstance(incoming, dict):
+        merged = dict(existing)
+        for key, value in incoming.items():
+            merged[key] = _merge_fields(existing[key], value) if key in existing else value
+        return merged
+    if existing in (None, "", "未知", [], {}):
+        return incoming
+    return existing
+
+
+def merge_newest(existing: Optional[dict], incoming: dict) -> Optional[dict]:
+    """较新的记录胜出（按保存时间，缺失时间视为最旧）"""
+    if existing is None or incoming.get("time", 0) > existing.get("time", 0):
+        return incoming
+    return None
+
+
+def merge_keep(existing: Optional[dict], incoming: dict) -> Optional[dict]:
+    """保留已有记录，只导入不存在的键"""
+    return incoming if existing is None else None
+
+
+def merge_union(existing: Optional[dict], incoming: dict) -> Optional[dict]:
+    """合并两条记录的字段，较新一方的有效值优先"""
+    if existing is None:
+        return incoming
+    newer, older = (incoming, existing) if incoming.get("time", 0) > existing.get("time", 0) else (existing, incoming)
+    merged = _merge_fields(newer, older)
+    if "time" in existing or "time" in incoming:
+        merged["time"] = max(existing.get("time", 0), incoming.get("time", 0))
+    return None if merged == existing else merged
+
+
+# 合并策略：返回要写入的新值，返回None表示保持不变
+MERGE_STRATEGIES: Dict[str, Callable[[Optional[dict], dict], Optional[dict]]] = {
+    "newest": merge_newest,
+    "keep": merge_keep,
+    "union": merge_union,
+}
+
+
+def iter_table(table_name: str, db: JsonDatabase = db_instance) -> Iterator[tuple[str, dict]]:
+    """逐条遍历表中的记录"""
+    for key in db.list_keys(table_name):
+        value = db.peek(table_name, key)
+        if value is not None:
+            yield key, value
+
+
+def export_table(table_name: str, path: str, db: JsonDatabase = db_instance,
+                 progress: Optional[Callable[[int], None]] = None) -> int:
+    """将一张表逐行导出为JSONL文件，每行格式为 {"key": 键名, "value": 值}
+
+    Args:
+        table_name: 表名
+        path: 输出文件路径
+        db: 数据库实例
+        progress: 进度回调，每导出1000条调用一次，参数为已导出条数
+
+    Returns:
+        导出的记录数
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for key, value in iter_table(table_name, db):
+            f.write(json.dumps({"key": key, "value": value}, ensure_ascii=False))
+            f.write("\n")
+            count += 1
+            if progress and count % 1000 == 0:
+                progress(count)
+    if progress:
+        progress(count)
+    return count
+
+
+def export_database(directory: str = EXPORT_DIR, tables: Optional[list[str]] = None,
+                    db: JsonDatabase = db_instance, progress: Optional[Callable[[str, int], None]] = None) -> dict[str, int]:
+    """将数据库按表导出为 <目录>/<表名>.jsonl
+
+    Returns:
+        {表名: 导出条数}
+    """
+    result = {}
+    for table_name in tables or db.list_tables():
+        path = os.path.join(directory, f"{table_name}.jsonl")
+        result[table_name] = export_table(table_name, path, db,
+                                          (lambda count, t=table_name: progress(t, count)) if progress else None)
+    return result
+
+
+def iter_jsonl(path: str) -> Iterator[tuple[str, dict]]:
+    """逐行读取导出的JSONL文件（常量内存），跳过格式错误的行"""
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+                key, value = item["key"], item["value"]
+            except (json.JSONDecodeError, KeyError, TypeError) as e:
+                print(f"跳过第{line_number}行（格式错误）: {e}")
+                continue
+            if isinstance(key, str) and isinstance(value, dict):
+                yield key, value
+
+
+def import_table(path: str, table_name: Optional[str] = None, strategy: str = "newest",
+                 db: JsonDatabase = db_instance, batch_size: int = 1000,
+                 progress: Optional[Callable[[dict], None]] = None) -> dict[str, int]:
+    """从JSONL文件流式导入并合并到表中
+
+    Args:
+        path: JSONL文件路径
+        table_name: 目标表名，默认取文件名（不含扩展名）
+        strategy: 合并策略，newest（较新者胜出）/keep（保留已有）/union（合并字段）
+        db: 数据库实例
+        batch_size: 每批写入内存的记录数
+        progress: 进度回调，每处理一批调用一次，参数为当前统计信息
+
+    Returns:
+        统计信息 {"read": 读取条数, "written": 写入条数, "skipped": 未改变条数}
+    """
+    if strategy not in MERGE_STRATEGIES:
+        raise ValueError(f"未知的合并策略：{strategy}，支持{'/'.join(MERGE_STRATEGIES)}")
+    merge = MERGE_STRATEGIES[strategy]
+    table_name = table_name or os.path.splitext(os.path.basename(path))[0]
+    stats = {"read": 0, "written": 0, "skipped": 0}
+    batch = []
+
+    def flush_batch() -> None:
+        if batch:
+            db.set_many(table_name, batch, save=False)
+            stats["written"] += len(batch)
+            batch.clear()
+        if progress:
+            progress(stats.copy())
+
+    for key, value in iter_jsonl(path):
+        stats["read"] += 1
+        merged = merge(db.peek(table_name, key), value)
+        if merged is None:
+            stats["skipped"] += 1
+        else:
+            batch.append((key, merged))
+        if stats["read"] % batch_size == 0:
+            flush_batch()
+    flush_batch()
+    if stats["written"]:
+        db.flush()
+    return stats
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="FlashDetail缓存数据库导出/导入工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="按表导出为JSONL")
+    export_parser.add_argument("directory", nargs="?", default=EXPORT_DIR, help="输出目录")
+    export_parser.add_argument("--tables", nargs="*", help="只导出指定表")
+    import_parser = subparsers.add_parser("import", help="从JSONL导入并合并")
+    import_parser.add_argument("paths", nargs="+", help="JSONL文件（文件名即表名）")
+    import_parser.add_argument("--table", help="目标表名（默认取文件名）")
+    import_parser.add_argument("--strategy", choices=list(MERGE_STRATEGIES), default="newest", help="合并策略")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        result = export_database(args.directory, args.tables,
+                                 progress=lambda table, count: print(f"\r导出 {table}: {count}", end="", flush=True))
+        print()
+        for table_name, count in result.items():
+            print(f"{table_name}: {count}条")
+    elif args.command == "import":
+        for path in args.paths:
+            stats = import_table(path, args.table, args.strategy,
+                                 progress=lambda s: print(f"\r导入 {path}: 读取{s['read']}，写入{s['written']}，跳过{s['skipped']}", end="", flush=True))
+            print(f"\r导入 {path}: 读取{stats['read']}，写入{stats['written']}，跳过{stats['skipped']}")
+
+
+if __name__ == "__main__":
+    main()
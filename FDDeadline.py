@@ -0,0 +1,113 @@
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+# 剩余时间不足此值（秒）时不再发起新的上游请求
+MIN_REQUEST_TIMEOUT = 0.5
+
+
+class DeadlineExceeded(Exception):
+    """当前消息的处理时限已用完时抛出"""
+
+
+class Deadline:
+    """一条消息的处理时限
+
+    整条查询链（DRAM、料号、搜索、递归查询、镁光解码）共享同一个时限，
+    每次上游请求的超时取 min(默认超时, 剩余时间)，时限用完后不再发起请求。
+    """
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires = time.monotonic() + seconds
+        self.exceeded = False  # 是否有上游请求因时限被跳过或截短
+        self.partials: list[str] = []  # 时限用完时可以回复的部分结果
+
+    def remaining(self) -> float:
+        return self.expires - time.monotonic()
+
+    def timeout(self, default: float) -> float:
+        """本次上游请求可用的超时时间
+
+        Raises:
+            DeadlineExceeded: 剩余时间不足以发起请求
+        """
+        remaining = self.remaining()
+        if remaining < MIN_REQUEST_TIMEOUT:
+            self.exceeded = True
+            raise DeadlineExceeded(f"查询超过{self.seconds:g}秒时限")
+        if remaining < default:
+            self.exceeded = True
+        return min(default, remaining)
+
+    @property
+    def cut_short(self) -> bool:
+        """是否有请求因时限没能完整执行（截短的请求用完剩余时间说明很可能已超时）"""
+        return self.exceeded and self.remaining() < MIN_REQUEST_TIMEOUT
+
+    def add_partial(self, text: str) -> None:
+        if text and text not in self.partials:
+            self.partials.append(text)
+
+    def render(self, result: str) -> str:
+        """时限用完时的回复：已有结果时附加提示，没有结果时回复部分结果"""
+        if result and result != "无结果" and not result.startswith("未能查询到结果"):
+            return f"{result.rstrip()}\n（查询超过{self.seconds:g}秒，结果可能不完整）"
+        if self.partials:
+            return f"查询超过{self.seconds:g}秒，以下为部分结果：\n" + "\n".join(self.partials)
+        return f"查询超过{self.seconds:g}秒，未能取得结果，请稍后再试"
+
+
+_current_deadline: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar("fd_deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+@contextmanager
+def deadline_context(seconds: Optional[float]):
+    """在上下文中设置当前消息的处理时限（seconds为None或不大于0时不限时）
+
+    Returns:
+        Deadline实例或None
+    """
+    if not seconds or seconds <= 0:
+        yield None
+        return
+    deadline = Deadline(seconds)
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+def request_timeout(default: float) -> float:
+    """按当前时限计算上游请求的超时（没有时限时返回default）
+
+    Raises:
+        DeadlineExceeded: 剩余时间不足以发起请求
+    """
+    deadline = _current_deadline.get()
+    return default if deadline is None else deadline.timeout(default)
+
+
+def wait_limit(default: float) -> float:
+    """排队等待的最长时间：不超过剩余时限（不抛出异常）"""
+    deadline = _current_deadline.get()
+    return default if deadline is None else max(0.0, min(default, deadline.remaining()))
+
+
+def expires_at() -> Optional[float]:
+    """当前时限到期的time.monotonic()时刻，没有时限时为None"""
+    deadline = _current_deadline.get()
+    return deadline.expires if deadline else None
+
+
+def add_partial(text: str) -> None:
+    """记录一条部分结果（时限用完、没有完整结果时回复）"""
+    deadline = _current_deadline.get()
+    if deadline is not None:
+        deadline.add_partial(text)
@@ -0,0 +1,145 @@
+import threading
+from itertools import combinations
+from typing import Optional
+
+from .FDJsonDatabase import JsonDatabase, db_instance
+
+# OCR/手抄时容易混淆的字符组，组内字符互相替换的代价较低
+# 各组必须互不相交：索引按组归一化，一个字符只能归到一个组
+CONFUSION_GROUPS = ["0odq", "1il7", "8b", "5s", "2z", "69g"]
+CONFUSION_COST = 0.3
+
+# 每个字符归一化到所在混淆组的第一个字符，使纯混淆错误在索引空间中距离为0
+_CANONICAL_CHAR = {}
+for _group in CONFUSION_GROUPS:
+    for _char in _group:
+        _CANONICAL_CHAR.setdefault(_char, _group[0])
+_CONFUSABLE = {(a, b) for group in CONFUSION_GROUPS for a in group for b in group if a != b}
+
+
+def canonical_form(text: str) -> str:
+    """将字符串中的易混淆字符归一化"""
+    return "".join(_CANONICAL_CHAR.get(c, c) for c in text.lower())
+
+
+def weighted_distance(a: str, b: str) -> float:
+    """考虑易混淆字符的加权编辑距离（含相邻字符交换）"""
+    a, b = a.lower(), b.lower()
+    previous_previous = None
+    previous = [float(j) for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        current = [float(i)] + [0.0] * len(b)
+        for j in range(1, len(b) + 1):
+            if a[i - 1] == b[j - 1]:
+                substitution = 0.0
+            elif (a[i - 1], b[j - 1]) in _CONFUSABLE:
+                substitution = CONFUSION_COST
+            else:
+                substitution = 1.0
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + substitution)
+            if previous_previous and i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+
+def _deletes(word: str, max_distance: int) -> set[str]:
+    """生成删除至多max_distance个字符后的所有变体（含原词）"""
+    result = {word}
+    for n in range(1, min(max_distance, len(word) - 1) + 1):
+        for positions in combinations(range(len(word)), n):
+            result.add("".join(c for i, c in enumerate(word) if i not in positions))
+    return result
+
+
+class FuzzyIndex:
+    """缓存料号的容错搜索索引（SymSpell风格的删除索引）
+
+    键先做易混淆字符归一化，再为每个键登记删除至多max_distance个字符的变体。
+    查询时生成查询词的删除变体求交得到候选，最后按加权编辑距离排序。
+    随数据库的set/delete增量维护。
+    """
+
+    def __init__(self, table_name: str, db: JsonDatabase = db_instance, max_distance: int = 2):
+        self.table_name = table_name
+        self.db = db
+        self.max_distance = max_distance
+        self.lock = threading.Lock()
+        self._deletes: dict[str, set[str]] = {}
+        self._keys: set[str] = set()
+        self._dirty = True
+        db.add_listener(self._on_change)
+
+    def _on_change(self, table_name: Optional[str], key: Optional[str], value: Optional[dict]) -> None:
+        if table_name is not None and table_name != self.table_name:
+            return
+        with self.lock:
+            if key is None:
+                self._dirty = True
+            elif not self._dirty:
+                if value is None:
+                    self._remove(key)
+                else:
+                    self._add(key)
+
+    def _add(self, key: str) -> None:
+        if key in self._keys:
+            return
+        self._keys.add(key)
+        for variant in _deletes(canonical_form(key), self.max_distance):
+            self._deletes.setdefault(variant, set()).add(key)
+
+    def _remove(self, key: str) -> None:
+        if key not in self._keys:
+            return
+        self._keys.discard(key)
+        for variant in _deletes(canonical_form(key), self.max_distance):
+            keys = self._deletes.get(variant)
+            if keys:
+                keys.discard(key)
+                if not keys:
+                    del self._deletes[variant]
+
+    def rebuild(self) -> None:
+        """从数据库重建整个索引"""
+        keys = self.db.list_keys(self.table_name)
+        with self.lock:
+            self._deletes = {}
+            self._keys = set()
+            for key in keys:
+                self._add(key)
+            self._dirty = False
+
+    def query(self, text: str, count: int = 5, max_cost: float = 2.0) -> list[tuple[str, float]]:
+        """查找与text相近的已缓存键
+
+        Args:
+            text: 查询字符串
+            count: 最多返回数量
+            max_cost: 允许的最大加权编辑距离
+
+        Returns:
+            [(键名, 距离), ...]，按距离升序排列
+        """
+        text = text.strip().lower()
+        if not text:
+            return []
+        if self._dirty:
+            self.rebuild()
+        candidates = set()
+        with self.lock:
+            for variant in _deletes(canonical_form(text), self.max_distance):
+                candidates.update(self._deletes.get(variant, ()))
+        ranked = []
+        for key in candidates:
+            if key == text:
+                continue
+            distance = weighted_distance(text, key)
+            if distance <= max_cost:
+                ranked.append((key, distance))
+        ranked.sort(key=lambda item: (item[1], item[0]))
+        return ranked[:count]
+
+
+# 创建全局索引实例
+flash_fuzzy_index = FuzzyIndex('flash_detail')
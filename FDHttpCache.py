@@ -0,0 +1,223 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, NamedTuple, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+
+CACHE_DIR = os.path.join(os.path.dirname(__file__), 'data', 'http_cache')
+
+# 各接口的缓存有效期（秒），按URL中的接口段匹配
+ENDPOINT_TTLS = {
+    "searchPn": 6 * 3600,
+    "decode": 7 * 86400,
+    "decodeId": 7 * 86400,
+    "DRAM": 7 * 86400,
+    "getpartbyfbgacode": 30 * 86400,
+}
+DEFAULT_TTL = 86400
+# 否定结果（"result": false、镁光"details": []）只短暂缓存，避免上游补录数据后仍长期回放“查不到”
+NEGATIVE_TTL = 600
+NEGATIVE_PATTERN = re.compile(rb'"result"\s*:\s*false|"details"\s*:\s*\[\s*\]')
+
+DEFAULT_PORTS = {"http": "80", "https": "443"}
+
+
+class CacheEntry(NamedTuple):
+    expires: float
+    size: int
+
+
+def normalize_url(url: str) -> str:
+    """规范化URL作为缓存键：协议和主机小写、去掉默认端口、查询参数排序、去掉末尾斜杠"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and str(parts.port) != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    path = parts.path.rstrip("/") or "/"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, path, query, ""))
+
+
+def is_negative(content: bytes) -> bool:
+    """响应体是否为否定结果（接口返回未找到）"""
+    return NEGATIVE_PATTERN.search(content) is not None
+
+
+class HttpCache:
+    """上游响应的磁盘缓存：按规范化URL存储压缩后的响应体，按接口设置有效期，超出容量时淘汰最久未使用的条目
+
+    每个条目一个文件：第一行为JSON元数据，其后为zlib压缩的响应体。
+    内存中只保存 {键: (过期时间, 文件大小)}，顺序即LRU顺序。
+    """
+
+    def __init__(self, directory: str = CACHE_DIR, max_bytes: int = 64 << 20, ttls: Optional[dict[str, int]] = None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttls = dict(ENDPOINT_TTLS, **(ttls or {}))
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self.total_bytes = 0
+        self.counters = {"hit": 0, "miss": 0, "expired": 0, "stored": 0, "evicted": 0}
+        self._loaded = False
+
+    def configure_from(self, configs: dict[str, Any]) -> None:
+        """从插件配置的configs字典更新缓存容量（http_cache_mb，0表示关闭）和有效期（http_cache_ttls）"""
+        with self.lock:
+            self.max_bytes = int(configs.get("http_cache_mb", 64)) << 20
+            self.ttls = dict(ENDPOINT_TTLS, **configs.get("http_cache_ttls", {}))
+            if self._loaded:
+                self._evict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def ttl_for(self, endpoint: str, negative: bool = False) -> int:
+        ttl = self.ttls.get(endpoint, DEFAULT_TTL)
+        return min(ttl, NEGATIVE_TTL) if negative else ttl
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".bin")
+
+    def _load(self) -> None:
+        """首次使用时扫描缓存目录，按文件修改时间（即最近访问时间）重建LRU顺序"""
+        self._loaded = True
+        if not os.path.isdir(self.directory):
+            return
+        found = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".bin"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path, "rb") as f:
+                    meta = json.loads(f.readline())
+                found.append((os.path.getmtime(path), meta["key"], CacheEntry(meta["expires"], os.path.getsize(path))))
+            except (OSError, ValueError, KeyError):
+                self._remove_file(path)
+        for _, key, entry in sorted(found):
+            self.entries[key] = entry
+            self.total_bytes += entry.size
+        self._evict()
+
+    @staticmethod
+    def _remove_file(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _drop(self, key: str) -> None:
+        entry = self.entries.pop(key, None)
+        if entry:
+            self.total_bytes -= entry.size
+            self._remove_file(self._path(key))
+
+    def _evict(self) -> None:
+        while self.entries and self.total_bytes > self.max_bytes:
+            self._drop(next(iter(self.entries)))
+            self.counters["evicted"] += 1
+
+    def get(self, url: str) -> Optional[requests.Response]:
+        """读取缓存的响应
+
+        Returns:
+            未过期时返回重建的requests.Response，否则返回None
+        """
+        if not self.enabled:
+            return None
+        key = normalize_url(url)
+        with self.lock:
+            if not self._loaded:
+                self._load()
+            entry = self.entries.get(key)
+            if entry is None:
+                self.counters["miss"] += 1
+                return None
+            if entry.expires < time.time():
+                self._drop(key)
+                self.counters["expired"] += 1
+                return None
+            self.entries.move_to_end(key)
+            path = self._path(key)
+            try:
+                with open(path, "rb") as f:
+                    meta = json.loads(f.readline())
+                    body = zlib.decompress(f.read())
+                os.utime(path)
+            except (OSError, ValueError, zlib.error):
+                self._drop(key)
+                self.counters["miss"] += 1
+                return None
+            self.counters["hit"] += 1
+        response = requests.Response()
+        response.status_code = meta["status"]
+        response.url = meta["url"]
+        response.encoding = meta.get("encoding")
+        response.headers.update(meta.get("headers", {}))
+        response._content = body
+        return response
+
+    def put(self, url: str, endpoint: str, response: requests.Response) -> None:
+        """保存成功的响应（只缓存200响应，否定结果只缓存NEGATIVE_TTL秒）"""
+        if not self.enabled or response.status_code != 200:
+            return
+        key = normalize_url(url)
+        meta = {"key": key, "url": response.url or url, "status": response.status_code,
+                "encoding": response.encoding, "stored": time.time(),
+                "expires": time.time() + self.ttl_for(endpoint, is_negative(response.content)),
+                "headers": {name: value for name, value in response.headers.items()
+                            if name.lower() == "content-type"}}
+        data = json.dumps(meta, ensure_ascii=False).encode("utf-8") + b"\n" + zlib.compress(response.content, 6)
+        path = self._path(key)
+        with self.lock:
+            if not self._loaded:
+                self._load()
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                temp_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(temp_path, "wb") as f:
+                    f.write(data)
+                os.replace(temp_path, path)
+            except OSError as e:
+                print(f"写入HTTP缓存失败: {e}")
+                return
+            old = self.entries.pop(key, None)
+            if old:
+                self.total_bytes -= old.size
+            self.entries[key] = CacheEntry(meta["expires"], len(data))
+            self.total_bytes += len(data)
+            self.counters["stored"] += 1
+            self._evict()
+
+    def clear(self) -> int:
+        """清空缓存
+
+        Returns:
+            删除的条目数
+        """
+        with self.lock:
+            if not self._loaded:
+                self._load()
+            count = len(self.entries)
+            for key in list(self.entries):
+                self._drop(key)
+            return count
+
+    def summary(self) -> str:
+        lookups = self.counters["hit"] + self.counters["miss"] + self.counters["expired"]
+        hit_rate = self.counters["hit"] / lookups * 100 if lookups else 0.0
+        return (f"HTTP缓存: {len(self.entries)}条 {self.total_bytes / 1048576:.1f}/{self.max_bytes >> 20}MB "
+                f"命中率{hit_rate:.1f}%（{self.counters['hit']}/{lookups}）淘汰{self.counters['evicted']}")
+
+
+# 全局实例
+http_cache = HttpCache()
@@ -1,11 +1,29 @@
+import heapq
 import json
 import os
 import threading
 import time
-from typing import Dict, Any, Optional
+from typing import Callable, Dict, Any, Iterable, Optional
+
+from .FDMetrics import timed, record_cache_lookup
+from .FDTrace import note
 
 class JsonDatabase:
-    """基于JSON文件的简单数据库实现"""
+    """基于JSON文件的简单数据库实现
+
+    读取不加锁：self.data是不可变的快照（发布后不再修改），写入方在锁内复制被修改的表、
+    生成新快照后整体替换引用，读取方拿到的总是某个完整版本，保存文件期间也不会被阻塞。
+
+    可以为各表设置容量上限（见set_capacities）：超出时按访问频率淘汰最冷的记录，
+    频率定期减半（老化），使过去的热门记录逐渐失去优势；标记为pinned的记录不会被淘汰。
+    """
+
+    # 淘汰时一次删到容量的90%，避免每次写入都扫描整张表
+    EVICT_RATIO = 0.9
+    # 每张表被访问"容量×此值"次后，所有访问频率减半
+    AGING_FACTOR = 10
+    # 检查文件是否被手动修改的最短间隔（秒）
+    RELOAD_CHECK_INTERVAL = 1.0
     
     def __init__(self, db_path: str):
         """初始化JSON数据库
@@ -14,10 +32,129 @@ class JsonDatabase:
             db_path: JSON数据库文件路径
         """
         self.db_path = db_path
-        self.lock = threading.RLock()  # 使用可重入锁确保线程安全
-        self.data = self._load_data()
+        self.lock = threading.RLock()  # 写入方之间互斥，读取不加锁
+        self.data: Dict[str, Dict[str, Any]] = self._load_data()
         # 记录文件的最后修改时间
         self._last_modified_time = self._get_file_mtime()
+        self._next_reload_check = 0.0
+        # 数据变更监听器，用于维护各种索引
+        self._listeners: list[Callable[[Optional[str], Optional[str], Optional[Dict[str, Any]]], None]] = []
+        # 各表的容量上限（只记录有上限的表）和访问频率 {表名: {键名: 次数}}
+        self.capacities: Dict[str, int] = {}
+        self._frequency: Dict[str, Dict[str, int]] = {}
+        self._accesses: Dict[str, int] = {}
+        self.evictions: Dict[str, int] = {}
+    
+    def configure_from(self, configs: Dict[str, Any]) -> None:
+        """从插件配置的configs字典更新各表容量（db_table_capacity，{表名: 记录数}，0表示不限）"""
+        self.set_capacities(configs.get("db_table_capacity", {}))
+    
+    def set_capacities(self, capacities: Dict[str, int]) -> None:
+        """设置各表的容量上限，已超出的表立即淘汰
+        
+        Args:
+            capacities: {表名: 最多记录数}，0表示不限
+        """
+        with self.lock:
+            self.capacities = {table: int(capacity) for table, capacity in capacities.items() if int(capacity) > 0}
+            for table in list(self._frequency):
+                if table not in self.capacities:
+                    del self._frequency[table]
+            evicted = False
+            for table_name in self.capacities:
+                table = dict(self.data.get(table_name, {}))
+                victims = self._evict(table_name, table)
+                if victims:
+                    self._publish(table_name, table)
+                    self._notify_removed(table_name, victims)
+                    evicted = True
+            if evicted:
+                self._save_data()
+    
+    def _touch(self, table_name: str, key: str) -> None:
+        """记录一次访问（不加锁，并发时计数可能略少，频率只用于淘汰排序）"""
+        frequency = self._frequency.setdefault(table_name, {})
+        frequency[key] = frequency.get(key, 0) + 1
+        accesses = self._accesses.get(table_name, 0) + 1
+        if accesses >= self.capacities.get(table_name, 0) * self.AGING_FACTOR:
+            # 老化：所有频率减半，只访问过一次的记录回到0
+            for k, count in list(frequency.items()):
+                if count > 1:
+                    frequency[k] = count >> 1
+                else:
+                    frequency.pop(k, None)
+            accesses = 0
+        self._accesses[table_name] = accesses
+    
+    def _evict(self, table_name: str, table: Dict[str, Any], protect: Iterable[str] = ()) -> list[str]:
+        """表超出容量时淘汰访问频率最低的记录（频率相同时先淘汰较早保存的）
+        
+        调用方持有锁，table为尚未发布的表副本，由调用方发布、通知监听器并保存。
+        
+        Args:
+            table_name: 表名
+            table: 表副本（就地删除被淘汰的记录）
+            protect: 不淘汰的键（如刚写入的记录）
+            
+        Returns:
+            被淘汰的键
+        """
+        capacity = self.capacities.get(table_name)
+        if not capacity or len(table) <= capacity:
+            return []
+        protect = set(protect)
+        frequency = self._frequency.get(table_name, {})
+        candidates = [(frequency.get(key, 0), record.get("time", 0) if isinstance(record, dict) else 0, key)
+                      for key, record in table.items()
+                      if key not in protect and not (isinstance(record, dict) and record.get("pinned"))]
+        victims = [key for _, _, key in heapq.nsmallest(len(table) - int(capacity * self.EVICT_RATIO), candidates)]
+        for key in victims:
+            del table[key]
+            frequency.pop(key, None)
+        self.evictions[table_name] = self.evictions.get(table_name, 0) + len(victims)
+        return victims
+    
+    def capacity_summary(self) -> str:
+        """有容量上限的表的记录数与淘汰数，用于/status"""
+        data = self.data
+        return "，".join(f"{table} {len(data.get(table, {}))}/{capacity}（淘汰{self.evictions.get(table, 0)}）"
+                        for table, capacity in self.capacities.items())
+    
+    def add_listener(self, listener: Callable[[Optional[str], Optional[str], Optional[Dict[str, Any]]], None]) -> None:
+        """注册数据变更监听器
+        
+        监听器参数为 (表名, 键名, 新值)：
+            - 设置记录时新值为记录内容，删除记录时新值为None
+            - 整张表被清空或删除时键名为None
+            - 整个数据库被重新加载时表名和键名均为None
+        
+        监听器在新快照发布之后调用，此时读取数据库已能看到这次修改。
+        
+        Args:
+            listener: 监听函数
+        """
+        self._listeners.append(listener)
+    
+    def _notify(self, table_name: Optional[str], key: Optional[str], value: Optional[Dict[str, Any]]) -> None:
+        """通知所有监听器，单个监听器出错不影响其他监听器"""
+        for listener in self._listeners:
+            try:
+                listener(table_name, key, value)
+            except Exception as e:
+                print(f"数据库监听器执行失败: {e}")
+    
+    def _notify_removed(self, table_name: str, keys: Iterable[str]) -> None:
+        for key in keys:
+            self._notify(table_name, key, None)
+    
+    def _publish(self, table_name: str, table: Optional[Dict[str, Any]]) -> None:
+        """用修改后的表副本生成新快照并替换引用（调用方持有锁），table为None时删除该表"""
+        data = dict(self.data)
+        if table is None:
+            data.pop(table_name, None)
+        else:
+            data[table_name] = table
+        self.data = data
     
     def _load_data(self) -> Dict[str, Dict[str, Any]]:
         """从文件加载数据
@@ -41,34 +178,51 @@ class JsonDatabase:
         """获取文件的最后修改时间
         
         Returns:
-            文件的最后修改时间戳
+            文件的最后修改时间戳，文件不存在时为0
         """
-        if os.path.exists(self.db_path):
-            return os.path.getmtime(self.db_path)
-        return 0
+        try:
+            return os.stat(self.db_path).st_mtime
+        except OSError:
+            return 0
     
     def _check_and_reload_data(self):
         """检查文件是否被修改，如果被修改则重新加载数据
+        
+        每RELOAD_CHECK_INTERVAL秒最多检查一次，避免每次读取都访问文件系统
         """
+        now = time.monotonic()
+        if now < self._next_reload_check:
+            return
+        self._next_reload_check = now + self.RELOAD_CHECK_INTERVAL
         current_mtime = self._get_file_mtime()
         if current_mtime > self._last_modified_time:
-            # 文件已被修改，重新加载数据
-            with self.lock:
+            # 写入方正在保存（刚替换文件、尚未更新修改时间）时不等待锁，下次检查时再处理
+            if not self.lock.acquire(blocking=False):
+                return
+            try:
                 # 再次检查，避免在获取锁的过程中发生变化
                 if current_mtime > self._last_modified_time:
+                    # 文件已被修改，重新加载数据
                     print(f"检测到JSON数据库文件已被修改，重新加载数据")
                     self.data = self._load_data()
                     self._last_modified_time = current_mtime
+                    self._notify(None, None, None)
+            finally:
+                self.lock.release()
     
     def _save_data(self) -> bool:
-        """保存数据到文件
+        """保存当前快照到文件（调用方持有锁）
+        
+        先写入临时文件再替换，其他进程重新加载时不会读到写了一半的文件
         
         Returns:
             是否保存成功
         """
         try:
-            with open(self.db_path, 'w', encoding='utf-8') as f:
+            temp_path = f"{self.db_path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
                 json.dump(self.data, f, ensure_ascii=False, indent=2)
+            os.replace(temp_path, self.db_path)
             # 更新最后修改时间
             self._last_modified_time = self._get_file_mtime()
             return True
@@ -77,7 +231,24 @@ class JsonDatabase:
             return False
     
     def get(self, table_name: str, key: str) -> Optional[Dict[str, Any]]:
-        """从指定表获取数据
+        """从指定表获取数据（不加锁，读取当前快照），命中时计入访问频率
+        
+        只用于用户查询的缓存读取，索引重建、预取、保存前检查等内部读取请用peek，以免干扰容量淘汰
+        
+        Args:
+            table_name: 表名
+            key: 键名（将自动转换为小写进行不区分大小写查询）
+            
+        Returns:
+            查询结果，如果不存在返回None
+        """
+        value = self.peek(table_name, key)
+        if value is not None and table_name in self.capacities:
+            self._touch(table_name, key.lower())
+        return value
+    
+    def peek(self, table_name: str, key: str) -> Optional[Dict[str, Any]]:
+        """从指定表获取数据（不加锁，读取当前快照），不计入访问频率
         
         Args:
             table_name: 表名
@@ -89,13 +260,12 @@ class JsonDatabase:
         # 检查文件是否被手动修改，如果被修改则重新加载数据
         self._check_and_reload_data()
         
-        with self.lock:
-            if table_name not in self.data:
-                return None
-            
-            # 转换为小写进行不区分大小写查询
-            lower_key = key.lower()
-            return self.data[table_name].get(lower_key)
+        table = self.data.get(table_name)
+        if table is None:
+            return None
+        
+        # 转换为小写进行不区分大小写查询
+        return table.get(key.lower())
     
     def set(self, table_name: str, key: str, value: Dict[str, Any]) -> bool:
         """设置数据到指定表
@@ -108,16 +278,45 @@ class JsonDatabase:
         Returns:
             是否设置成功
         """
-        with self.lock:
-            # 确保表存在
-            if table_name not in self.data:
-                self.data[table_name] = {}
-            
-            # 转换为小写存储
-            lower_key = key.lower()
-            self.data[table_name][lower_key] = value
+        return self.set_many(table_name, [(key, value)])
+    
+    def set_many(self, table_name: str, items: Iterable[tuple[str, Dict[str, Any]]], save: bool = True) -> bool:
+        """批量设置数据到指定表，只复制一次表、只写一次文件
+        
+        Args:
+            table_name: 表名
+            items: (键名, 值) 的可迭代对象，键名将自动转换为小写存储
+            save: 是否立即保存到文件（为False时需稍后调用flush）
             
-            # 保存到文件
+        Returns:
+            是否设置成功
+        """
+        with self.lock:
+            table = dict(self.data.get(table_name, {}))
+            written = []
+            for key, value in items:
+                table[key.lower()] = value
+                written.append((key.lower(), value))
+            victims = []
+            if table_name in self.capacities:
+                # 写入前通常刚查询过一次未命中，新记录从1次开始计数
+                frequency = self._frequency.setdefault(table_name, {})
+                for key, _ in written:
+                    frequency.setdefault(key, 1)
+                victims = self._evict(table_name, table, [key for key, _ in written])
+            self._publish(table_name, table)
+            for key, value in written:
+                self._notify(table_name, key, value)
+            self._notify_removed(table_name, victims)
+            return self._save_data() if save else True
+    
+    def flush(self) -> bool:
+        """将内存中的数据保存到文件
+        
+        Returns:
+            是否保存成功
+        """
+        with self.lock:
             return self._save_data()
     
     def delete(self, table_name: str, key: str) -> bool:
@@ -131,15 +330,16 @@ class JsonDatabase:
             是否删除成功
         """
         with self.lock:
-            if table_name not in self.data:
-                return False
-            
             # 转换为小写进行不区分大小写删除
             lower_key = key.lower()
-            if lower_key in self.data[table_name]:
-                del self.data[table_name][lower_key]
-                return self._save_data()
-            return False
+            if lower_key not in self.data.get(table_name, {}):
+                return False
+            table = dict(self.data[table_name])
+            del table[lower_key]
+            self._publish(table_name, table)
+            self._frequency.get(table_name, {}).pop(lower_key, None)
+            self._notify(table_name, lower_key, None)
+            return self._save_data()
     
     def list_keys(self, table_name: str) -> list:
         """列出指定表的所有键
@@ -150,10 +350,15 @@ class JsonDatabase:
         Returns:
             键名列表
         """
-        with self.lock:
-            if table_name not in self.data:
-                return []
-            return list(self.data[table_name].keys())
+        return list(self.data.get(table_name, {}))
+    
+    def list_tables(self) -> list:
+        """列出所有表名
+        
+        Returns:
+            表名列表
+        """
+        return list(self.data)
     
     def clear_table(self, table_name: str) -> bool:
         """清空指定表中的所有数据
@@ -168,7 +373,9 @@ class JsonDatabase:
             if table_name not in self.data:
                 return False
             
-            self.data[table_name] = {}
+            self._publish(table_name, {})
+            self._frequency.pop(table_name, None)
+            self._notify(table_name, None, None)
             return self._save_data()
     
     def delete_table(self, table_name: str) -> bool:
@@ -182,7 +389,9 @@ class JsonDatabase:
         """
         with self.lock:
             if table_name in self.data:
-                del self.data[table_name]
+                self._publish(table_name, None)
+                self._frequency.pop(table_name, None)
+                self._notify(table_name, None, None)
                 return self._save_data()
             return False
 
@@ -209,8 +418,14 @@ def save_to_database(table_name: str, key: str, data: dict, debug: bool = False)
         save_data["data"] = data["data"].copy()
         save_data["data"].pop('url') if 'url' in save_data["data"] else None
         save_data["data"].pop('urls') if 'urls' in save_data["data"] else None
+        # 记录保存时间，用于合并数据库时判断新旧
+        save_data["time"] = int(time.time())
+        # 管理员编辑过的记录刷新后仍然固定，不参与容量淘汰
+        existing = db_instance.peek(table_name, key)
+        if isinstance(existing, dict) and existing.get("pinned"):
+            save_data["pinned"] = True
         if debug:
-            print(f"保存到JSON数据库: {table_name} - {key} - {save_data}")
+            note(f"保存到JSON数据库: {table_name} - {key} - {save_data}")
             
         # 保存到数据库
         return db_instance.set(table_name, key, save_data)
@@ -231,11 +446,14 @@ def get_from_database(table_name: str, key: str, debug: bool = False) -> Optiona
     """
     try:
         # 从数据库获取数据
-        result = db_instance.get(table_name, key)
+        with timed("cache_lookup", table=table_name) as s:
+            result = db_instance.get(table_name, key)
+            s.set(key=key, hit=bool(result))
+        record_cache_lookup(table_name, bool(result))
         if result: result=result.copy()
         
         if debug:
-            print(f"从JSON数据库读取: {table_name} - {key} - {result}")
+            note(f"从JSON数据库读取: {table_name} - {key} - {result}")
         
         # 如果获取到数据，添加accept方法（空操作）
         if result and isinstance(result, dict):
@@ -0,0 +1,288 @@
+import argparse
+import asyncio
+import contextvars
+import importlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+# 默认消息比例
+DEFAULT_MIX = {"查": 40, "搜": 15, "ID": 15, "查DRAM": 10, "chatter": 20}
+
+CHATTER = ["早", "有人吗", "这颗料是什么", "喵", "哈哈哈", "+1", "收到", "谢谢", "晚安", "这个盘是什么颗粒"]
+
+_event_id: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("loadtest_event_id", default=None)
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def load_plugin():
+    """以NoneBot插件的方式重新加载本包（None驱动 + OneBot V11适配器）
+
+    以 python -m 运行时包已经以非NoneBot模式导入过，需要先从sys.modules中移除再由NoneBot加载。
+
+    Returns:
+        (插件模块, 驱动, 适配器类)
+    """
+    import nonebot
+    from nonebot.adapters.onebot.v11 import Adapter
+
+    nonebot.init(driver="~none")
+    driver = nonebot.get_driver()
+    driver.register_adapter(Adapter)
+    package = __package__
+    for name in list(sys.modules):
+        if name == package or name.startswith(package + "."):
+            del sys.modules[name]
+    plugin = nonebot.load_plugin(package)
+    if plugin is None:
+        raise RuntimeError("加载插件失败")
+    return plugin.module, driver, Adapter
+
+
+@contextmanager
+def isolated_state(package: str):
+    """压测期间把访问日志和HTTP缓存重定向到临时目录，避免模拟消息和模拟响应写入插件的data目录
+
+    Args:
+        package: 插件包名
+    """
+    access_log = importlib.import_module(f"{package}.FDAccessLog").access_log
+    http_cache = importlib.import_module(f"{package}.FDHttpCache").http_cache
+    temp_dir = tempfile.mkdtemp(prefix="flashdetail-load-")
+    saved = (access_log.log_path, http_cache.directory, http_cache.entries, http_cache.total_bytes, http_cache._loaded)
+    access_log.flush()
+    access_log.log_path = os.path.join(temp_dir, "access_log.txt")
+    with http_cache.lock:
+        http_cache.directory = os.path.join(temp_dir, "http_cache")
+        http_cache.entries = type(http_cache.entries)()
+        http_cache.total_bytes = 0
+        http_cache._loaded = False
+    try:
+        yield temp_dir
+    finally:
+        with access_log.lock:
+            access_log.buffer.clear()
+            access_log.log_path = saved[0]
+        with http_cache.lock:
+            http_cache.directory, http_cache.entries, http_cache.total_bytes, http_cache._loaded = saved[1:]
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+class MessageCorpus:
+    """从缓存数据库中生成各类查询消息"""
+
+    def __init__(self, db, mix: dict[str, int], refresh_ratio: float = 0.0, typo_ratio: float = 0.1):
+        self.mix = mix
+        self.refresh_ratio = refresh_ratio
+        self.typo_ratio = typo_ratio
+        self.parts = db.list_keys('flash_detail') or ["k9ckgy8j5b"]
+        self.drams = db.list_keys('dram_detail') or ["mt41k512m16ha-125:a"]
+        self.ids = [flash_id for key in self.parts[:500]
+                    for flash_id in (db.peek('flash_detail', key) or {}).get("data", {}).get("flashId", [])] or ["983c98b37672"]
+
+    def _typo(self, text: str) -> str:
+        if len(text) > 4 and random.random() < self.typo_ratio:
+            i = random.randrange(len(text))
+            return text[:i] + random.choice("0123456789abcdefghijklmnopqrstuvwxyz") + text[i + 1:]
+        return text
+
+    def next(self) -> tuple[str, str]:
+        """生成一条消息
+
+        Returns:
+            (类别, 消息文本)
+        """
+        kind = random.choices(list(self.mix), weights=list(self.mix.values()))[0]
+        if kind == "查":
+            text = f"查 {self._typo(random.choice(self.parts))}"
+        elif kind == "搜":
+            part = random.choice(self.parts)
+            text = f"搜 {part[:random.randint(3, max(3, len(part) - 2))]}"
+        elif kind == "ID":
+            text = f"ID {random.choice(self.ids)}"
+        elif kind == "查DRAM":
+            text = f"查DRAM {random.choice(self.drams)}"
+        else:
+            return kind, random.choice(CHATTER)
+        if random.random() < self.refresh_ratio:
+            text += " --refresh --nosave"
+        return kind, text
+
+
+class LoadTest:
+    """向插件的消息处理器注入模拟的OneBot V11群消息并统计回复延迟"""
+
+    def __init__(self, module, driver, adapter_class, groups: int, users: int):
+        from nonebot.adapters.onebot.v11 import Bot, GroupMessageEvent, Message
+
+        self.module = module
+        self.groups = [100000 + i for i in range(groups)]
+        self.users = [200000 + i for i in range(users)]
+        self.replies: dict[int, float] = {}
+        self.sent_count = 0
+        self.Message = Message
+        self.GroupMessageEvent = GroupMessageEvent
+        test = self
+
+        class LoadTestBot(Bot):
+            async def call_api(self, api: str, **data):
+                event_id = _event_id.get()
+                if api.startswith("send") and event_id is not None:
+                    test.sent_count += 1
+                    test.replies.setdefault(event_id, time.perf_counter())
+                return {"message_id": 1}
+
+        self.bot = LoadTestBot(adapter_class(driver), "10000")
+
+    def make_event(self, event_id: int, text: str):
+        group_id = random.choice(self.groups)
+        user_id = random.choice(self.users)
+        return self.GroupMessageEvent(
+            time=int(time.time()), self_id=10000, post_type="message", sub_type="normal", user_id=user_id,
+            message_type="group", message_id=event_id, message=self.Message(text),
+            original_message=self.Message(text), raw_message=text, font=0,
+            sender={"user_id": user_id, "nickname": f"user{user_id}"}, group_id=group_id, to_me=False)
+
+    async def run(self, corpus: MessageCorpus, rate: float, duration: float) -> dict:
+        """以泊松到达的方式发送消息
+
+        Args:
+            corpus: 消息来源
+            rate: 平均每秒消息数
+            duration: 发送时长（秒）
+
+        Returns:
+            统计结果
+        """
+        from nonebot.message import handle_event
+
+        started: dict[int, tuple[str, float]] = {}
+        handled: dict[int, float] = {}
+        lags: list[float] = []
+        stop = asyncio.Event()
+
+        async def monitor_lag(interval: float = 0.05) -> None:
+            while not stop.is_set():
+                expected = time.perf_counter() + interval
+                await asyncio.sleep(interval)
+                lags.append(max(0.0, time.perf_counter() - expected))
+
+        async def deliver(event_id: int, kind: str, text: str) -> None:
+            _event_id.set(event_id)
+            started[event_id] = (kind, time.perf_counter())
+            try:
+                await handle_event(self.bot, self.make_event(event_id, text))
+            finally:
+                handled[event_id] = time.perf_counter()
+
+        monitor = asyncio.create_task(monitor_lag())
+        tasks = []
+        begin = time.perf_counter()
+        event_id = 0
+        while time.perf_counter() - begin < duration:
+            event_id += 1
+            kind, text = corpus.next()
+            tasks.append(asyncio.create_task(deliver(event_id, kind, text)))
+            await asyncio.sleep(random.expovariate(rate))
+        await asyncio.gather(*tasks, return_exceptions=True)
+        elapsed = time.perf_counter() - begin
+        stop.set()
+        await monitor
+
+        by_kind: dict[str, list[float]] = {}
+        for eid, (kind, start) in started.items():
+            if eid in self.replies:
+                by_kind.setdefault(kind, []).append(self.replies[eid] - start)
+        handle_times = [handled[eid] - start for eid, (_, start) in started.items() if eid in handled]
+        return {
+            "messages": len(started),
+            "replies": len(self.replies),
+            "elapsed": elapsed,
+            "throughput": len(started) / elapsed,
+            "reply_latency": {kind: {"n": len(values), "p50": percentile(values, 0.5),
+                                     "p95": percentile(values, 0.95), "p99": percentile(values, 0.99)}
+                              for kind, values in sorted(by_kind.items())},
+            "handle_p99": percentile(handle_times, 0.99),
+            "loop_lag": {"p50": percentile(lags, 0.5), "p99": percentile(lags, 0.99), "max": max(lags, default=0.0)},
+        }
+
+
+def format_report(report: dict) -> str:
+    lines = [f"消息{report['messages']}条，回复{report['replies']}条，用时{report['elapsed']:.1f}秒，"
+             f"吞吐{report['throughput']:.1f}条/秒",
+             "回复延迟（毫秒）："]
+    for kind, values in report["reply_latency"].items():
+        lines.append(f"  {kind:<8} n={values['n']:<5} p50={values['p50'] * 1000:.1f} "
+                     f"p95={values['p95'] * 1000:.1f} p99={values['p99'] * 1000:.1f}")
+    lines.append(f"处理完成p99: {report['handle_p99'] * 1000:.1f}ms")
+    lag = report["loop_lag"]
+    lines.append(f"事件循环延迟：p50={lag['p50'] * 1000:.1f}ms p99={lag['p99'] * 1000:.1f}ms max={lag['max'] * 1000:.1f}ms")
+    if report.get("upstream"):
+        lines.append("上游请求：")
+        for label, count in report["upstream"].items():
+            lines.append(f"  {label}: {int(count)}")
+    if report.get("mock"):
+        lines.append("模拟镜像：")
+        for url, stats in report["mock"].items():
+            lines.append(f"  {url}: {stats}")
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="FlashDetail端到端压力测试（驱动真实的NoneBot消息处理器）")
+    parser.add_argument("--groups", type=int, default=20, help="模拟群数")
+    parser.add_argument("--users", type=int, default=200, help="模拟用户数")
+    parser.add_argument("--rate", type=float, default=20, help="平均每秒消息数")
+    parser.add_argument("--duration", type=float, default=30, help="发送时长（秒）")
+    parser.add_argument("--mix", default=",".join(f"{k}={v}" for k, v in DEFAULT_MIX.items()),
+                        help="消息比例，如 查=40,搜=15,ID=15,查DRAM=10,chatter=20")
+    parser.add_argument("--refresh-ratio", type=float, default=0.1, help="强制刷新（访问上游）的查询比例")
+    parser.add_argument("--live", action="store_true", help="使用配置中的真实上游（默认启动本地模拟镜像）")
+    parser.add_argument("--mirror", action="append", default=[], help="模拟镜像设置，见FDMockServer")
+    parser.add_argument("--json", action="store_true", help="以JSON输出结果")
+    args = parser.parse_args(argv)
+
+    mix = {k: int(v) for k, v in (item.split("=") for item in args.mix.split(","))}
+    module, driver, adapter_class = load_plugin()
+    package = module.__name__
+    FDMetrics = importlib.import_module(f"{package}.FDMetrics")
+    FDMockServer = importlib.import_module(f"{package}.FDMockServer")
+    db = importlib.import_module(f"{package}.FDJsonDatabase").db_instance
+
+    corpus = MessageCorpus(db, mix, args.refresh_ratio)
+    test = LoadTest(module, driver, adapter_class, args.groups, args.users)
+    mock = None
+    if not args.live:
+        mock = FDMockServer.MockUpstream([FDMockServer.MirrorProfile.parse(spec) for spec in args.mirror or [""]])
+        mock.start()
+    try:
+        with isolated_state(package):
+            if mock:
+                with mock.configure():
+                    report = asyncio.run(test.run(corpus, args.rate, args.duration))
+            else:
+                report = asyncio.run(test.run(corpus, args.rate, args.duration))
+    finally:
+        if mock:
+            mock.stop()
+    report["upstream"] = {"/".join(str(v) for _, v in key): count
+                          for key, count in sorted(FDMetrics.metrics.upstream_requests.values().items())}
+    if mock:
+        report["mock"] = mock.stats()
+    print(json.dumps(report, ensure_ascii=False, indent=2) if args.json else format_report(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+import bisect
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from .FDTrace import span, add_span
+
+# 直方图的桶上限（秒），覆盖本地解码的微秒级到上游请求的十几秒
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15, 30)
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    escaped = [f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for k, v in items]
+    return "{" + ",".join(escaped) + "}"
+
+
+class Histogram:
+    """带标签的耗时直方图，同时保留最近的样本用于计算分位数"""
+
+    def __init__(self, name: str, help_text: str, buckets: tuple = DEFAULT_BUCKETS, window: int = 2048):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.window = window
+        self.lock = threading.Lock()
+        self._series: dict[tuple, dict] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with self.lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0,
+                                              "recent": deque(maxlen=self.window)}
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series["counts"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+            series["recent"].append(value)
+
+    def percentiles(self, quantiles: tuple = (0.5, 0.95, 0.99)) -> dict[tuple, dict]:
+        """按最近的样本计算各标签组合的分位数
+
+        Returns:
+            {标签元组: {"count": 总次数, 分位数: 秒, ...}}
+        """
+        with self.lock:
+            snapshot = {key: (series["count"], sorted(series["recent"])) for key, series in self._series.items()}
+        result = {}
+        for key, (count, samples) in snapshot.items():
+            if not samples:
+                continue
+            values = {"count": count}
+            for q in quantiles:
+                values[q] = samples[min(len(samples) - 1, int(q * len(samples)))]
+            result[key] = values
+        return result
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series["counts"]):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_format_labels(key, (('le', bound),))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, (('le', '+Inf'),))} {series['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series['sum']}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series['count']}")
+        return lines
+
+
+class Counter:
+    """带标签的计数器"""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self.lock = threading.Lock()
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        with self.lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def values(self) -> dict[tuple, float]:
+        with self.lock:
+            return dict(self._values)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class MetricsRegistry:
+    """插件内置指标：各阶段耗时直方图与缓存命中计数"""
+
+    def __init__(self):
+        self.stage_seconds = Histogram("flashdetail_stage_seconds", "各处理阶段耗时（秒）")
+        self.upstream_seconds = Histogram("flashdetail_upstream_seconds", "上游请求耗时（秒），按镜像和接口区分")
+        self.upstream_requests = Counter("flashdetail_upstream_requests_total", "上游请求次数，按镜像、接口和结果区分")
+        self.cache_lookups = Counter("flashdetail_cache_lookups_total", "缓存查询次数，按表和是否命中区分")
+        self.gauges = {}  # {指标名: (说明, 取值函数)}
+
+    def register_gauge(self, name: str, help_text: str, getter) -> None:
+        """注册一个在导出时即时取值的指标（如队列深度）"""
+        self.gauges[name] = (help_text, getter)
+
+    def render(self) -> str:
+        """渲染为Prometheus文本格式"""
+        lines = []
+        for metric in (self.stage_seconds, self.upstream_seconds, self.upstream_requests, self.cache_lookups):
+            lines.extend(metric.render())
+        for name, (help_text, getter) in self.gauges.items():
+            try:
+                value = getter()
+            except Exception:
+                continue
+            lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"])
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> list[str]:
+        """各阶段的p50/p95/p99摘要（毫秒），用于/status"""
+        lines = []
+        for histogram in (self.stage_seconds, self.upstream_seconds):
+            for key, values in sorted(histogram.percentiles().items()):
+                labels = dict(key)
+                stage = [labels.pop("stage")] if "stage" in labels else []
+                name = "/".join(str(v) for v in stage + list(labels.values()))
+                lines.append(f"{name}: p50={values[0.5] * 1000:.1f}ms p95={values[0.95] * 1000:.1f}ms "
+                             f"p99={values[0.99] * 1000:.1f}ms (n={values['count']})")
+        hits = {}
+        for key, value in self.cache_lookups.values().items():
+            labels = dict(key)
+            hits.setdefault(labels["table"], {"hit": 0, "miss": 0})[labels["result"]] += value
+        for table, counts in sorted(hits.items()):
+            total = counts["hit"] + counts["miss"]
+            lines.append(f"缓存 {table}: 命中率{counts['hit'] / total * 100:.1f}% ({int(counts['hit'])}/{int(total)})")
+        return lines
+
+
+metrics = MetricsRegistry()
+
+
+@contextmanager
+def timed(stage: str, **labels):
+    """记录代码块耗时到阶段直方图，开启追踪时同时记录为span"""
+    start = time.perf_counter()
+    try:
+        with span(stage, **labels) as s:
+            yield s
+    finally:
+        metrics.stage_seconds.observe(time.perf_counter() - start, stage=stage, **labels)
+
+
+def observe_stage(stage: str, seconds: float, **labels) -> None:
+    """直接记录一个阶段的耗时（用于不便用with包裹的长代码块）"""
+    metrics.stage_seconds.observe(seconds, stage=stage, **labels)
+    add_span(stage, seconds, **labels)
+
+
+def record_cache_lookup(table_name: str, hit: bool) -> None:
+    metrics.cache_lookups.inc(table=table_name, result="hit" if hit else "miss")
+
+
+def record_upstream(mirror: str, endpoint: str, seconds: float, ok: bool) -> None:
+    metrics.upstream_seconds.observe(seconds, mirror=mirror, endpoint=endpoint)
+    metrics.upstream_requests.inc(mirror=mirror, endpoint=endpoint, result="ok" if ok else "error")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server: Optional[ThreadingHTTPServer] = None
+
+
+def start_exporter(port: int, host: str = "127.0.0.1") -> bool:
+    """在本地端口启动Prometheus文本格式的指标接口（/metrics），重复调用无副作用
+
+    Returns:
+        是否启动成功
+    """
+    global _server
+    if _server is not None:
+        return True
+    try:
+        _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        print(f"启动指标接口失败: {e}")
+        return False
+    threading.Thread(target=_server.serve_forever, name="flashdetail-metrics", daemon=True).start()
+    print(f"指标接口已启动: http://{host}:{port}/metrics")
+    return True
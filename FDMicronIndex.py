@@ -0,0 +1,176 @@
+import argparse
+import bisect
+import csv
+import json
+import os
+import threading
+from typing import Iterator, Optional
+
+from .FDJsonDatabase import db_instance
+
+INDEX_PATH = os.path.join(os.path.dirname(__file__), 'data', 'micron_fbga_index.tsv')
+
+
+class FbgaIndex:
+    """镁光FBGA代码→完整料号的本地索引
+
+    以两个按代码排序的并行数组存储，使用二分查找精确匹配。
+    数据来源为导入的批量数据集（INDEX_PATH）和micron_pn_decode缓存表。
+    """
+
+    def __init__(self, index_path: str = INDEX_PATH):
+        self.index_path = index_path
+        self.lock = threading.Lock()
+        self.codes: list[str] = []
+        self.part_numbers: list[str] = []
+        self._loaded = False
+
+    @staticmethod
+    def _normalize(code: str) -> str:
+        return code.strip().upper()
+
+    def _iter_dataset(self) -> Iterator[tuple[str, str]]:
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t")
+                    if len(parts) == 2 and parts[0] and parts[1]:
+                        yield parts[0], parts[1]
+        except IOError as e:
+            print(f"加载FBGA索引失败: {e}")
+
+    def _iter_cache(self) -> Iterator[tuple[str, str]]:
+        for key in db_instance.list_keys('micron_pn_decode'):
+            record = db_instance.peek('micron_pn_decode', key) or {}
+            part_number = record.get("data", {}).get("part-number")
+            if part_number:
+                yield key, part_number
+
+    def load(self) -> None:
+        """从数据集文件和缓存表重建索引（缓存表中的数据优先）"""
+        mapping = {}
+        for code, part_number in self._iter_dataset():
+            mapping[self._normalize(code)] = part_number
+        for code, part_number in self._iter_cache():
+            mapping[self._normalize(code)] = part_number
+        with self.lock:
+            self.codes = sorted(mapping)
+            self.part_numbers = [mapping[code] for code in self.codes]
+            self._loaded = True
+
+    def lookup(self, code: str) -> Optional[str]:
+        """精确查找FBGA代码对应的完整料号
+
+        Returns:
+            完整料号，不在索引中返回None
+        """
+        if not self._loaded:
+            self.load()
+        code = self._normalize(code)
+        with self.lock:
+            i = bisect.bisect_left(self.codes, code)
+            if i < len(self.codes) and self.codes[i] == code:
+                return self.part_numbers[i]
+        return None
+
+    def add(self, code: str, part_number: str) -> None:
+        """向索引中加入一条记录（不写入数据集文件）"""
+        if not self._loaded:
+            self.load()
+        code = self._normalize(code)
+        with self.lock:
+            i = bisect.bisect_left(self.codes, code)
+            if i < len(self.codes) and self.codes[i] == code:
+                self.part_numbers[i] = part_number
+            else:
+                self.codes.insert(i, code)
+                self.part_numbers.insert(i, part_number)
+
+    def __len__(self) -> int:
+        if not self._loaded:
+            self.load()
+        return len(self.codes)
+
+    def import_dataset(self, path: str) -> int:
+        """导入批量数据集并合并到数据集文件
+
+        支持的格式：
+            .csv   - 两列（FBGA代码,完整料号），可带表头
+            .json  - {"代码": "料号", ...} 或 [{"fbga": ..., "part-number": ...}, ...]
+            .jsonl - 每行 {"fbga": ..., "part-number": ...}
+            其他   - 制表符分隔的两列
+
+        Returns:
+            导入的记录数
+        """
+        entries = {code: part_number for code, part_number in self._iter_dataset()}
+        imported = 0
+        for code, part_number in _read_dataset(path):
+            code = self._normalize(code)
+            if len(code) == 5 and part_number:
+                entries[code] = part_number.strip()
+                imported += 1
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for code in sorted(entries):
+                f.write(f"{code}\t{entries[code]}\n")
+        os.replace(tmp_path, self.index_path)
+        self.load()
+        return imported
+
+
+def _read_dataset(path: str) -> Iterator[tuple[str, str]]:
+    def from_dict(item: dict) -> tuple[str, str]:
+        code = item.get("fbga") or item.get("fbga-code") or item.get("code") or ""
+        return code, item.get("part-number") or item.get("partNumber") or ""
+
+    lower_path = path.lower()
+    with open(path, "r", encoding="utf-8") as f:
+        if lower_path.endswith(".csv"):
+            for row in csv.reader(f):
+                if len(row) >= 2:
+                    yield row[0], row[1]
+        elif lower_path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield from_dict(json.loads(line))
+        elif lower_path.endswith(".json"):
+            data = json.load(f)
+            if isinstance(data, dict):
+                yield from data.items()
+            else:
+                for item in data:
+                    yield from_dict(item)
+        else:
+            for line in f:
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) >= 2:
+                    yield parts[0], parts[1]
+
+
+# 创建全局索引实例
+fbga_index = FbgaIndex()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="镁光FBGA代码本地索引工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    import_parser = subparsers.add_parser("import", help="导入批量数据集")
+    import_parser.add_argument("path", help="数据集文件（csv/json/jsonl/tsv）")
+    lookup_parser = subparsers.add_parser("lookup", help="查询FBGA代码")
+    lookup_parser.add_argument("codes", nargs="+", help="5位FBGA代码")
+    args = parser.parse_args(argv)
+
+    if args.command == "import":
+        imported = fbga_index.import_dataset(args.path)
+        print(f"已导入{imported}条记录，索引共{len(fbga_index)}条")
+    elif args.command == "lookup":
+        for code in args.codes:
+            print(f"{code.upper()}: {fbga_index.lookup(code) or '未收录'}")
+
+
+if __name__ == "__main__":
+    main()
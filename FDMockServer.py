@@ -0,0 +1,400 @@
+import argparse
+import html
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, parse_qsl, urlencode, urlsplit
+
+import requests
+
+from .FDJsonDatabase import JsonDatabase, db_instance
+
+FIXTURES_PATH = os.path.join(os.path.dirname(__file__), 'data', 'mock_fixtures.jsonl')
+
+# 模拟服务器上各上游的路径（镜像地址即 http://host:port）
+MICRON_PATH = "/micron"
+SPECTEK_PATH = "/spectek/mark_code.aspx"
+
+
+class LatencyModel:
+    """响应延迟分布（毫秒）
+
+    规格写法：
+        fixed:50              - 固定50ms
+        uniform:20:200        - 20~200ms均匀分布
+        lognormal:80:0.5      - 中位数80ms、sigma为0.5的对数正态分布
+        exp:100               - 均值100ms的指数分布
+    """
+
+    def __init__(self, kind: str = "fixed", *params: float):
+        if kind not in ("fixed", "uniform", "lognormal", "exp"):
+            raise ValueError(f"未知的延迟分布：{kind}")
+        self.kind = kind
+        self.params = params or (0,)
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyModel":
+        kind, *params = spec.split(":")
+        return cls(kind, *[float(p) for p in params])
+
+    def sample(self) -> float:
+        """抽取一次延迟（秒）"""
+        p = self.params
+        if self.kind == "uniform":
+            ms = random.uniform(p[0], p[1] if len(p) > 1 else p[0])
+        elif self.kind == "lognormal":
+            ms = random.lognormvariate(0, p[1] if len(p) > 1 else 0.5) * p[0]
+        elif self.kind == "exp":
+            ms = random.expovariate(1 / p[0]) if p[0] > 0 else 0
+        else:
+            ms = p[0]
+        return max(ms, 0) / 1000
+
+    def __str__(self) -> str:
+        return ":".join([self.kind] + [f"{p:g}" for p in self.params])
+
+
+class MirrorProfile:
+    """单个模拟镜像的故障注入设置
+
+    规格写法（逗号分隔，均可省略）：
+        latency=lognormal:80:0.5,error=0.05,timeout=0.01,status=503
+    """
+
+    def __init__(self, latency: Optional[LatencyModel] = None, error_rate: float = 0.0,
+                 timeout_rate: float = 0.0, error_status: int = 503, timeout_seconds: float = 30.0):
+        self.latency = latency or LatencyModel()
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.error_status = error_status
+        self.timeout_seconds = timeout_seconds
+
+    @classmethod
+    def parse(cls, spec: str) -> "MirrorProfile":
+        profile = cls()
+        for item in filter(None, (part.strip() for part in spec.split(","))):
+            name, _, value = item.partition("=")
+            if name == "latency":
+                profile.latency = LatencyModel.parse(value)
+            elif name == "error":
+                profile.error_rate = float(value)
+            elif name == "timeout":
+                profile.timeout_rate = float(value)
+            elif name == "status":
+                profile.error_status = int(value)
+            elif name == "hang":
+                profile.timeout_seconds = float(value)
+            else:
+                raise ValueError(f"未知的镜像设置：{name}")
+        return profile
+
+    def __str__(self) -> str:
+        return f"latency={self.latency},error={self.error_rate:g},timeout={self.timeout_rate:g}"
+
+
+def _fixture_key(method: str, path: str) -> str:
+    """录制回放用的请求键：方法 + 路径 + 排序后的查询参数"""
+    parts = urlsplit(path)
+    query = urlencode(sorted(parse_qsl(parts.query)))
+    return f"{method} {parts.path}{'?' + query if query else ''}"
+
+
+class FixtureStore:
+    """模拟上游的响应数据
+
+    优先回放录制的响应（FIXTURES_PATH），其次根据本地缓存数据库合成与真实接口格式一致的响应。
+    """
+
+    def __init__(self, db: JsonDatabase = db_instance, fixtures_path: str = FIXTURES_PATH):
+        self.db = db
+        self.fixtures_path = fixtures_path
+        self.lock = threading.Lock()
+        self.recorded: dict[str, tuple[int, str, str]] = {}
+        if os.path.exists(fixtures_path):
+            with open(fixtures_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        item = json.loads(line)
+                        self.recorded[_fixture_key(item["method"], item["path"])] = (
+                            item.get("status", 200), item.get("content_type", "application/json"), item["body"])
+
+    def record(self, method: str, path: str, status: int, content_type: str, body: str) -> None:
+        """保存一条录制的响应"""
+        with self.lock:
+            self.recorded[_fixture_key(method, path)] = (status, content_type, body)
+            os.makedirs(os.path.dirname(os.path.abspath(self.fixtures_path)), exist_ok=True)
+            with open(self.fixtures_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"method": method, "path": path, "status": status,
+                                    "content_type": content_type, "body": body}, ensure_ascii=False))
+                f.write("\n")
+
+    def respond(self, method: str, path: str, form: dict) -> Optional[tuple[int, str, str]]:
+        """生成响应
+
+        Returns:
+            (状态码, Content-Type, 响应体)，无法识别的路径返回None
+        """
+        recorded = self.recorded.get(_fixture_key(method, path))
+        if recorded:
+            return recorded
+        parts = urlsplit(path)
+        query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+        endpoint = parts.path.rstrip("/").rsplit("/", 1)[-1]
+
+        if parts.path == SPECTEK_PATH:
+            return 200, "text/html; charset=utf-8", self._spectek_page(method, form)
+        if "getpartbyfbgacode" in parts.path:
+            return 200, "application/json", json.dumps(self._micron(endpoint))
+        if endpoint == "decode":
+            return self._paragraph(self._record('flash_detail', query.get("pn", "")))
+        if endpoint == "decodeId":
+            return self._paragraph(self._record('flash_id_detail', query.get("id", "")))
+        if endpoint == "searchPn":
+            return self._paragraph(self._search(query.get("pn", ""), int(query.get("limit", 10))))
+        if endpoint == "DRAM":
+            return self._json(self._dram(query.get("param", "")))
+        return None
+
+    @staticmethod
+    def _json(payload: dict) -> tuple[int, str, str]:
+        return 200, "application/json", json.dumps(payload, ensure_ascii=False)
+
+    @staticmethod
+    def _paragraph(payload: dict) -> tuple[int, str, str]:
+        """闪存检测器接口返回包在<p>标签中的JSON"""
+        body = html.escape(json.dumps(payload, ensure_ascii=False), quote=False)
+        return 200, "text/html; charset=utf-8", f"<html><body><p>{body}</p></body></html>"
+
+    def _record(self, table_name: str, key: str) -> dict:
+        record = self.db.peek(table_name, key)
+        if not record or "data" not in record:
+            return {"result": False, "error": "未找到有效数据"}
+        return {"result": True, "data": record["data"]}
+
+    def _search(self, text: str, limit: int) -> dict:
+        text = text.lower()
+        results = []
+        for key in self.db.list_keys('flash_detail'):
+            if text and text in key:
+                vendor = (self.db.peek('flash_detail', key) or {}).get("data", {}).get("vendor", "未知")
+                results.append(f"{vendor} {key.upper()}")
+                if len(results) >= limit:
+                    break
+        return {"result": True, "data": results} if results else {"result": False, "error": "找不到相关料号"}
+
+    def _dram(self, part_number: str) -> dict:
+        record = self.db.peek('dram_detail', part_number)
+        if not record or "data" not in record:
+            return {"result": False}
+        detail = {k: v for k, v in record["data"].items() if k not in ("partNumber", "vendor")}
+        return {"result": True, "Vendor": record["data"].get("vendor", "未知"), "detail": detail}
+
+    def _micron(self, code: str) -> dict:
+        record = self.db.peek('micron_pn_decode', code)
+        data = (record or {}).get("data", {})
+        if not data.get("part-number"):
+            from .FDMicronIndex import fbga_index
+            part_number = fbga_index.lookup(code)
+            data = {"part-number": part_number} if part_number else {}
+        return {"details": [data] if data else []}
+
+    def _spectek_page(self, method: str, form: dict) -> str:
+        hidden = "".join(f'<input type="hidden" name="{name}" id="{name}" value="mock" />'
+                         for name in ("__VIEWSTATE", "__VIEWSTATEGENERATOR", "__EVENTVALIDATION"))
+        table = ""
+        if method == "POST":
+            code = form.get("ctl00$MainCPH$MarkCodeTextBox", "")
+            data = (self.db.peek('spectek_mark_decode', code) or {}).get("data", {})
+            if data.get("part-number"):
+                table = ('<table id="MainCPH_MarkCodeGridView"><tr><th>Mark Code</th><th>Part Number</th>'
+                         f'<th>Product Family</th></tr><tr><td>{html.escape(code.upper())}</td>'
+                         f'<td>{html.escape(data["part-number"])}</td>'
+                         f'<td>{html.escape(data.get("product-family", ""))}</td></tr></table>')
+        return f"<html><body><form>{hidden}{table}</form></body></html>"
+
+
+class MockMirror:
+    """一个模拟镜像：独立端口的HTTP服务器，按MirrorProfile注入延迟和故障"""
+
+    def __init__(self, store: FixtureStore, profile: MirrorProfile, host: str = "127.0.0.1", port: int = 0,
+                 record_from: Optional[str] = None):
+        self.store = store
+        self.profile = profile
+        self.record_from = record_from.rstrip("/") if record_from else None
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "errors": 0, "timeouts": 0, "misses": 0}
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _count(self, name: str) -> None:
+        with self.lock:
+            self.stats[name] += 1
+
+    def _handler_class(self):
+        mirror = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self._handle({})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length).decode("utf-8", "replace")
+                self._handle({k: v[0] for k, v in parse_qs(body).items()})
+
+            def _handle(self, form: dict):
+                mirror._count("requests")
+                profile = mirror.profile
+                roll = random.random()
+                if roll < profile.timeout_rate:
+                    # 模拟上游无响应：挂起超过客户端的超时时间
+                    mirror._count("timeouts")
+                    time.sleep(profile.timeout_seconds)
+                    self._send(504, "text/plain", "timeout")
+                    return
+                time.sleep(profile.latency.sample())
+                if roll < profile.timeout_rate + profile.error_rate:
+                    mirror._count("errors")
+                    self._send(profile.error_status, "text/plain", "injected error")
+                    return
+                response = mirror.store.respond(self.command, self.path, form)
+                if response is None and mirror.record_from and self.command == "GET":
+                    response = mirror._fetch_and_record(self.path)
+                if response is None:
+                    mirror._count("misses")
+                    self._send(404, "text/plain", "not found")
+                    return
+                self._send(*response)
+
+            def _send(self, status: int, content_type: str, body: str):
+                data = body.encode("utf-8")
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", content_type)
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def _fetch_and_record(self, path: str) -> Optional[tuple[int, str, str]]:
+        """本地没有数据时向真实上游请求并录制响应"""
+        try:
+            response = requests.get(f"{self.record_from}{path}", timeout=15, verify=False)
+        except requests.RequestException as e:
+            print(f"录制失败: {path} - {e}")
+            return None
+        content_type = response.headers.get("Content-Type", "application/json")
+        self.store.record("GET", path, response.status_code, content_type, response.text)
+        return response.status_code, content_type, response.text
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self.server.serve_forever, name=f"flashdetail-mock-{self.url}",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class MockUpstream:
+    """一组模拟镜像，可直接替换插件配置中的所有上游地址"""
+
+    def __init__(self, profiles: Optional[list[MirrorProfile]] = None, host: str = "127.0.0.1", port: int = 0,
+                 store: Optional[FixtureStore] = None, record_from: Optional[str] = None):
+        """初始化模拟上游
+
+        Args:
+            profiles: 每个镜像的故障注入设置，默认一个无延迟无故障的镜像
+            host: 监听地址
+            port: 第一个镜像的端口（其余依次加1），0表示随机端口
+            store: 响应数据，默认使用全局数据库
+            record_from: 本地没有数据时转发并录制的真实上游地址
+        """
+        self.store = store or FixtureStore()
+        self.mirrors = [MockMirror(self.store, profile, host, port + i if port else 0, record_from)
+                        for i, profile in enumerate(profiles or [MirrorProfile()])]
+
+    @property
+    def urls(self) -> list[str]:
+        return [mirror.url for mirror in self.mirrors]
+
+    def start(self) -> "MockUpstream":
+        for mirror in self.mirrors:
+            mirror.start()
+        return self
+
+    def stop(self) -> None:
+        for mirror in self.mirrors:
+            mirror.stop()
+
+    def stats(self) -> dict[str, dict]:
+        return {mirror.url: dict(mirror.stats) for mirror in self.mirrors}
+
+    @contextmanager
+    def configure(self, config=None):
+        """临时将插件配置的所有上游指向模拟镜像（不写入配置文件），退出时恢复"""
+        if config is None:
+            from .FDConfig import config_instance as config
+        saved = (list(config.flash_detect_api_urls), list(config.flash_extra_api_urls),
+                 config.configs.get("micron_api_url", ""), config.configs.get("spectek_url", ""))
+        config.flash_detect_api_urls[:] = self.urls
+        config.flash_extra_api_urls[:] = self.urls
+        config.configs["micron_api_url"] = self.urls[0] + MICRON_PATH
+        config.configs["spectek_url"] = self.urls[0] + SPECTEK_PATH
+        try:
+            yield self
+        finally:
+            config.flash_detect_api_urls[:] = saved[0]
+            config.flash_extra_api_urls[:] = saved[1]
+            config.configs["micron_api_url"] = saved[2]
+            config.configs["spectek_url"] = saved[3]
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="FlashDetail本地模拟上游服务器")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=18080, help="第一个镜像的端口，其余镜像依次加1")
+    parser.add_argument("--mirror", action="append", default=[],
+                        help="镜像故障注入设置，可重复指定多个镜像，如 latency=lognormal:80:0.5,error=0.05,timeout=0.01")
+    parser.add_argument("--record-from", help="本地没有数据时转发到该上游并录制响应")
+    args = parser.parse_args(argv)
+
+    upstream = MockUpstream([MirrorProfile.parse(spec) for spec in args.mirror or [""]], args.host, args.port,
+                            record_from=args.record_from).start()
+    for mirror in upstream.mirrors:
+        print(f"{mirror.url}  {mirror.profile}")
+    print("在机器人中使用：")
+    for i, url in enumerate(upstream.urls):
+        print(f"  /api insert {i} {url}")
+    print(f"  /config micron_api_url {upstream.urls[0]}{MICRON_PATH}")
+    print(f"  /config spectek_url {upstream.urls[0]}{SPECTEK_PATH}")
+    print(f"或在查询后添加 --url={upstream.urls[0]}")
+    try:
+        while True:
+            time.sleep(60)
+            for url, stats in upstream.stats().items():
+                print(f"{url}: {stats}")
+    except KeyboardInterrupt:
+        upstream.stop()
+
+
+if __name__ == "__main__":
+    main()
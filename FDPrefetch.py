@@ -0,0 +1,362 @@
+import argparse
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Optional
+
+from . import FDQueryMethods
+from .FDAccessLog import access_log
+from .FDCanonical import canonical_key
+from .FDJsonDatabase import db_instance
+from .FDScheduler import scheduler, Requester, requester_context
+
+CHECKPOINT_PATH = os.path.join(os.path.dirname(__file__), 'data', 'prefetch_checkpoint.json')
+
+# 预取任务对应的查询函数
+FETCHERS = {
+    "flash_detail": FDQueryMethods.get_detail,
+    "dram_detail": FDQueryMethods.get_dram_detail,
+}
+
+
+class RateLimiter:
+    """简单的匀速限流器，保证两次请求之间至少间隔 1/rate 秒"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0
+        self.lock = threading.Lock()
+        self._next_time = 0.0
+
+    def wait(self) -> None:
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            wait_time = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+
+class PrefetchJob:
+    """批量预取任务：按料号前缀枚举候选料号，或按访问日志重新获取热门键，并写入缓存"""
+
+    def __init__(self, prefixes: list[str] = None, limit: int = 50, hot: int = 0,
+                 concurrency: int = 4, rate: float = 2.0, refresh: bool = False,
+                 resume: bool = True, url: str | None = None, debug: bool = False,
+                 checkpoint_path: str = CHECKPOINT_PATH):
+        """初始化预取任务
+
+        Args:
+            prefixes: 料号前缀列表（如 MT29F、K9、TH58）
+            limit: 每个前缀最多枚举的料号数量
+            hot: 额外重新获取访问日志中最热门的键的数量（0表示不获取）
+            concurrency: 最大并发请求数
+            rate: 每秒最多发起的请求数
+            refresh: 已缓存的料号是否也重新获取
+            resume: 是否从上次的进度断点继续
+            url: 自定义API URL
+            debug: 是否开启调试模式
+            checkpoint_path: 进度断点文件路径
+        """
+        self.prefixes = [p.strip().upper() for p in (prefixes or []) if p.strip()]
+        self.limit = limit
+        self.hot = hot
+        self.concurrency = max(1, concurrency)
+        self.rate_limiter = RateLimiter(rate)
+        self.refresh = refresh
+        self.resume = resume
+        self.url = url
+        self.debug = debug
+        self.checkpoint_path = checkpoint_path
+        self.stats = {"total": 0, "done": 0, "fetched": 0, "skipped": 0, "failed": 0}
+        self.running = False
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._checkpoint = {"tasks": [], "done": []}
+
+    def stop(self) -> None:
+        """请求停止任务（已发出的请求会继续完成）"""
+        self._stop.set()
+
+    @property
+    def stopped(self) -> bool:
+        return self._stop.is_set()
+
+    def _load_checkpoint(self) -> Optional[dict]:
+        if not self.resume or not os.path.exists(self.checkpoint_path):
+            return None
+        try:
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                checkpoint = json.load(f)
+            # 前缀、每个前缀的数量、热门键数量都相同时才是同一个任务，否则重新枚举
+            if (checkpoint.get("prefixes") == self.prefixes and checkpoint.get("limit") == self.limit
+                    and checkpoint.get("hot") == self.hot and not checkpoint.get("finished")):
+                return checkpoint
+        except (IOError, json.JSONDecodeError) as e:
+            print(f"加载预取断点失败: {e}")
+        return None
+
+    def _save_checkpoint(self, finished: bool = False) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.checkpoint_path), exist_ok=True)
+            with self._lock:
+                self._checkpoint["finished"] = finished
+                self._checkpoint["time"] = int(time.time())
+                data = json.dumps(self._checkpoint, ensure_ascii=False)
+            with open(self.checkpoint_path, "w", encoding="utf-8") as f:
+                f.write(data)
+        except IOError as e:
+            print(f"保存预取断点失败: {e}")
+
+    def enumerate_candidates(self) -> list[list[str]]:
+        """通过searchPn接口枚举候选料号，并追加访问日志中的热门键
+
+        Returns:
+            [[表名, 键名], ...]
+        """
+        tasks = []
+        seen = set()
+        for prefix in self.prefixes:
+            if self.stopped:
+                break
+            self.rate_limiter.wait()
+            result = FDQueryMethods.search(prefix, debug=self.debug, count=self.limit, url=self.url, local=False)
+            for item in result.get("data", []) if result.get("result", False) else []:
+                key = item.split()[-1].lower()
+                if ("flash_detail", key) not in seen:
+                    seen.add(("flash_detail", key))
+                    tasks.append(["flash_detail", key])
+        if self.hot:
+            for table, key, _ in access_log.most_queried(self.hot):
+                if table in FETCHERS and (table, key) not in seen:
+                    seen.add((table, key))
+                    tasks.append([table, key])
+        return tasks
+
+    def _fetch(self, table: str, key: str, refresh: bool) -> str:
+        if not refresh and db_instance.peek(table, key):
+            return "skipped"
+        self.rate_limiter.wait()
+        result = FETCHERS[table](key, refresh=True, debug=self.debug, save=True, url=self.url)
+        return "fetched" if result.get("result", False) else "failed"
+
+    def run(self, progress: Optional[Callable[[dict], None]] = None) -> dict:
+        """执行预取任务
+
+        Args:
+            progress: 进度回调，每完成一个料号调用一次，参数为当前统计信息
+
+        Returns:
+            统计信息字典
+        """
+        self.running = True
+        try:
+            return self._run(progress)
+        finally:
+            self.running = False
+
+    def _run(self, progress: Optional[Callable[[dict], None]]) -> dict:
+        checkpoint = self._load_checkpoint()
+        if checkpoint:
+            self._checkpoint = checkpoint
+        else:
+            self._checkpoint = {"prefixes": self.prefixes, "limit": self.limit, "hot": self.hot, "tasks": self.enumerate_candidates(), "done": []}
+            self._save_checkpoint()
+
+        done = {tuple(task) for task in self._checkpoint["done"]}
+        hot_keys = {(table, key) for table, key, _ in access_log.most_queried(self.hot)} if self.hot else set()
+        pending = [task for task in self._checkpoint["tasks"] if tuple(task) not in done]
+        self.stats["total"] = len(self._checkpoint["tasks"])
+        self.stats["done"] = len(done)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = {}
+            for table, key in pending:
+                if self.stopped:
+                    break
+                # 热门键总是重新获取
+                refresh = self.refresh or (table, key) in hot_keys
+                futures[executor.submit(self._fetch, table, key, refresh)] = [table, key]
+            for future in as_completed(futures):
+                if future.cancelled():
+                    continue
+                try:
+                    status = future.result()
+                except Exception as e:
+                    print(f"预取失败: {futures[future]} - {e}")
+                    status = "failed"
+                with self._lock:
+                    self.stats[status] += 1
+                    self.stats["done"] += 1
+                    self._checkpoint["done"].append(futures[future])
+                    save_now = self.stats["done"] % 10 == 0
+                if save_now:
+                    self._save_checkpoint()
+                if progress:
+                    progress(self.stats.copy())
+                if self.stopped:
+                    for pending_future in futures:
+                        pending_future.cancel()
+
+        self._save_checkpoint(finished=not self.stopped and self.stats["done"] >= self.stats["total"])
+        return self.stats.copy()
+
+    def summary(self) -> str:
+        return (f"预取进度：{self.stats['done']}/{self.stats['total']}，"
+                f"新获取{self.stats['fetched']}，已缓存跳过{self.stats['skipped']}，失败{self.stats['failed']}")
+
+
+class SpeculativePrefetcher:
+    """推测式预取：搜索结果、ID解码的可能料号，用户接下来多半会逐个查询，在后台先取到缓存中
+
+    - 只取每次结果的前N个，后台线程数单独限制，排队任务过多时直接丢弃
+    - 以低权重的调度分组请求上游，且有用户请求在排队时跳过，不与用户查询争抢
+    - 记录预取过的键，之后被查询到时计为命中，用于评估预取是否值得
+    """
+
+    GROUP = "_speculative"
+
+    def __init__(self, top_n: int = 3, concurrency: int = 2, max_pending: int = 32,
+                 max_tracked: int = 1024, weight: float = 0.1):
+        """初始化预取器
+
+        Args:
+            top_n: 每次结果预取的料号数（0表示关闭）
+            concurrency: 后台线程数
+            max_pending: 最多排队的预取任务数
+            max_tracked: 最多记录的已预取键数（超出时最早的键计为未使用）
+            weight: 在上游调度器中的权重（用户群默认为1）
+        """
+        self.top_n = top_n
+        self.concurrency = max(1, concurrency)
+        self.max_pending = max_pending
+        self.max_tracked = max_tracked
+        self.lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending: set[tuple[str, str]] = set()
+        self._prefetched: "OrderedDict[tuple[str, str], float]" = OrderedDict()
+        self.stats = {"submitted": 0, "fetched": 0, "cached": 0, "failed": 0, "dropped": 0, "hits": 0, "unused": 0}
+        scheduler.set_weight(self.GROUP, weight)
+
+    def configure_from(self, configs: dict[str, Any]) -> None:
+        """从插件配置的configs字典更新预取数（speculative_prefetch，0表示关闭）和线程数（speculative_concurrency）"""
+        concurrency = max(1, int(configs.get("speculative_concurrency", 2)))
+        with self.lock:
+            self.top_n = int(configs.get("speculative_prefetch", 3))
+            if concurrency != self.concurrency:
+                self.concurrency = concurrency
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False)
+                    self._executor = None
+
+    def submit(self, table: str, part_numbers: list[str]) -> int:
+        """提交结果中的前N个料号（已缓存、已在排队的会被跳过）
+
+        Returns:
+            实际提交的任务数
+        """
+        if not self.top_n or table not in FETCHERS:
+            return 0
+        submitted = 0
+        for pn in part_numbers[:self.top_n]:
+            key = canonical_key(table, pn)
+            if not key or db_instance.peek(table, key):
+                continue
+            with self.lock:
+                if (table, key) in self._pending:
+                    continue
+                if len(self._pending) >= self.max_pending:
+                    self.stats["dropped"] += 1
+                    continue
+                self._pending.add((table, key))
+                self.stats["submitted"] += 1
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.concurrency, thread_name_prefix="fd_speculative")
+                executor = self._executor
+            executor.submit(self._fetch, table, key, pn)
+            submitted += 1
+        return submitted
+
+    def _fetch(self, table: str, key: str, pn: str) -> None:
+        status = "failed"
+        try:
+            if db_instance.peek(table, key):
+                status = "cached"
+            elif scheduler.queue_depth > 0:
+                # 有用户请求在等待上游空位，放弃本次预取
+                status = "dropped"
+            else:
+                with requester_context(Requester(group_id=self.GROUP, exempt=True)):
+                    result = FETCHERS[table](pn, save=True)
+                status = "fetched" if result.get("result", False) else "failed"
+        except Exception as e:
+            print(f"推测预取失败: {table}.{key} - {e}")
+        with self.lock:
+            self._pending.discard((table, key))
+            self.stats[status] += 1
+            if status == "fetched":
+                self._prefetched[(table, key)] = time.time()
+                while len(self._prefetched) > self.max_tracked:
+                    self._prefetched.popitem(last=False)
+                    self.stats["unused"] += 1
+
+    def record_query(self, table: str, key: str) -> bool:
+        """用户查询时调用：查询的是预取来的键时计为命中（每个键只计一次）
+
+        Returns:
+            是否命中
+        """
+        with self.lock:
+            if self._prefetched.pop((table, key), None) is None:
+                return False
+            self.stats["hits"] += 1
+            return True
+
+    def hit_rate(self) -> float:
+        """已预取的键中被用户查询到的比例"""
+        with self.lock:
+            return self.stats["hits"] / self.stats["fetched"] if self.stats["fetched"] else 0.0
+
+    def summary(self) -> str:
+        return (f"推测预取：提交{self.stats['submitted']}，获取{self.stats['fetched']}，"
+                f"命中{self.stats['hits']}（{self.hit_rate() * 100:.1f}%），"
+                f"已缓存{self.stats['cached']}，丢弃{self.stats['dropped']}，失败{self.stats['failed']}")
+
+
+# 全局实例
+speculative = SpeculativePrefetcher()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="FlashDetail缓存预取工具")
+    parser.add_argument("prefixes", nargs="*", help="料号前缀，如 MT29F K9 TH58")
+    parser.add_argument("--limit", type=int, default=50, help="每个前缀最多枚举的料号数量")
+    parser.add_argument("--hot", type=int, default=0, help="重新获取访问日志中最热门的N个键")
+    parser.add_argument("--concurrency", type=int, default=4, help="最大并发请求数")
+    parser.add_argument("--rate", type=float, default=2.0, help="每秒最多请求数")
+    parser.add_argument("--refresh", action="store_true", help="已缓存的料号也重新获取")
+    parser.add_argument("--restart", action="store_true", help="忽略断点，重新开始")
+    parser.add_argument("--url", default=None, help="自定义API URL")
+    parser.add_argument("--debug", action="store_true", help="开启调试模式")
+    args = parser.parse_args(argv)
+    if not args.prefixes and not args.hot:
+        parser.error("至少需要指定一个前缀或--hot")
+
+    job = PrefetchJob(args.prefixes, limit=args.limit, hot=args.hot, concurrency=args.concurrency,
+                      rate=args.rate, refresh=args.refresh, resume=not args.restart,
+                      url=args.url, debug=args.debug)
+    try:
+        job.run(progress=lambda stats: print(f"\r{job.summary()}", end="", flush=True))
+    except KeyboardInterrupt:
+        job.stop()
+        job._save_checkpoint()
+        print("\n已中断，进度已保存，下次运行将从断点继续")
+    print(f"\n{job.summary()}")
+
+
+if __name__ == "__main__":
+    main()
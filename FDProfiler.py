@@ -0,0 +1,151 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+PROFILE_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+# 线程空闲等待时停留的函数（文件名, 函数名），这类样本不计入热点
+IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("socketserver.py", "serve_forever"),
+}
+
+MAX_STACK_DEPTH = 64
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class SamplingProfiler:
+    """基于sys._current_frames的低开销栈采样器
+
+    在后台线程中按固定频率抓取所有线程的调用栈，聚合为折叠栈（collapsed stack）格式，
+    可直接交给flamegraph.pl / speedscope生成火焰图。
+    """
+
+    def __init__(self, output_dir: str = PROFILE_DIR):
+        self.output_dir = output_dir
+        self.lock = threading.Lock()
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.idle_samples = 0
+        self.rate = 0
+        self.started = 0.0
+        self.duration = 0.0
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds: float, rate: int = 200, include_idle: bool = False) -> bool:
+        """开始采样
+
+        Args:
+            seconds: 采样时长（秒）
+            rate: 每秒采样次数
+            include_idle: 是否保留空闲等待的样本
+
+        Returns:
+            是否成功开始（已在采样时返回False）
+        """
+        if self.running:
+            return False
+        with self.lock:
+            self.stacks = Counter()
+            self.samples = 0
+            self.idle_samples = 0
+        self.rate = max(1, rate)
+        self.duration = seconds
+        self.started = time.time()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(seconds, 1.0 / self.rate, include_idle),
+                                        name="flashdetail-profiler", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self, seconds: float, interval: float, include_idle: bool) -> None:
+        own_id = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        while not self._stop.is_set() and time.monotonic() < deadline:
+            sampled = []
+            idle = 0
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                code = frame.f_code
+                if not include_idle and (os.path.basename(code.co_filename), code.co_name) in IDLE_LEAVES:
+                    idle += 1
+                    continue
+                names = []
+                while frame is not None and len(names) < MAX_STACK_DEPTH:
+                    names.append(_frame_name(frame))
+                    frame = frame.f_back
+                sampled.append(";".join(reversed(names)))
+            with self.lock:
+                self.stacks.update(sampled)
+                self.samples += len(sampled)
+                self.idle_samples += idle
+            self._stop.wait(interval)
+
+    def save(self, path: Optional[str] = None) -> str:
+        """将折叠栈写入文件（每行：栈 样本数）
+
+        Returns:
+            文件路径
+        """
+        if path is None:
+            path = os.path.join(self.output_dir, f"profile_{time.strftime('%Y%m%d_%H%M%S', time.localtime(self.started))}.folded")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self.lock:
+            stacks = self.stacks.most_common()
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in stacks:
+                f.write(f"{stack} {count}\n")
+        return path
+
+    def top(self, count: int = 10) -> list[tuple[str, int, int]]:
+        """统计热点函数
+
+        Returns:
+            [(函数, 自身样本数, 包含子调用的样本数), ...]，按自身样本数降序
+        """
+        own = Counter()
+        total = Counter()
+        with self.lock:
+            stacks = list(self.stacks.items())
+        for stack, n in stacks:
+            names = stack.split(";")
+            own[names[-1]] += n
+            for name in set(names):
+                total[name] += n
+        return [(name, n, total[name]) for name, n in own.most_common(count)]
+
+    def summary(self, count: int = 10) -> str:
+        lines = [f"采样{self.duration:g}秒，{self.rate}次/秒，有效样本{self.samples}（忽略空闲{self.idle_samples}）"]
+        if self.samples:
+            lines.append("热点函数（自身占比/含子调用占比）：")
+            for name, own, total in self.top(count):
+                lines.append(f"{own / self.samples * 100:5.1f}% {total / self.samples * 100:5.1f}% {name}")
+        return "\n".join(lines)
+
+
+# 创建全局采样器实例
+profiler = SamplingProfiler()
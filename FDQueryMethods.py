@@ -4,14 +4,28 @@ import os
 from bs4 import BeautifulSoup
 import urllib3
 import math
+import time
+from urllib.parse import urlsplit
 
 from . import spectek_decoder_v2
 
 from .FDConfig import config_instance as config
 from .FDJsonDatabase import save_to_database, get_from_database, db_instance
+from .FDScheduler import scheduler
+from .FDMetrics import timed, observe_stage, record_upstream, record_cache_lookup
+from .FDHttpCache import http_cache
+from .FDCanonical import canonical_key, canonical_part_number, canonical_flash_id, canonical_dram_pn, canonical_phison_pn, aliases, record_aliases
+from .FDTrace import span, event, note
+from .FDMicronIndex import fbga_index
+from .FDFuzzyIndex import flash_fuzzy_index
+from .FDAttrIndex import attr_index, parse_conditions
+from .FDCrosswalk import crosswalk, id_key, ID_PN_TABLE
+from .FDDeadline import DeadlineExceeded, request_timeout, expires_at
 
 # 抑制因忽略SSL验证产生的警告
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+MICRON_API_URL = "https://www.micron.com/content/micron/us/en/sales-support/design-tools/fbga-parts-decoder/_jcr_content.products.json"
        
 
 # 容量单位转换函数
@@ -75,51 +89,100 @@ def format_density(arg,width:int=8) -> str:
         return f"{arg}"
 
 # HTTP请求工具函数
-def get_html_with_requests(url: str,debug: bool=False) -> requests.Response:
-    """使用requests库获取HTML内容，忽略HTTPS证书验证错误"""
+def upstream_labels(url: str) -> tuple[str, str]:
+    """从URL中提取指标标签：镜像（协议+主机）和接口名（路径中的接口段）
+
+    Returns:
+        (镜像, 接口名)
+    """
+    parts = urlsplit(url)
+    mirror = f"{parts.scheme}://{parts.netloc}"
+    segments = [segment for segment in parts.path.split("/") if segment]
+    if "getpartbyfbgacode" in segments:
+        return mirror, "getpartbyfbgacode"
+    return mirror, segments[-1] if segments else "/"
+
+def get_html_with_requests(url: str,debug: bool=False,refresh: bool=False) -> requests.Response:
+    """使用requests库获取HTML内容，忽略HTTPS证书验证错误
+    
+    成功的响应按URL缓存到磁盘（见FDHttpCache），refresh为True时跳过缓存重新请求。
+    所有上游请求都经过调度器限流，超出速率时抛出FDScheduler.RateLimited。
+    请求超时取10秒与当前消息剩余时限（见FDDeadline）中的较小者，时限用完时不再请求，直接返回None
+    """
     if debug:
-        print(f"请求URL: {url}")
+        note(f"请求URL: {url}")
+    mirror, endpoint = upstream_labels(url)
+    if not refresh and http_cache.enabled:
+        with span("http_cache", endpoint=endpoint) as s:
+            cached = http_cache.get(url)
+            s.set(hit=cached is not None)
+        record_cache_lookup("http_response", cached is not None)
+        if cached is not None:
+            return cached
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        # 添加verify=False参数以忽略SSL证书验证错误
-        response = requests.get(url, headers=headers, timeout=10, verify=False)
-        response.raise_for_status()  # 检查请求是否成功
-        return response
-    except Exception as e:
-        print(f"HTTP请求失败: {str(e)}")
+        request_timeout(10)
+        with span("upstream", mirror=mirror, endpoint=endpoint) as s, scheduler.upstream_slot():
+            # 等待调度器空位的时间计入span，此事件标记实际发出请求的时刻
+            event("send")
+            # 排队会消耗时限，拿到空位后再计算超时
+            timeout = request_timeout(10)
+            start = time.perf_counter()
+            try:
+                headers = {
+                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+                }
+                # 添加verify=False参数以忽略SSL证书验证错误
+                response = requests.get(url, headers=headers, timeout=timeout, verify=False)
+                s.set(status=response.status_code)
+                response.raise_for_status()  # 检查请求是否成功
+                record_upstream(mirror, endpoint, time.perf_counter() - start, True)
+                http_cache.put(url, endpoint, response)
+                return response
+            except Exception as e:
+                record_upstream(mirror, endpoint, time.perf_counter() - start, False)
+                s.set(failed=type(e).__name__)
+                print(f"HTTP请求失败: {str(e)}")
+                return None
+    except DeadlineExceeded as e:
+        event("deadline", endpoint=endpoint)
+        if debug:
+            note(f"跳过请求: {e}")
         return None
 
-def get_from_flash_detector(postfix:str,debug: bool=False,url:str|None=None) -> requests.Response:
+def get_from_flash_detector(postfix:str,debug: bool=False,url:str|None=None,refresh: bool=False) -> requests.Response:
     """从闪存检测器API获取数据"""
     if url:
-        response = get_html_with_requests(f"{url}/{postfix}",debug)
+        response = get_html_with_requests(f"{url}/{postfix}",debug,refresh)
         if response:
             return response
     if not url:
-        for u in config.flash_detect_api_urls:
-            response = get_html_with_requests(f"{u}/{postfix}",debug)
+        for i, u in enumerate(config.flash_detect_api_urls):
+            if i:
+                event("mirror_fallback", mirror=u)
+            response = get_html_with_requests(f"{u}/{postfix}",debug,refresh)
             if response and response.status_code == 200:
                 return response
     return None
 
-def get_from_flash_extra(postfix:str,debug: bool=False,url:str|None=None) -> requests.Response:
+def get_from_flash_extra(postfix:str,debug: bool=False,url:str|None=None,refresh: bool=False) -> requests.Response:
     """从闪存额外信息API获取数据"""
     if url:
-        response = get_html_with_requests(f"{url}/{postfix}",debug)
+        response = get_html_with_requests(f"{url}/{postfix}",debug,refresh)
         if response:
             return response
     if not url:
-        for u in config.flash_extra_api_urls:
-            response = get_html_with_requests(f"{u}/{postfix}",debug)
+        for i, u in enumerate(config.flash_extra_api_urls):
+            if i:
+                event("mirror_fallback", mirror=u)
+            response = get_html_with_requests(f"{u}/{postfix}",debug,refresh)
             if response and response.status_code == 200:
                 return response
     return None
 
-def get_from_micron(pn:str,debug: bool=False) -> requests.Response:
-    """从Micron API获取数据"""
-    response = get_html_with_requests(f"{"https://www.micron.com/content/micron/us/en/sales-support/design-tools/fbga-parts-decoder/_jcr_content.products.json/getpartbyfbgacode/-/-/-/en_US/-/-/"}{pn}",debug)
+def get_from_micron(pn:str,debug: bool=False,refresh: bool=False) -> requests.Response:
+    """从Micron API获取数据（可通过configs中的micron_api_url替换接口地址）"""
+    base_url = config.configs.get("micron_api_url") or MICRON_API_URL
+    response = get_html_with_requests(f"{base_url}/getpartbyfbgacode/-/-/-/en_US/-/-/{pn}",debug,refresh)
     if response:
         return response
     return None
@@ -132,6 +195,48 @@ def is_hex(s: str) -> bool:
     except ValueError:
         return False
 
+def merge_part_numbers(part_numbers: list[str], known_keys: list[str]) -> list[str]:
+    """把索引中的料号键（转为记录中的料号写法）合并到料号列表后面，忽略大小写去重"""
+    merged = list(part_numbers)
+    seen = {canonical_key('flash_detail', pn, resolve_alias=False) for pn in merged}
+    for key in known_keys:
+        if key not in seen:
+            seen.add(key)
+            merged.append((db_instance.peek('flash_detail', key) or {}).get("data", {}).get("partNumber") or key.upper())
+    return merged
+
+def id_data_from_part(id_str: str, key: str) -> dict:
+    """用缓存的料号记录构造ID解码结果（本地算法不认识该ID、但ID↔料号索引中有对应料号时使用）
+
+    Args:
+        id_str: 规范化后的闪存ID
+        key: flash_detail表中的料号键
+
+    Returns:
+        ID解码结果的data字典（只包含记录中已知的字段）
+    """
+    record = (db_instance.peek('flash_detail', key) or {}).get("data", {})
+    data = {"id": id_str, "vendor": record.get("vendor", "未知")}
+    for field in ("density", "cellLevel", "processNode", "deviceWidth", "voltage"):
+        if record.get(field, "未知") != "未知":
+            data[field] = record[field]
+    die = (record.get("classification") or {}).get("die", "未知")
+    if die != "未知":
+        data["die"] = str(die)
+    return data
+
+def attach_known_ids(result: dict, key: str) -> dict:
+    """把ID↔料号索引中该料号的已知ID合并到结果的flashId中（复制data，不修改缓存中的记录）"""
+    if not result.get("result", False) or not isinstance(result.get("data"), dict):
+        return result
+    known_ids = crosswalk.flash_ids(key)
+    existing = result["data"].get("flashId") or []
+    existing_keys = {id_key(flash_id) for flash_id in existing if isinstance(flash_id, str)}
+    extra = [flash_id for flash_id in known_ids if id_key(flash_id) not in existing_keys]
+    if extra:
+        result["data"] = {**result["data"], "flashId": [*existing, *extra]}
+    return result
+
 def get_detail(arg: str, refresh: bool = False,debug: bool=False,save: bool=None,local: bool=None,url:str|None=None,**kwargs) -> dict:
     """获取闪存料号详细信息
     
@@ -154,33 +259,36 @@ def get_detail(arg: str, refresh: bool = False,debug: bool=False,save: bool=None
 
     
     try:
+        # 规范化料号（全角、多余空白、大小写）并经过别名表映射得到缓存键
+        arg = canonical_part_number(arg)
+        key = canonical_key('flash_detail', arg)
         # 尝试从缓存获取数据（如果不是强制刷新）
         if not result and not refresh:
-            # 使用arg.lower()确保不区分大小写查询
-            cached_data = get_from_database('flash_detail', arg.lower(),debug)
+            cached_data = get_from_database('flash_detail', key,debug)
             if cached_data:
                 # 为缓存数据添加accept方法（不执行任何操作，因为已经在数据库中）
                 cached_data["accept"] = lambda: None
-                return cached_data
+                return attach_known_ids(cached_data, key)
 
         if debug:
-            print(f"料号{arg}是十六进制吗？{is_hex(arg)}")
+            note(f"料号{arg}是十六进制吗？{is_hex(arg)}")
         if is_hex(arg) and arg.strip().upper().startswith(("89","45","2C","EC","AD","98","9B")):
-            return get_detail_from_ID(arg=arg,refresh=refresh,debug=debug,save=save,url=url,**kwargs)
+            return get_detail_from_ID(arg=arg,refresh=refresh,debug=debug,save=save,local=local,url=url,**kwargs)
         # 尝试本地算法解码（WIP）
         if not result and local is not False: pass
         # 尝试联网解码
         if not result and local is not True:
-            html = get_from_flash_detector(f"decode?lang=chs&pn={arg}",debug,url)
+            html = get_from_flash_detector(f"decode?lang=chs&pn={arg}",debug,url,refresh)
             if not html:
                 result = {"result": False, "error": "API请求失败"}
                 result["accept"] = lambda: None
                 return result
                 
-            soup = BeautifulSoup(html.text, 'lxml')
-            p_tags = soup.find('p')
-            if p_tags:
-                result = json.loads(p_tags.get_text())
+            with timed("parse", endpoint="decode"):
+                soup = BeautifulSoup(html.text, 'lxml')
+                p_tags = soup.find('p')
+                if p_tags:
+                    result = json.loads(p_tags.get_text())
         
         if not result.get("result",False):
             result = {"result": False, "error": "未找到有效数据"}
@@ -189,17 +297,19 @@ def get_detail(arg: str, refresh: bool = False,debug: bool=False,save: bool=None
             # 添加accept方法，仅在调用时保存数据到数据库
             if result.get("result",False) and save is None:
                 def accept_func():
-                    save_to_database('flash_detail', arg.lower(), result,debug)
+                    record_aliases('flash_detail', key, result["data"])
+                    save_to_database('flash_detail', key, result,debug)
                     # 移除accept方法，避免重复调用
                     if "accept" in result:
                         del result["accept"]
                 result["accept"] = accept_func
             else:
                 if save is True:
-                    save_to_database('flash_detail', arg.lower(), result,debug)
+                    record_aliases('flash_detail', key, result["data"])
+                    save_to_database('flash_detail', key, result,debug)
                 result["accept"] = lambda: None
 
-        return result
+        return attach_known_ids(result, key)
     except json.JSONDecodeError:
         result = {"result": False, "error": "API返回格式错误（非JSON）"}
         result["accept"] = lambda: None
@@ -237,7 +347,7 @@ def search(arg: str, debug: bool=False, count: int=10, url:str|None=None, local:
     if local is not False:
         # 搜索本地数据库
         if debug:
-            print(f"尝试本地数据库搜索: {arg}")
+            note(f"尝试本地数据库搜索: {arg}")
         local_search_result = search_local_database(arg, count, debug)
         if local_search_result.get("result", False):
             local_results = local_search_result["data"]
@@ -247,20 +357,21 @@ def search(arg: str, debug: bool=False, count: int=10, url:str|None=None, local:
         # 如果local是默认值None且本地结果不足count条，则请求API
         remaining = count - len(combined_results)
         if debug:
-            print(f"本地结果不足({len(combined_results)}条)，尝试API搜索获取剩余({remaining}条)结果")
+            note(f"本地结果不足({len(combined_results)}条)，尝试API搜索获取剩余({remaining}条)结果")
         try:
             html = get_from_flash_detector(f"searchPn?limit={remaining}&lang=chs&pn={arg}", debug, url)
             if html:
-                soup = BeautifulSoup(html.text, 'lxml')
-                p_tags = soup.find('p')
-                if p_tags:
-                    api_result = json.loads(p_tags.get_text())
+                with timed("parse", endpoint="searchPn"):
+                    soup = BeautifulSoup(html.text, 'lxml')
+                    p_tags = soup.find('p')
+                    api_result = json.loads(p_tags.get_text()) if p_tags else None
+                if api_result:
                     if api_result.get("result", False):
                         api_results = api_result["data"]
                         combined_results.extend(api_results)
         except (json.JSONDecodeError, Exception) as e:
             if debug:
-                print(f"API搜索失败: {str(e)}")
+                note(f"API搜索失败: {str(e)}")
     
     # 处理最终结果
     return {
@@ -294,13 +405,13 @@ def search_local_database(query: str, count: int = 10, debug: bool = False) -> d
             # 只搜索包含关键词的键
             if query_lower in key:
                 # 构造与API返回一致的格式
-                results.append(f"{db_instance.get('flash_detail', key).get("data",{}).get('vendor', '未知')} {key.upper()}")
+                results.append(f"{db_instance.peek('flash_detail', key).get("data",{}).get('vendor', '未知')} {key.upper()}")
                     
             if len(results) >= count:
                 break
         
         if debug:
-            print(f"本地数据库搜索结果: {results}")
+            note(f"本地数据库搜索结果: {results}")
         
         if results:
             return {
@@ -314,6 +425,69 @@ def search_local_database(query: str, count: int = 10, debug: bool = False) -> d
         print(f"本地数据库搜索失败: {str(e)}")
         return {"result": False, "error": str(e)}
 
+def search_fuzzy(query: str, count: int = 5, debug: bool = False, max_cost: float = 1.0, **kwargs) -> dict:
+    """在本地缓存中容错搜索相近的料号（可容忍个别错字及O/0、B/8等易混淆字符）
+    
+    Args:
+        query: 搜索关键词
+        count: 返回结果数量
+        debug: 是否开启调试模式
+        max_cost: 允许的最大加权编辑距离
+        
+    Returns:
+        搜索结果字典，格式与API返回一致，按相似度排序
+    """
+    if not query.strip():
+        return {"result": False, "error": "搜索关键词不能为空"}
+    try:
+        matches = flash_fuzzy_index.query(query, count, max_cost)
+        if debug:
+            note(f"本地容错搜索结果: {matches}")
+        results = [f"{(db_instance.peek('flash_detail', key) or {}).get('data', {}).get('vendor', '未知')} {key.upper()}" for key, _ in matches]
+        if results:
+            return {"result": True, "data": results}
+        return {"result": False, "error": "未找到相近料号"}
+    except Exception as e:
+        print(f"本地容错搜索失败: {str(e)}")
+        return {"result": False, "error": str(e)}
+
+def filter_records(arg: str, count: int = 20, debug: bool = False, **kwargs) -> dict:
+    """按属性筛选已缓存的闪存和DRAM料号（如 "BiCS5 TLC 1Tb"、"3DV6 海力士"、"DDR4 die=2"）
+    
+    Args:
+        arg: 筛选条件，空格分隔，条件之间为"与"
+        count: 返回结果数量
+        debug: 是否开启调试模式
+        
+    Returns:
+        结果字典，data为 "厂商 料号" 列表，total为符合条件的总数
+    """
+    try:
+        conditions = parse_conditions(arg)
+    except ValueError as e:
+        return {"result": False, "error": str(e)}
+    if not conditions:
+        return {"result": False, "error": "筛选条件不能为空"}
+    with timed("filter", conditions=len(conditions)):
+        matches = []
+        unmatched = []
+        for table_name in ("flash_detail", "dram_detail"):
+            keys, missing = attr_index.query(conditions, table_name)
+            if missing:
+                unmatched.append(missing.text)
+            matches.extend((table_name, key) for key in keys)
+    if debug:
+        note(f"属性筛选: {[(c.attribute, sorted(c.values)) for c in conditions]} -> {len(matches)}条")
+    if not matches:
+        if len(unmatched) == 2 and unmatched[0] == unmatched[1]:
+            return {"result": False, "error": f"没有记录符合条件：{unmatched[0]}"}
+        return {"result": False, "error": "没有同时符合所有条件的料号"}
+    results = []
+    for table_name, key in matches[:count]:
+        data = (db_instance.peek(table_name, key) or {}).get("data", {})
+        results.append(f"{data.get('vendor', '未知')} {data.get('partNumber') or key.upper()}")
+    return {"result": True, "data": results, "total": len(matches)}
+
 def calculate_die_size(density: str, die_count: str) -> str:
     """根据总密度和芯片数计算单芯片(die)大小
     
@@ -427,46 +601,19 @@ def get_detail_from_ID(arg: str, refresh: bool = False,debug: bool=False,save: b
         return result
     
     try:
-        # 提取有效字符（字母/数字）
-        id_str= ""
-        arg=arg.upper().replace("0X","").replace("ID","").strip()
-        
-        # 按英文逗号分组处理
-        groups = arg.split(',')
-        processed_groups = []
-        
-        for group in groups:
-            # 提取每个分组中的hex字符
-            hex_chars = ''.join([c for c in group if c in "0123456789ABCDEF"])
-            # 如果分组只有一个hex数字，则前补0
-            if len(hex_chars) == 1:
-                hex_chars = '0' + hex_chars
-            processed_groups.append(hex_chars)
-        
-        # 组合所有处理后的分组
-        combined_hex = ''.join(processed_groups)
-        
-        # 提取最多12位
-        for c in combined_hex:
-            if c in "0123456789ABCDEF":
-                id_str += c
-            if len(id_str) >= 12:
-                break  # 超过12位则截断
-        
-        # 不足12位则补0
-        if len(id_str) < 12:
-            id_str += '0' * (12 - len(id_str))  
+        # 规范化为12位十六进制（支持空格/逗号分隔、0x前缀、不足补0）
+        id_str = canonical_flash_id(arg)
         
         # 尝试从缓存获取数据（如果不是强制刷新）
         if not refresh:
-            # 使用id_str.lower()确保不区分大小写查询
-            cached_data = get_from_database('flash_id_detail', id_str.lower(),debug)
+            cached_data = get_from_database('flash_id_detail', canonical_key('flash_id_detail', id_str),debug)
             if cached_data:
                 cached_data["accept"] = lambda: None
                 return cached_data
         result={}
         # 本地算法解码
         if local is not False:
+            decode_start = time.perf_counter()
             data={}
             data["id"]=id_str
             def get_die_cellLevel(id_str: str) -> tuple:
@@ -604,24 +751,46 @@ def get_detail_from_ID(arg: str, refresh: bool = False,debug: bool=False,save: b
 
 
             result["data"] = data
-        # 联网解码
+            observe_stage("local_decode", time.perf_counter() - decode_start, decoder="flash_id")
+        # 已缓存的料号记录中出现过此ID（或ID解码曾返回过这些料号）
+        known_pns = [] if refresh else crosswalk.part_numbers(id_str)
+        if debug:
+            note(f"ID↔料号索引: {id_str} -> {known_pns}")
+        use_known = bool(known_pns) and local is not False
+        # 联网解码（索引中有料号时仍然请求，以取得完整的解码结果）
+        remote_pns = []
         if local is not True and not result.get("result",False):
-            html = get_from_flash_detector(f"decodeId?lang=chs&id={id_str}",debug,url)
-            if not html:
+            html = get_from_flash_detector(f"decodeId?lang=chs&id={id_str}",debug,url,refresh)
+            if not html and not use_known:
                 result = {"result": False, "error": "API请求失败"}
                 result["accept"] = lambda: None
                 return result
-                
-            soup = BeautifulSoup(html.text, 'lxml')
-            p_tags = soup.find('p')
-            if p_tags:
-                result = json.loads(p_tags.get_text())
-            # 添加accept方法，仅在调用时保存数据到数据库
+            if html:
+                with timed("parse", endpoint="decodeId"):
+                    soup = BeautifulSoup(html.text, 'lxml')
+                    p_tags = soup.find('p')
+                    if p_tags:
+                        result = json.loads(p_tags.get_text())
+                if isinstance(result.get("data"), dict):
+                    remote_pns = [pn for pn in result["data"].get("availablePn") or [] if isinstance(pn, str)]
+        # 只用本地解码或联网解码失败时，用索引中料号的缓存记录补出结果
+        if use_known and not result.get("result",False):
+            result = {"result": True, "data": id_data_from_part(id_str, known_pns[0])}
+        if result.get("result",False) and known_pns:
+            result["data"]["availablePn"] = merge_part_numbers(result["data"].get("availablePn") or [], known_pns)
         
         if result["data"].get("density","未知") != "未知" and result["data"].get("die","未知") != "未知":
             result["data"]["dieDensity"] = total_density(result["data"]["density"],str(1.0/int(result["data"]["die"])))
 
-        if save is None and result.get("result",False):
+        # ID解码结果本身不缓存，只记录新的ID↔料号对应关系
+        new_pns = {canonical_key('flash_detail', pn, resolve_alias=False) for pn in remote_pns} - set(known_pns)
+        if save is None and result.get("result",False) and new_pns:
+            def accept_func():
+                save_to_database(ID_PN_TABLE, id_str.lower(), {"data": {"availablePn": remote_pns}}, debug)
+                if "accept" in result:
+                    del result["accept"]
+            result["accept"] = accept_func
+        elif save is None and result.get("result",False):
             # def accept_func():
             #     save_to_database('flash_id_detail', id_str.lower(), result,debug)
             #     # 移除accept方法，避免重复调用
@@ -644,6 +813,37 @@ def get_detail_from_ID(arg: str, refresh: bool = False,debug: bool=False,save: b
         return result
 
 
+def decode_spectek_mark(mark_code: str, refresh: bool = False, debug: bool=False) -> dict:
+    """解码Spectek Mark Code，结果持久化到spectek_mark_decode表
+    
+    Args:
+        mark_code: Spectek Mark Code（P开头的5位代码）
+        refresh: 是否强制刷新数据（不使用缓存）
+        debug: 是否开启调试模式
+        
+    Returns:
+        查询结果字典，data中包含part-number和product-family
+    """
+    key = canonical_key('spectek_mark_decode', mark_code)
+    if not refresh:
+        cached_data = get_from_database('spectek_mark_decode', key, debug)
+        if cached_data:
+            return {"result": True, "data": cached_data["data"]}
+    spectek_decoder_v2.client.use_url(config.configs.get("spectek_url") or spectek_decoder_v2.SpectekClient.URL)
+    mirror, endpoint = upstream_labels(spectek_decoder_v2.client.url)
+    start = time.perf_counter()
+    with span("upstream", mirror=mirror, endpoint=endpoint):
+        response = spectek_decoder_v2.decode_spectek_mark(mark_code.strip().upper(), expires_at())
+    record_upstream(mirror, endpoint, time.perf_counter() - start, isinstance(response, list))
+    if debug:
+        note(response)
+    if not isinstance(response, list) or len(response) < 2 or len(response[1]) < 2:
+        return {"result": False, "error": response if isinstance(response, str) else "未找到解码结果"}
+    row = response[1]
+    result = {"result": True, "data": {"part-number": row[1], "product-family": row[2] if len(row) > 2 else "未知"}}
+    save_to_database('spectek_mark_decode', key, result, debug)
+    return result
+
 # Micron料号解析函数
 def parse_micron_pn(arg: str, refresh: bool = False, debug: bool=False,save: bool=None,local: bool=False,**kwargs) -> dict:
     """解析Micron PN
@@ -663,48 +863,62 @@ def parse_micron_pn(arg: str, refresh: bool = False, debug: bool=False,save: boo
         result = {"result": False, "error": "料号不能为空"}
         result["accept"] = lambda: None
     try:
-        pn = arg.strip().upper()
+        pn = canonical_part_number(arg)
+        key = canonical_key('micron_pn_decode', pn)
         
         # 尝试从缓存获取数据（如果不是强制刷新）
         if not refresh:
-            # 使用pn.lower()确保不区分大小写查询
-            cached_data = get_from_database('micron_pn_decode', pn.lower(),debug)
+            cached_data = get_from_database('micron_pn_decode', key,debug)
             if debug:
-                print(cached_data)
+                note(cached_data)
             if cached_data:
                 return cached_data
-        # 本地解码（不可能的，Not WIP）
-        if local is not False: pass
+        # 本地FBGA索引（导入的数据集+历史解码结果），命中则无需访问micron.com
+        if not result and not refresh and not pn.startswith("P"):
+            part_number = fbga_index.lookup(pn)
+            if debug:
+                note(f"本地FBGA索引: {pn} -> {part_number}")
+            if part_number:
+                result = {"result": True, "data": {"part-number": part_number}}
+        # 仅使用本地缓存时不联网，直接返回未命中
+        if local is True and not result:
+            result = {"result": False, "error": "本地缓存中没有该代码"}
+            result["accept"] = lambda: None
+            return result
         # 访问micron-online接口获取完整part-number
         if local is not True and not result:
             if(pn.startswith("P")):
-                response=spectek_decoder_v2.decode_spectek_mark(pn)
-                if(debug):
-                    print(response)
-                result = {"result": True, "data": {"part-number":response[1][1]}}
+                result = decode_spectek_mark(pn, refresh, debug)
             else:
-                micron_response = get_from_micron(pn, debug)
+                micron_response = get_from_micron(pn, debug, refresh)
+                if not micron_response:
+                    result = {"result": False, "error": "Micron API请求失败"}
+                    result["accept"] = lambda: None
+                    return result
                 # 尝试解析JSON响应
-                response_data = json.loads(micron_response.text)
+                with timed("parse", endpoint="getpartbyfbgacode"):
+                    response_data = json.loads(micron_response.text)
                 if debug:
-                    print(response_data)
+                    note(response_data)
                 # 确保返回的数据结构包含必要字段
                 result["data"]=(response_data.get("details",[{}]) or [{}])[0]
                 result["result"]=bool(result["data"])
+                if result["data"].get("part-number"):
+                    fbga_index.add(pn, result["data"]["part-number"])
         # 添加accept方法，仅在调用时保存数据到数据库
         if result.get("result", False) and save:  # 如果没有result字段，默认为True
             def accept_func():
-                save_to_database('micron_pn_decode', pn.lower(), result,debug)
+                save_to_database('micron_pn_decode', key, result,debug)
                 # 移除accept方法，避免重复调用
                 if "accept" in result:
                     del result["accept"]
             result["accept"] = accept_func
         else:
             if save is True:
-                save_to_database('micron_pn_decode', pn.lower(), result,debug)
+                save_to_database('micron_pn_decode', key, result,debug)
             result["accept"] = lambda: None
         if debug:
-            print(result)
+            note(result)
         return result
     except json.JSONDecodeError:
         result = {"result": False, "error": "返回数据格式错误"}
@@ -737,13 +951,19 @@ def get_dram_detail(arg: str, refresh: bool = False, debug: bool=False,save: boo
     
     result={}
     try:
-        pn = arg.strip().upper()
+        pn = canonical_dram_pn(arg)
+        # 已经查过的FBGA代码在别名表中指向完整料号，可直接命中缓存
+        if not refresh:
+            cached_data = get_from_database('dram_detail', canonical_key('dram_detail', pn),debug)
+            if cached_data:
+                cached_data["accept"] = lambda: None
+                return cached_data
         # 处理5位DRAM料号特殊逻辑
         if len(pn) == 5:
-            micron_json = parse_micron_pn(pn, refresh)
+            micron_json = parse_micron_pn(pn, refresh, debug, local=local)
             # 获取完整的part-number并使用它调用DRAM接口
             if "data" in micron_json and "part-number" in micron_json["data"]:
-                full_pn = micron_json["data"]["part-number"]
+                full_pn = canonical_dram_pn(micron_json["data"]["part-number"])
             else:
                 result = {"result": False, "error": "获取完整DRAM料号失败：找不到part-number字段"}
                 result["accept"] = lambda: None
@@ -752,27 +972,28 @@ def get_dram_detail(arg: str, refresh: bool = False, debug: bool=False,save: boo
         else:
             full_pn = pn
 
-        # 如果不强制刷新，先尝试从数据库读取
-        if not refresh:
-            # 使用full_pn.lower()确保不区分大小写查询
-            cached_data = get_from_database('dram_detail', full_pn.lower(),debug)
+        key = canonical_key('dram_detail', full_pn)
+        # 如果不强制刷新，先尝试从数据库读取（完整料号）
+        if not refresh and full_pn != pn:
+            cached_data = get_from_database('dram_detail', key,debug)
             if cached_data:
+                aliases.add('dram_detail', pn.lower(), key, save=False)
                 cached_data["accept"] = lambda: None
                 return cached_data
         # 本地算法解码（这是有可能的，所以WIP）
         if not result and local is not False:pass
-        if full_pn.startswith("CT"):full_pn="M"+full_pn[1:]
         # 在线dram解码
         if not result and local is not True:
             # 使用原始料号或从micron-online获取的完整料号调用DRAM接口
-            response = get_from_flash_extra(f"DRAM?param={full_pn}", debug,url)
+            response = get_from_flash_extra(f"DRAM?param={full_pn}", debug,url,refresh)
             if not response:
                 result = {"result": False, "error": "DRAM API请求失败"}
                 result["accept"] = lambda: None
                 return result
 
             # 解析API返回的JSON
-            resp_json = json.loads(response.text)
+            with timed("parse", endpoint="dram"):
+                resp_json = json.loads(response.text)
             if not resp_json.get("result"):
                 result = {"result": False, "error": "未查询到DRAM信息"}
                 result["accept"] = lambda: None
@@ -791,14 +1012,18 @@ def get_dram_detail(arg: str, refresh: bool = False, debug: bool=False,save: boo
         # 添加accept方法，仅在调用时保存数据到数据库
         if save is None and result.get("result"):
             def accept_func():
-                save_to_database('dram_detail', full_pn.lower(), result,debug)
+                if full_pn != pn:
+                    aliases.add('dram_detail', pn.lower(), key, save=False)
+                save_to_database('dram_detail', key, result,debug)
                 # 移除accept方法，避免重复调用
                 if "accept" in result:
                     del result["accept"]
             result["accept"] = accept_func
         else:
             if save is True:
-                save_to_database('dram_detail', full_pn.lower(), result,debug)
+                if full_pn != pn:
+                    aliases.add('dram_detail', pn.lower(), key, save=False)
+                save_to_database('dram_detail', key, result,debug)
             result["accept"] = lambda: None
         return result
     except json.JSONDecodeError:
@@ -822,6 +1047,7 @@ def parse_phison_pn(arg: str, debug: bool=False,save: bool=None,**kwargs) -> dic
     Returns:
         查询结果字典
     """
+    decode_start = time.perf_counter()
     try:
         pn=arg.strip()
         if not pn:
@@ -832,7 +1058,7 @@ def parse_phison_pn(arg: str, debug: bool=False,save: bool=None,**kwargs) -> dic
             result = {"result": False, "error": "Phison料号长度必须为10位"}
             result["accept"] = lambda: None
             return result
-        pn=pn.replace("0","O")
+        pn=canonical_phison_pn(pn)
         data={"partNumber":pn,"type":"NAND","width":"x8"}
         data["vendor"]="群联-"+{"T":"东芝","S":"恺侠","I":"镁光","K":"镁光","H":"海力士",
                                 "D":"闪迪","C":"长江存储","N":"英特尔"}.get(pn[0],"未知")
@@ -868,6 +1094,7 @@ def parse_phison_pn(arg: str, debug: bool=False,save: bool=None,**kwargs) -> dic
                 return ("未知","未知")
         
         data["processNode"],data["cellLevel"]=get_process_node(pn)
+        observe_stage("local_decode", time.perf_counter() - decode_start, decoder="phison")
         return {"result": True, "data": data, "accept": lambda: None}
     except Exception as e:
         result = {"result": False, "error": f"错误：{str(e)}"}
@@ -0,0 +1,70 @@
+from typing import NamedTuple, Optional
+
+
+class Command(NamedTuple):
+    """解析后的命令"""
+    token: str   # 命令标识
+    rest: str    # 命令前缀之后的参数文本（已去除首尾空白）
+
+
+class PrefixTrie:
+    """不区分大小写的命令前缀字典树，按最长前缀匹配"""
+
+    _TOKEN = object()  # 节点上存放命令标识的键
+
+    def __init__(self, commands: dict[str, str] = None):
+        """初始化前缀树
+
+        Args:
+            commands: {命令前缀: 命令标识}
+        """
+        self.root: dict = {}
+        for prefix, token in (commands or {}).items():
+            self.add(prefix, token)
+
+    def add(self, prefix: str, token: str) -> None:
+        node = self.root
+        for char in prefix.lower():
+            node = node.setdefault(char, {})
+        node[self._TOKEN] = token
+
+    def match(self, text: str) -> Optional[Command]:
+        """对text做最长前缀匹配
+
+        Returns:
+            匹配到的命令，没有匹配返回None
+        """
+        node = self.root
+        matched = None
+        for i, char in enumerate(text):
+            node = node.get(char.lower())
+            if node is None:
+                break
+            if self._TOKEN in node:
+                matched = (node[self._TOKEN], i + 1)
+        if matched is None:
+            return None
+        token, length = matched
+        return Command(token, text[length:].strip())
+
+
+# 查询命令前缀 → 命令标识
+QUERY_COMMANDS = {
+    "/micron": "micron",
+    "/phison": "phison",
+    "dram": "dram",
+    "查dram": "dram",
+    "id": "id",
+    "查": "查",
+    "搜": "搜",
+    "筛": "筛",
+}
+
+# 其他需要路由的消息命令
+MESSAGE_COMMANDS = {
+    "撤回": "撤回",
+}
+
+query_router = PrefixTrie(QUERY_COMMANDS)
+message_router = PrefixTrie({**QUERY_COMMANDS, **MESSAGE_COMMANDS})
+QUERY_TOKENS = frozenset(QUERY_COMMANDS.values())
@@ -0,0 +1,248 @@
+import contextvars
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Optional
+
+from .FDDeadline import DeadlineExceeded, wait_limit
+from .FDMetrics import metrics
+
+
+class RateLimited(Exception):
+    """请求被限流时抛出"""
+
+
+class TokenBucket:
+    """令牌桶：以固定速率补充令牌，允许一定的突发"""
+
+    def __init__(self, rate: float, capacity: float):
+        """初始化令牌桶
+
+        Args:
+            rate: 每秒补充的令牌数
+            capacity: 桶容量（允许的最大突发次数）
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self) -> None:
+        """按经过的时间补充令牌"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """尝试取出令牌（调用方负责加锁）
+
+        Returns:
+            是否取得令牌
+        """
+        self.refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    def retry_after(self, tokens: float = 1) -> float:
+        """距离可取得令牌还需等待的秒数"""
+        if self.rate <= 0:
+            return float("inf")
+        return max(0.0, (tokens - self.tokens) / self.rate)
+
+
+class Requester:
+    """当前消息的发起者，随上下文传递到上游请求处"""
+
+    def __init__(self, user_id: Optional[str] = None, group_id: Optional[str] = None, exempt: bool = False):
+        self.user_id = user_id
+        self.group_id = group_id
+        self.exempt = exempt  # 是否免于令牌桶限流（如管理员）
+        self.charged = False  # 每条消息只扣一次令牌
+
+    @classmethod
+    def from_session_id(cls, session_id: str, exempt: bool = False) -> "Requester":
+        """从NoneBot的session_id（group_<群号>_<用户>或<用户>）构造"""
+        parts = session_id.split("_")
+        if len(parts) >= 3 and parts[0] == "group":
+            return cls(parts[2], parts[1], exempt)
+        return cls(parts[0], None, exempt)
+
+
+_current_requester: contextvars.ContextVar[Optional[Requester]] = contextvars.ContextVar("fd_requester", default=None)
+
+
+@contextmanager
+def requester_context(requester: Requester):
+    """在上下文中标记当前消息的发起者"""
+    token = _current_requester.set(requester)
+    try:
+        yield requester
+    finally:
+        _current_requester.reset(token)
+
+
+class _Ticket:
+    __slots__ = ("group", "finish")
+
+    def __init__(self, group: str, finish: float):
+        self.group = group
+        self.finish = finish
+
+
+class FairScheduler:
+    """上游请求调度器
+
+    - 每个用户、每个群各有一个令牌桶，超出速率的请求直接拒绝
+    - 全局限制同时进行的上游请求数，排队的请求按群做加权公平排队（WFQ）
+    - 缓存命中不会走到上游请求，因此天然绕过限流
+    """
+
+    SYSTEM_GROUP = "_system"  # CLI、预取等无发起者的请求
+
+    def __init__(self, max_concurrent: int = 4, user_rate_per_minute: float = 10,
+                 group_rate_per_minute: float = 30, max_wait: float = 30):
+        """初始化调度器
+
+        Args:
+            max_concurrent: 全局同时进行的上游请求数上限
+            user_rate_per_minute: 每个用户每分钟允许的上游查询次数（0表示不限）
+            group_rate_per_minute: 每个群每分钟允许的上游查询次数（0表示不限）
+            max_wait: 排队等待上游空位的最长时间（秒）
+        """
+        self.condition = threading.Condition()
+        self.user_buckets: dict[str, TokenBucket] = {}
+        self.group_buckets: dict[str, TokenBucket] = {}
+        self.weights: dict[str, float] = {}
+        self._queue: list[tuple[float, int, _Ticket]] = []
+        self._seq = itertools.count()
+        self._last_finish: dict[str, float] = {}
+        self._virtual_time = 0.0
+        self.active = 0
+        self.counters = {"granted": 0, "rejected": 0, "timeout": 0, "max_queue_depth": 0}
+        self.configure(max_concurrent, user_rate_per_minute, group_rate_per_minute, max_wait)
+
+    def configure(self, max_concurrent: int = None, user_rate_per_minute: float = None,
+                  group_rate_per_minute: float = None, max_wait: float = None) -> None:
+        """更新调度参数（已有的令牌桶会被重建）"""
+        with self.condition:
+            if max_concurrent is not None:
+                self.max_concurrent = max(1, int(max_concurrent))
+            if user_rate_per_minute is not None:
+                self.user_rate_per_minute = user_rate_per_minute
+                self.user_buckets.clear()
+            if group_rate_per_minute is not None:
+                self.group_rate_per_minute = group_rate_per_minute
+                self.group_buckets.clear()
+            if max_wait is not None:
+                self.max_wait = max_wait
+            self.condition.notify_all()
+
+    def configure_from(self, configs: dict[str, Any]) -> None:
+        """从插件配置的configs字典更新调度参数"""
+        self.configure(configs.get("max_upstream_concurrency", 4),
+                       configs.get("user_rate_per_minute", 10),
+                       configs.get("group_rate_per_minute", 30))
+
+    def set_weight(self, group_id: str, weight: float) -> None:
+        """设置群的调度权重（默认为1，权重越大分到的上游份额越多）"""
+        with self.condition:
+            self.weights[group_id] = max(weight, 0.01)
+
+    @property
+    def queue_depth(self) -> int:
+        """当前排队等待上游空位的请求数"""
+        return len(self._queue)
+
+    def _bucket(self, buckets: dict[str, TokenBucket], key: str, rate_per_minute: float) -> TokenBucket:
+        bucket = buckets.get(key)
+        if bucket is None:
+            # 桶容量取每分钟配额的1/3（至少1次），允许小幅突发
+            bucket = buckets[key] = TokenBucket(rate_per_minute / 60, max(1.0, rate_per_minute / 3))
+        return bucket
+
+    def _charge(self, requester: Requester) -> None:
+        """按发起者扣除令牌（调用方持有锁）"""
+        if requester.exempt or requester.charged:
+            return
+        checks = []
+        if requester.user_id and self.user_rate_per_minute:
+            checks.append(self._bucket(self.user_buckets, requester.user_id, self.user_rate_per_minute))
+        if requester.group_id and self.group_rate_per_minute:
+            checks.append(self._bucket(self.group_buckets, requester.group_id, self.group_rate_per_minute))
+        # 用户和群的令牌都足够时才一起扣除
+        for bucket in checks:
+            bucket.refill()
+            if bucket.tokens < 1:
+                self.counters["rejected"] += 1
+                raise RateLimited(f"请求过于频繁，请{int(bucket.retry_after()) + 1}秒后再试")
+        for bucket in checks:
+            bucket.try_acquire()
+        requester.charged = True
+
+    def acquire(self) -> None:
+        """为当前上下文的发起者申请一个上游请求空位，必要时排队等待
+
+        Raises:
+            RateLimited: 发起者超出速率，或排队超时
+            DeadlineExceeded: 排队期间当前消息的处理时限用完
+        """
+        requester = _current_requester.get()
+        group = (requester.group_id or requester.user_id or self.SYSTEM_GROUP) if requester else self.SYSTEM_GROUP
+        with self.condition:
+            if requester:
+                self._charge(requester)
+            # 加权公平排队：按虚拟完成时间排序，同一个群的请求依次排在后面
+            start = max(self._virtual_time, self._last_finish.get(group, 0.0))
+            ticket = _Ticket(group, start + 1.0 / self.weights.get(group, 1.0))
+            self._last_finish[group] = ticket.finish
+            entry = (ticket.finish, next(self._seq), ticket)
+            heapq.heappush(self._queue, entry)
+            self.counters["max_queue_depth"] = max(self.counters["max_queue_depth"], len(self._queue))
+            max_wait = wait_limit(self.max_wait)
+            deadline = time.monotonic() + max_wait
+            while not (self.active < self.max_concurrent and self._queue[0][2] is ticket):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._queue.remove(entry)
+                    heapq.heapify(self._queue)
+                    self.counters["timeout"] += 1
+                    self.condition.notify_all()
+                    if max_wait < self.max_wait:
+                        raise DeadlineExceeded("等待上游空位时超过查询时限")
+                    raise RateLimited("上游请求繁忙，请稍后再试")
+                self.condition.wait(remaining)
+            heapq.heappop(self._queue)
+            self._virtual_time = max(self._virtual_time, ticket.finish - 1.0 / self.weights.get(group, 1.0))
+            self.active += 1
+            self.counters["granted"] += 1
+            self.condition.notify_all()
+
+    def release(self) -> None:
+        """释放上游请求空位"""
+        with self.condition:
+            self.active -= 1
+            self.condition.notify_all()
+
+    @contextmanager
+    def upstream_slot(self):
+        """在上游请求期间占用一个空位"""
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict[str, int]:
+        """调度器统计信息"""
+        with self.condition:
+            return {"queue_depth": len(self._queue), "active": self.active, **self.counters}
+
+
+# 创建全局调度器实例
+scheduler = FairScheduler()
+metrics.register_gauge("flashdetail_upstream_queue_depth", "排队等待上游空位的请求数", lambda: scheduler.queue_depth)
+metrics.register_gauge("flashdetail_upstream_active", "进行中的上游请求数", lambda: scheduler.active)
@@ -0,0 +1,247 @@
+import argparse
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+from urllib.parse import parse_qsl, urlsplit
+
+from . import FDQueryMethods
+from .FDMetrics import timed
+from .FDScheduler import Requester, requester_context
+
+# 查询类型 → (查询函数, 参数名)
+QUERY_TYPES: dict[str, tuple[Callable[..., dict], str]] = {
+    "detail": (FDQueryMethods.get_detail, "pn"),
+    "id": (FDQueryMethods.get_detail_from_ID, "id"),
+    "dram": (FDQueryMethods.get_dram_detail, "pn"),
+    "search": (FDQueryMethods.search, "q"),
+    "micron": (FDQueryMethods.parse_micron_pn, "code"),
+    "phison": (FDQueryMethods.parse_phison_pn, "pn"),
+    "filter": (FDQueryMethods.filter_records, "q"),
+}
+
+MAX_BATCH = 200
+MAX_BODY = 1 << 20
+MAX_HEADER = 16 << 10
+KEEP_ALIVE_TIMEOUT = 30
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+def _parse_bool(value) -> Optional[bool]:
+    if isinstance(value, bool) or value is None:
+        return value
+    return str(value).lower() in ("1", "true", "yes", "on")
+
+
+def _options(params: dict) -> dict:
+    """从请求参数中取出查询选项（与聊天命令的 --refresh/--local/--count 对应）"""
+    options = {}
+    for name in ("refresh", "local", "save"):
+        if name in params:
+            options[name] = _parse_bool(params[name])
+    if "count" in params:
+        options["count"] = int(params["count"])
+    return options
+
+
+class QueryService:
+    """HTTP服务的查询执行器：在有界线程池中调用FDQueryMethods，与机器人共用缓存和上游调度"""
+
+    def __init__(self, workers: int = 8, max_batch: int = MAX_BATCH):
+        self.workers = workers
+        self.max_batch = max_batch
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="flashdetail-http")
+        self.semaphore: Optional[asyncio.Semaphore] = None
+
+    def _query(self, query_type: str, arg: str, options: dict, client: str) -> dict:
+        func, _ = QUERY_TYPES[query_type]
+        with timed("http_query", type=query_type), requester_context(Requester(user_id=f"http:{client}", exempt=True)):
+            result = func(arg, **options)
+        accept = result.pop("accept", None)
+        if accept and result.get("result", False):
+            accept()
+        return result
+
+    async def query(self, query_type: str, arg: str, options: dict, client: str = "") -> dict:
+        if query_type not in QUERY_TYPES:
+            return {"result": False, "error": f"未知的查询类型：{query_type}"}
+        if not arg or not arg.strip():
+            return {"result": False, "error": "查询参数不能为空"}
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.workers)
+        async with self.semaphore:
+            try:
+                return await asyncio.get_running_loop().run_in_executor(
+                    self.executor, self._query, query_type, arg.strip(), options, client)
+            except Exception as e:
+                return {"result": False, "error": f"错误：{e}"}
+
+    async def batch(self, queries: list, client: str = "") -> list[dict]:
+        """并发执行多个查询，结果顺序与请求一致"""
+        async def run_one(item) -> dict:
+            if not isinstance(item, dict):
+                return {"result": False, "error": "查询格式错误"}
+            query_type = item.get("type", "detail")
+            param = QUERY_TYPES.get(query_type, (None, "arg"))[1]
+            arg = item.get("arg", item.get(param, ""))
+            try:
+                options = _options(item)
+            except (ValueError, TypeError):
+                # 单条参数错误只影响这一条，不影响整批结果
+                return {"result": False, "error": "count必须为整数"}
+            return await self.query(query_type, str(arg), options, client)
+
+        return await asyncio.gather(*(run_one(item) for item in queries))
+
+    async def handle(self, method: str, target: str, body: bytes, client: str) -> tuple[int, dict]:
+        """处理一个请求
+
+        Returns:
+            (状态码, JSON响应)
+        """
+        parts = urlsplit(target)
+        path = parts.path.rstrip("/") or "/"
+        params = dict(parse_qsl(parts.query))
+        if path in ("/", "/health"):
+            return 200, {"result": True, "types": list(QUERY_TYPES), "workers": self.workers}
+        if path == "/batch":
+            if method != "POST":
+                return 405, {"result": False, "error": "批量查询请使用POST"}
+            try:
+                payload = json.loads(body or b"null")
+            except json.JSONDecodeError as e:
+                return 400, {"result": False, "error": f"JSON格式错误：{e}"}
+            queries = payload.get("queries") if isinstance(payload, dict) else payload
+            if not isinstance(queries, list):
+                return 400, {"result": False, "error": "请求体应为查询列表或 {\"queries\": [...]}"}
+            if len(queries) > self.max_batch:
+                return 413, {"result": False, "error": f"单次最多{self.max_batch}条查询"}
+            return 200, {"result": True, "results": await self.batch(queries, client)}
+
+        query_type = path.lstrip("/")
+        if query_type not in QUERY_TYPES:
+            return 404, {"result": False, "error": f"未知的接口：{path}"}
+        if method == "POST" and body:
+            try:
+                params.update(json.loads(body))
+            except (json.JSONDecodeError, TypeError, ValueError):
+                return 400, {"result": False, "error": "JSON格式错误"}
+        arg = params.get(QUERY_TYPES[query_type][1], params.get("arg", ""))
+        try:
+            options = _options(params)
+        except (ValueError, TypeError):
+            return 400, {"result": False, "error": "count必须为整数"}
+        return 200, await self.query(query_type, str(arg), options, client)
+
+
+class HttpServer:
+    """基于asyncio的最小HTTP/1.1服务器，支持keep-alive"""
+
+    def __init__(self, service: QueryService, host: str = "127.0.0.1", port: int = 8089):
+        self.service = service
+        self.host = host
+        self.port = port
+        self.server: Optional[asyncio.Server] = None
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[tuple[str, str, str, dict, bytes]]:
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEP_ALIVE_TIMEOUT)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+            return None
+        except asyncio.LimitOverrunError:
+            raise ValueError("请求头过长")
+        lines = head.decode("latin-1").split("\r\n")
+        method, target, version = lines[0].split(" ", 2)
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length") or 0)
+        if length > MAX_BODY:
+            raise OverflowError("请求体过大")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target, version, headers, body
+
+    @staticmethod
+    def _keep_alive(version: str, headers: dict) -> bool:
+        connection = headers.get("connection", "").lower()
+        if version == "HTTP/1.0":
+            return connection == "keep-alive"
+        return connection != "close"
+
+    @staticmethod
+    async def _write(writer: asyncio.StreamWriter, status: int, payload: dict, keep_alive: bool) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        head = (f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                "Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+                + (f"Keep-Alive: timeout={KEEP_ALIVE_TIMEOUT}\r\n" if keep_alive else "")
+                + "\r\n")
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        peer = writer.get_extra_info("peername")
+        client = peer[0] if peer else ""
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except (ValueError, OverflowError) as e:
+                    await self._write(writer, 413 if isinstance(e, OverflowError) else 400,
+                                      {"result": False, "error": str(e)}, False)
+                    break
+                if request is None:
+                    break
+                method, target, version, headers, body = request
+                keep_alive = self._keep_alive(version, headers)
+                if method not in ("GET", "POST"):
+                    status, payload = 405, {"result": False, "error": "只支持GET和POST"}
+                else:
+                    try:
+                        status, payload = await self.service.handle(method, target, body, client)
+                    except Exception as e:
+                        status, payload = 500, {"result": False, "error": f"处理错误：{e}"}
+                await self._write(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port, limit=MAX_HEADER)
+
+    async def serve_forever(self) -> None:
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+
+def run_server(host: str = "127.0.0.1", port: int = 8089, workers: int = 8) -> None:
+    """启动HTTP查询服务（阻塞直到中断）"""
+    server = HttpServer(QueryService(workers), host, port)
+    print(f"FlashDetail查询服务已启动: http://{host}:{port}/（接口：{'/'.join(QUERY_TYPES)}/batch）")
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="FlashDetail HTTP查询服务")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8089, help="监听端口")
+    parser.add_argument("--workers", type=int, default=8, help="同时执行的查询数上限")
+    args = parser.parse_args(argv)
+    run_server(args.host, args.port, args.workers)
+
+
+if __name__ == "__main__":
+    main()
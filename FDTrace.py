@@ -0,0 +1,135 @@
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+# 单条说明文字在瀑布图中的最大长度
+MAX_NOTE_LENGTH = 120
+
+
+class Span:
+    """一段带时间戳的处理过程"""
+
+    __slots__ = ("name", "attrs", "depth", "start", "end")
+
+    def __init__(self, name: str, depth: int, start: float, attrs: dict):
+        self.name = name
+        self.attrs = attrs
+        self.depth = depth
+        self.start = start
+        self.end: Optional[float] = None
+
+    def set(self, **attrs) -> None:
+        """补充记录属性（如是否命中、状态码）"""
+        self.attrs.update(attrs)
+
+
+class _NullSpan:
+    """未开启追踪时使用的空span，所有操作均为空操作"""
+
+    __slots__ = ()
+
+    def set(self, **attrs) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Trace:
+    """一次查询的追踪记录，按开始顺序保存所有span和事件"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans: list[Span] = []
+        self.depth = 0
+
+    def render(self) -> str:
+        """渲染为紧凑的瀑布图文本
+
+        每行格式：开始偏移 耗时 名称 属性，子过程按层级缩进，事件没有耗时
+        """
+        end = max([self.start] + [s.end if s.end is not None else s.start for s in self.spans])
+        lines = [f"追踪（共{(end - self.start) * 1000:.1f}ms）："]
+        for s in self.spans:
+            offset = f"+{(s.start - self.start) * 1000:.1f}"
+            duration = f"{(s.end - s.start) * 1000:.1f}ms" if s.end is not None else "·"
+            attrs = " ".join(f"{k}={v}" for k, v in s.attrs.items())
+            lines.append(f"{offset:>8} {duration:>9} {'  ' * s.depth}{s.name}{' ' + attrs if attrs else ''}")
+        return "\n".join(lines)
+
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("flashdetail_trace", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def start_trace():
+    """在当前上下文中开启一次追踪
+
+    Returns:
+        Trace实例，with块结束后可调用render()获取瀑布图
+    """
+    trace = Trace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """记录一段处理过程，未开启追踪时几乎没有开销
+
+    Args:
+        name: 过程名称
+        **attrs: 附加属性（显示在瀑布图中）
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield _NULL_SPAN
+        return
+    s = Span(name, trace.depth, time.perf_counter(), attrs)
+    trace.spans.append(s)
+    trace.depth += 1
+    try:
+        yield s
+    except BaseException as e:
+        s.set(error=type(e).__name__)
+        raise
+    finally:
+        trace.depth -= 1
+        s.end = time.perf_counter()
+
+
+def add_span(name: str, seconds: float, **attrs) -> None:
+    """补记一段刚刚结束、耗时为seconds的过程"""
+    trace = _current_trace.get()
+    if trace is not None:
+        end = time.perf_counter()
+        s = Span(name, trace.depth, end - seconds, attrs)
+        s.end = end
+        trace.spans.append(s)
+
+
+def event(name: str, **attrs) -> None:
+    """记录一个没有耗时的事件（如回退分支、重试）"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.spans.append(Span(name, trace.depth, time.perf_counter(), attrs))
+
+
+def note(message) -> None:
+    """调试信息：开启追踪时记入瀑布图，否则打印到控制台"""
+    trace = _current_trace.get()
+    if trace is None:
+        print(message)
+        return
+    text = str(message)
+    if len(text) > MAX_NOTE_LENGTH:
+        text = text[:MAX_NOTE_LENGTH] + "…"
+    trace.spans.append(Span(f"# {text}", trace.depth, time.perf_counter(), {}))
@@ -1,10 +1,24 @@
+import asyncio
+import os
+import time
 import requests
 import re
 import shlex
 from nonebot.exception import FinishedException
 from .FDConfig import config_instance as plugin_config
 from . import FDQueryMethods
+from . import FDPrefetch
+from . import FDDatabaseTransfer
+from . import FDMetrics
+from . import FDTrace
+from . import FDProfiler
+from . import FDCanonical
+from . import FDDeadline
+from .FDRouter import query_router, message_router, QUERY_TOKENS
+from .FDScheduler import scheduler, Requester, requester_context
+from .FDHttpCache import http_cache
 from .FDJsonDatabase import db_instance
+from .FDAccessLog import access_log
 import urllib3
 # 插件版本信息
 PLUGIN_VERSION = "4.3.0"
@@ -13,18 +27,24 @@ PLUGIN_VERSION = "4.3.0"
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 try:
     from nonebot import *
-    from nonebot.adapters import Event, Message
-    from nonebot.rule import startswith
+    from nonebot.adapters import Bot, Event, Message
     from nonebot.params import CommandArg
     from nonebot.adapters.onebot.v11 import Event as V11Event
     from nonebot.adapters.onebot.v11 import Bot as V11Bot
 
+    scheduler.configure_from(plugin_config.configs)
+    http_cache.configure_from(plugin_config.configs)
+    FDPrefetch.speculative.configure_from(plugin_config.configs)
+    db_instance.configure_from(plugin_config.configs)
+    if plugin_config.configs.get("metrics_port"):
+        FDMetrics.start_exporter(plugin_config.configs["metrics_port"])
+
     async def is_enabled_for(event: Event) -> bool:
-        return plugin_config.is_valid_user(event.get_session_id().split("_"))
+        return plugin_config.is_valid_session(event.get_session_id())
 
 
     def is_admin(user_id: str) -> bool:
-        return user_id in plugin_config.admin_users
+        return plugin_config.is_admin(user_id)
 
 
     def is_owner(user_id: str) -> bool:
@@ -41,6 +61,7 @@ FlashDetail插件使用说明
     ID <id> - 根据闪存ID查询详细信息
     查 <料号> - 查询闪存详情，支持部分料号搜索，自动尝试搜索和Micron料号解析
     搜 <关键词> - 搜索相关料号
+    筛 <条件...> - 按属性筛选已缓存的料号，如：筛 BiCS5 TLC 1Tb、筛 3DV6 海力士、筛 DDR4 die=2
     查DRAM <料号/ID> - 查询DRAM内存信息
     撤回 - 回复消息并发送此命令可撤回被回复消息（非管理员只能撤回自己的消息）
     /micron <料号> - 解析镁光BGA CODE料号获取完整料号
@@ -55,7 +76,8 @@ FlashDetail插件使用说明
 
     提示：
     - 所有查询命令均可添加 --refresh 参数强制刷新缓存
-    - 所有查询命令均可添加 --debug 参数显示调试信息
+    - 所有查询命令均可添加 --debug 参数显示调试信息和各阶段耗时
+    - 所有查询命令均可添加 --trace 参数只显示各阶段耗时（缓存、上游请求、回退分支）
     - 所有查询命令均可添加 --url 参数指定查询api地址
     - 所有非"无结果"的查询结果会自动缓存，提高后续查询速度"""
     
@@ -67,6 +89,9 @@ FlashDetail插件使用说明
     /blacklist add/list/remove - 管理黑名单用户/群组
     /api - 显示api相关信息（具体用法使用/api help）
     /config - 管理插件配置（仅所有者可用）
+    /prefetch - 批量预取料号到缓存
+    /database - 编辑、导出、导入缓存数据库
+    /progressive - 设置群的渐进式回复（先回复本地结果，再补充联网结果）
 
     白名单/黑名单命令格式：
         /whitelist add user/group <id> - 添加用户/群组到白名单
@@ -83,7 +108,25 @@ FlashDetail插件使用说明
 
     快捷封禁/解封命令：
         /ban <user_id> - 将用户加入黑名单（不能封禁管理员）
-        /pardon <user_id> - 将用户从黑名单移除"""
+        /pardon <user_id> - 将用户从黑名单移除
+
+    数据库命令格式：
+        /database add/replace/remove <表名.主键> <字段> <值> - 编辑单条记录
+        /database export [表名...] - 按表导出为JSONL（data/export/<表名>.jsonl）
+        /database import <文件> [newest/keep/union] - 导入JSONL并合并（默认较新者胜出）
+        /database alias add <表名> <别名> <料号> - 把其他写法/商品名指向已缓存的料号
+        /database alias remove <表名> <别名> | list [表名] - 删除/列出别名
+        /database pin/unpin <表名.主键> - 固定/取消固定记录（编辑过的记录自动固定，不会因容量上限被淘汰）
+        /database capacity [<表名> <记录数>] - 查看/设置表的容量上限（0表示不限，超出时淘汰访问最少的记录）
+
+    预取命令格式：
+        /prefetch <前缀...> [--limit=N] [--hot=N] [--refresh] [--restart] - 按前缀枚举料号并预取（默认从断点继续）
+        /prefetch status - 显示预取进度
+        /prefetch stop - 停止预取
+
+    渐进式回复命令格式：
+        /progressive on/off [群号] - 为群开启/关闭渐进式回复（群内使用时可省略群号）
+        /progressive list - 列出已开启的群"""
     
     # 所有者帮助文本（仅所有者可见）
     OWNER_HELP_TEXT = """
@@ -93,7 +136,13 @@ FlashDetail插件使用说明
     /op <user_id> - 设置指定用户为管理员
     /deop <user_id> - 移除用户的管理员权限
     /reload - 重载插件
+    /profile - 对运行中的插件进行栈采样
+
 
+    性能采样命令格式：
+        /profile start <秒数> [--rate=每秒次数] [--idle] - 采样指定时长，结果保存到data/profile_*.folded
+        /profile stop - 提前结束采样
+        /profile status - 显示最近一次采样结果
 
     管理员命令格式：
         /admin add <user_id> - 添加管理员
@@ -107,8 +156,8 @@ FlashDetail插件使用说明
     whitelist_cmd = on_command("whitelist", priority=1, rule=is_enabled_for, block=False)
     blacklist_cmd = on_command("blacklist", priority=1, rule=is_enabled_for, block=False)
     admin_cmd = on_command("admin", priority=1, rule=is_enabled_for, block=False)  # 管理员管理命令 
-    listened_commands = startswith(("ID", "DRAM", "查", "搜","/micron","/phison"), ignorecase=True)
-    MessageHandler = on_message(priority=10, rule=is_enabled_for & listened_commands, block=False)
+    # 所有普通消息（查询、撤回、喵、复读）由同一个分发器处理，每条消息只解析一次
+    dispatcher = on_message(priority=10, rule=is_enabled_for, block=False)
     help_cmd = on_command("help", priority=1, rule=is_enabled_for, block=False)
     api_cmd = on_command("api", priority=1, rule=is_enabled_for, block=False)
     reload_cmd = on_command("reload", priority=1, rule=is_enabled_for, block=False)
@@ -123,9 +172,9 @@ FlashDetail插件使用说明
     refresh_cmd = on_command("refresh", priority=1, rule=is_enabled_for, block=False)
     config_cmd = on_command("config", priority=1, rule=is_enabled_for, block=False)
     database_cmd = on_command("database", priority=1, rule=is_enabled_for, block=False)
-    喵 = on_message(priority=10, rule=is_enabled_for, block=False)
-    repeater = on_message(priority=10, rule=is_enabled_for, block=False)
-    撤回_cmd = on_message(priority=10, rule=is_enabled_for, block=False)
+    prefetch_cmd = on_command("prefetch", priority=1, rule=is_enabled_for, block=False)
+    profile_cmd = on_command("profile", priority=1, rule=is_enabled_for, block=False)
+    progressive_cmd = on_command("progressive", priority=1, rule=is_enabled_for, block=False)
     whoami_cmd = on_command("whoami", priority=1, block=False)
 
     # 查看当前用户ID
@@ -136,67 +185,65 @@ FlashDetail插件使用说明
 
     def is_key_word(message_text:str) -> bool:
         return message_text.strip() and any([i in message_text.lower() for i in ["撤回","/","查","id"]])
-    # 撤回
-    @撤回_cmd.handle()
-    async def 撤回(event: V11Event, bot: V11Bot):
-        
-        # 获取消息内容
-        message_text = event.get_message().extract_plain_text().strip()
-        
-        # 检查是否包含"撤回"关键词
-        if "撤回" != message_text:
-            return
 
-        print(event.reply)
+    # 消息分发：解析一次命令前缀，再交给对应的处理函数
+    @dispatcher.handle()
+    async def dispatch_handler(event: Event, bot: Bot):
+        text = event.get_message().extract_plain_text()
+        stripped = text.strip()
+        command = message_router.match(stripped)
+        if command and command.token in QUERY_TOKENS:
+            await message_handler(event, stripped)
+        elif command and command.token == "撤回" and not command.rest:
+            await 撤回(event, bot)
+        elif not is_key_word(text):
+            await repeater_handler(event, text)
+        if plugin_config.configs["cat"] and "喵" in text:
+            await 喵_handler(text)
+
+    # 撤回
+    async def 撤回(event: Event, bot: Bot):
+        reply = getattr(event, "reply", None)
         # 检查是否是回复消息
-        if event.reply:
+        if reply:
             # 获取被回复的消息ID
-            reply_message_id = event.reply.message_id
-            print(is_admin(event.get_user_id()))
-            print(event.get_user_id(), event.reply.sender.user_id)
+            reply_message_id = reply.message_id
             # 检查是否是管理员或者撤回目标是用户自己的消息
-            if not (is_admin(event.get_user_id()) or str(event.get_user_id()) == str(event.reply.sender.user_id)):
+            if not (is_admin(event.get_user_id()) or str(event.get_user_id()) == str(reply.sender.user_id)):
                 return
             try:
                 # 尝试撤回消息
                 await bot.delete_msg(message_id=reply_message_id)
             except Exception as e:
                 # 撤回失败（可能没有权限）
-                await 撤回_cmd.send(f"撤回失败，可能没有权限：{str(e)}")
+                await dispatcher.send(f"撤回失败，可能没有权限：{str(e)}")
     
 
     last_message:dict[str,list[str,int]] = {}  # 格式：{session_id: [last_message, times]}
 
     # 复读机
-    @repeater.handle()
-    async def repeater_handler(event: Event):
-        if(is_key_word(event.get_message().extract_plain_text())):
-            return
+    async def repeater_handler(event: Event, text: str):
         session_id = event.get_session_id().split("_")
         if(session_id[0]!="group"):
             return
         session_id=session_id[1]
-        if(event.get_message().extract_plain_text() == last_message.get(session_id,[None,0])[0]):
+        if(text == last_message.get(session_id,[None,0])[0]):
             last_message[session_id][1] += 1
         else:
-            last_message[session_id] = [event.get_message().extract_plain_text(), 1]
-        if(plugin_config.configs["repeater"] and last_message[session_id][1]==plugin_config.configs["repeater"]):
-            (await repeater.finish(last_message[session_id][0])) if last_message[session_id][0] else repeater.finish()
+            last_message[session_id] = [text, 1]
+        if(plugin_config.configs["repeater"] and last_message[session_id][1]==plugin_config.configs["repeater"] and text):
+            await dispatcher.send(text)
 
 
     # 喵喵喵
-    @喵.handle()
-    async def 喵_handler(event: Event):
-        text=event.get_message().extract_plain_text()
-        if(plugin_config.configs["cat"] and "喵" in text):
-            args = text.split("--")
-            args = [arg.strip() for arg in args]
-            #从args中找count开头的参数
-            count = next(int(arg.split("=")[1]) for arg in args if arg.startswith("count")) if any(arg.startswith("count") for arg in args) else 1
-            times = next(int(arg.split("=")[1]) for arg in args if arg.startswith("times")) if any(arg.startswith("times") for arg in args) else 1
-            for i in range(times):
-                await 喵.send("喵"*count)
-        await 喵.finish()
+    async def 喵_handler(text: str):
+        args = text.split("--")
+        args = [arg.strip() for arg in args]
+        #从args中找count开头的参数
+        count = next(int(arg.split("=")[1]) for arg in args if arg.startswith("count")) if any(arg.startswith("count") for arg in args) else 1
+        times = next(int(arg.split("=")[1]) for arg in args if arg.startswith("times")) if any(arg.startswith("times") for arg in args) else 1
+        for i in range(times):
+            await dispatcher.send("喵"*count)
 
     def parse_config_value(value: str) -> Any:
         if value.lower() in ["true", "yes"]:
@@ -227,11 +274,18 @@ FlashDetail插件使用说明
             await config_cmd.finish(result)
         
         # 设置其他配置项
+        elif args[0] == "db_table_capacity":
+            await config_cmd.finish("请使用 /database capacity <表名> <记录数> 设置表的容量上限")
+
         elif args[0] in plugin_config.configs.keys():
             value = parse_config_value(args[1].lower())
             if type(value) == type(plugin_config.configs[args[0]]):
                 plugin_config.configs[args[0]] = value
                 plugin_config.save_all()
+                scheduler.configure_from(plugin_config.configs)
+                http_cache.configure_from(plugin_config.configs)
+                FDPrefetch.speculative.configure_from(plugin_config.configs)
+                db_instance.configure_from(plugin_config.configs)
                 await config_cmd.finish(f"已设置{args[0]}为{value}")
             
             else:
@@ -269,6 +323,19 @@ FlashDetail插件使用说明
         status_info.append(f"白名单群组数: {len(plugin_config.whitelist_group)}")
         status_info.append(f"黑名单用户数: {len(plugin_config.blacklist_user)}")
         status_info.append(f"黑名单群组数: {len(plugin_config.blacklist_group)}")
+        scheduler_stats = scheduler.stats()
+        status_info.append(f"上游请求：进行中{scheduler_stats['active']}，排队{scheduler_stats['queue_depth']}"
+                           f"（峰值{scheduler_stats['max_queue_depth']}），已限流{scheduler_stats['rejected']}")
+        if http_cache.enabled:
+            status_info.append(http_cache.summary())
+        if db_instance.capacities:
+            status_info.append(f"数据库容量: {db_instance.capacity_summary()}")
+        if FDPrefetch.speculative.top_n:
+            status_info.append(FDPrefetch.speculative.summary())
+        latency_summary = FDMetrics.metrics.summary()
+        if latency_summary:
+            status_info.append("耗时统计（最近样本）：")
+            status_info.extend(latency_summary)
         
         await status_cmd.finish("\n".join(status_info))
     
@@ -312,17 +379,53 @@ FlashDetail插件使用说明
         await help_cmd.finish(help_text)
 
 
+    # 渐进式回复的查询命令（有本地解码或缓存可以先回复）
+    PROGRESSIVE_TOKENS = ("查", "id", "dram")
+
     # 消息命令
-    @MessageHandler.handle()
-    async def message_handler(foo: Event):
+    async def message_handler(foo: Event, text: str):
         # 不再需要单独检查用户有效性，因为is_enabled_for规则已经做了检查
-        result = get_message_result(foo.get_plaintext())
+        requester = Requester.from_session_id(foo.get_session_id(), exempt=is_admin(foo.get_user_id()))
+
+        def run_query(local: bool | None = None, quick: bool = False) -> str:
+            # 在工作线程中查询，避免上游请求和限流排队阻塞事件循环
+            with requester_context(requester):
+                return get_message_result(text, local, quick)
+
+        command = query_router.match(text)
+        if (command and command.token in PROGRESSIVE_TOKENS and plugin_config.is_progressive(foo.get_session_id())
+                and "--local" not in text and "--online" not in text):
+            await progressive_reply(command.token, run_query)
+            return
+        result = await asyncio.to_thread(run_query)
         if result and result[-1] == '\n':
             result = result[:-1]
         if result: 
-            await MessageHandler.finish(result)
-        else:
-            await MessageHandler.finish()
+            await dispatcher.send(result)
+
+
+    async def progressive_reply(token: str, run_query) -> None:
+        """渐进式回复：先回复缓存或本地解码的结果，联网结果返回后只补充新增的内容
+
+        OneBot不支持编辑已发送的消息，补充内容作为新消息发送。
+        第一轮不回退到搜索/容错匹配，避免先回复另一个料号；两轮解析到的料号不同时完整发送第二轮结果。
+        ID查询的第二轮强制联网解码（否则本地解码成功时不会联网），其他查询照常先查缓存。
+        """
+        quick = await asyncio.to_thread(run_query, True, True)
+        if is_answer(quick):
+            await dispatcher.send(quick.rstrip("\n"))
+        full = await asyncio.to_thread(run_query, False if token == "id" else None)
+        if not is_answer(full):
+            if not is_answer(quick) and full and full.strip():
+                await dispatcher.send(full.rstrip("\n"))
+            return
+        if not is_answer(quick) or resolved_part_number(quick) != resolved_part_number(full):
+            await dispatcher.send(full.rstrip("\n"))
+            return
+        sent = set(quick.splitlines())
+        extra = [line for line in full.splitlines() if line.strip() and line not in sent]
+        if extra:
+            await dispatcher.send("补充信息：\n" + "\n".join(extra))
 
 
     # API命令
@@ -556,6 +659,14 @@ FlashDetail插件使用说明
             return
         
         args = shlex.split(args_text)
+        if args[0].lower() in ("export", "import"):
+            await database_cmd.finish(await asyncio.to_thread(handle_database_transfer, args))
+        if args[0].lower() == "alias":
+            await database_cmd.finish(handle_alias_command(args[1:]))
+        if args[0].lower() in ("pin", "unpin"):
+            await database_cmd.finish(handle_pin_command(args[0].lower(), args[1:]))
+        if args[0].lower() == "capacity":
+            await database_cmd.finish(handle_capacity_command(args[1:]))
         if len(args) < 2:
             await database_cmd.finish("参数不足，请输入完整命令格式")
             return
@@ -590,7 +701,7 @@ FlashDetail插件使用说明
             
             try:
                 # 获取现有记录
-                existing_record = db_instance.get(table, pk)
+                existing_record = db_instance.peek(table, pk)
                 new_record = existing_record.copy() if existing_record else {}
                 
                 if action == "add":
@@ -602,6 +713,9 @@ FlashDetail插件使用说明
                 if action == "replace":
                     new_record[key] = value
                 
+                # 管理员编辑过的记录不参与容量淘汰
+                new_record["pinned"] = True
+                
                 # 保存更新后的记录
                 success = db_instance.set(table, pk, new_record)
                 if success:
@@ -646,7 +760,7 @@ FlashDetail插件使用说明
                 key = args[2]
                 
                 # 获取现有记录
-                existing_record = db_instance.get(table, pk)
+                existing_record = db_instance.peek(table, pk)
                 if not existing_record:
                     await database_cmd.finish(f"操作失败：{table}.{pk} 不存在")
                     return
@@ -656,9 +770,11 @@ FlashDetail插件使用说明
                     return
                 
                 # 删除字段
+                existing_record = existing_record.copy()
                 del existing_record[key]
                 
                 if existing_record:
+                    existing_record["pinned"] = True
                     # 保存更新后的记录
                     success = db_instance.set(table, pk, existing_record)
                     if success:
@@ -677,6 +793,196 @@ FlashDetail插件使用说明
             except Exception as e:
                 await database_cmd.finish(f"操作失败：{str(e)}")
 
+    prefetch_job: FDPrefetch.PrefetchJob | None = None
+
+    # 缓存预取命令（仅管理员可用）
+    @prefetch_cmd.handle()
+    async def prefetch_handler(event: Event, arg: Message = CommandArg()):
+        global prefetch_job
+        user_id = event.get_user_id()
+        if not is_admin(user_id):
+            return
+        args = [a.strip() for a in arg.extract_plain_text().split("--")]
+        targets = args[0].split()
+        options = args[1:]
+        running = prefetch_job is not None and prefetch_job.running
+
+        if targets and targets[0].lower() == "status":
+            await prefetch_cmd.finish(prefetch_job.summary() if prefetch_job else "当前没有预取任务")
+        if targets and targets[0].lower() == "stop":
+            if not running:
+                await prefetch_cmd.finish("当前没有正在运行的预取任务")
+            prefetch_job.stop()
+            await prefetch_cmd.finish("已请求停止预取，进度已保存")
+        if running:
+            await prefetch_cmd.finish(f"已有预取任务正在运行\n{prefetch_job.summary()}")
+
+        def get_option(name: str, default: int) -> int:
+            value = "".join([(o.split("=")[-1].strip() if o.startswith(name) else "") for o in options])
+            return int(value) if value.isdigit() else default
+
+        hot = get_option("hot", 0)
+        if not targets and not hot:
+            await prefetch_cmd.finish("请指定料号前缀，例如：/prefetch MT29F K9 TH58 --limit=50")
+        prefetch_job = FDPrefetch.PrefetchJob(targets, limit=get_option("limit", 50), hot=hot,
+                                              concurrency=get_option("concurrency", 4),
+                                              refresh="refresh" in options, resume="restart" not in options)
+        await prefetch_cmd.send("开始预取，完成后会提醒")
+        await asyncio.to_thread(prefetch_job.run)
+        await prefetch_cmd.finish(f"预取完成\n{prefetch_job.summary()}")
+
+    # 渐进式回复设置
+    @progressive_cmd.handle()
+    async def progressive_handler(event: Event, arg: Message = CommandArg()):
+        if not is_admin(event.get_user_id()):
+            return
+        args = arg.extract_plain_text().strip().split()
+        await progressive_cmd.finish(handle_progressive_command(args, event.get_session_id()))
+
+    # 性能采样命令（仅所有者可用）
+    @profile_cmd.handle()
+    async def profile_handler(event: Event, arg: Message = CommandArg()):
+        if not is_owner(event.get_user_id()):
+            await profile_cmd.finish("权限不足，只有所有者可以进行性能采样")
+        args = [a.strip() for a in arg.extract_plain_text().split("--")]
+        targets = args[0].split()
+        options = args[1:]
+        profiler = FDProfiler.profiler
+
+        if not targets or targets[0].lower() == "status":
+            if profiler.running:
+                await profile_cmd.finish("正在采样中")
+            await profile_cmd.finish(profiler.summary() if profiler.started else "还没有进行过采样")
+        if targets[0].lower() == "stop":
+            if not profiler.running:
+                await profile_cmd.finish("当前没有正在进行的采样")
+            profiler.stop()
+            await profile_cmd.finish("已请求结束采样")
+        if targets[0].lower() != "start":
+            await profile_cmd.finish("用法：/profile start <秒数> [--rate=每秒次数] [--idle]")
+        if profiler.running:
+            await profile_cmd.finish("已有采样正在进行")
+
+        seconds = targets[1] if len(targets) > 1 else "10"
+        rate = "".join([(o.split("=")[-1].strip() if o.startswith("rate") else "") for o in options])
+        if not seconds.isdigit() or not 0 < int(seconds) <= 600:
+            await profile_cmd.finish("采样时长必须为1~600秒")
+        profiler.start(int(seconds), rate=int(rate) if rate.isdigit() else 200, include_idle="idle" in options)
+        await profile_cmd.send(f"开始采样{seconds}秒")
+        await asyncio.to_thread(profiler.join)
+        path = profiler.save()
+        await profile_cmd.finish(f"{profiler.summary()}\n折叠栈已保存到 {os.path.relpath(path, os.path.dirname(__file__))}")
+
+    def handle_database_transfer(args: list) -> str:
+        """处理数据库导出/导入命令"""
+        if args[0].lower() == "export":
+            tables = args[1:] or None
+            result = FDDatabaseTransfer.export_database(FDDatabaseTransfer.EXPORT_DIR, tables)
+            if not result:
+                return "没有可导出的表"
+            return f"已导出到 {FDDatabaseTransfer.EXPORT_DIR}：\n" + "\n".join([f"{table}: {count}条" for table, count in result.items()])
+
+        if len(args) < 2:
+            return "导入命令格式：/database import <文件> [newest/keep/union]"
+        path = args[1] if os.path.isabs(args[1]) else os.path.join(FDDatabaseTransfer.EXPORT_DIR, args[1])
+        strategy = args[2].lower() if len(args) > 2 else "newest"
+        if not os.path.exists(path):
+            return f"文件不存在：{path}"
+        try:
+            stats = FDDatabaseTransfer.import_table(path, strategy=strategy)
+        except ValueError as e:
+            return str(e)
+        return f"导入完成：读取{stats['read']}条，写入{stats['written']}条，未改变{stats['skipped']}条"
+
+    def handle_pin_command(action: str, args: list) -> str:
+        """固定/取消固定记录（固定的记录不会因表容量上限被淘汰）"""
+        if len(args) != 1 or "." not in args[0]:
+            return f"{action}命令格式：/database {action} <表名.主键>"
+        table, pk = args[0].split(".", 1)
+        record = db_instance.peek(table, pk)
+        if not record:
+            return f"操作失败：记录 {table}.{pk} 不存在"
+        record = record.copy()
+        if action == "pin":
+            record["pinned"] = True
+        else:
+            record.pop("pinned", None)
+        db_instance.set(table, pk, record)
+        return f"已{'固定' if action == 'pin' else '取消固定'} {table}.{pk}"
+
+    def handle_capacity_command(args: list) -> str:
+        """查看/设置表的容量上限（写入配置的db_table_capacity并立即生效）"""
+        capacities = plugin_config.configs.setdefault("db_table_capacity", {})
+        if not args:
+            return "表容量上限（0表示不限）：\n" + "\n".join(f"{table}: {capacity}" for table, capacity in capacities.items())
+        if len(args) != 2 or not args[1].isdigit():
+            return "容量命令格式：/database capacity <表名> <记录数>（0表示不限）"
+        table_name, capacity = args[0], int(args[1])
+        if table_name not in capacities and table_name not in db_instance.data:
+            return f"未知的表：{table_name}"
+        capacities[table_name] = capacity
+        plugin_config.save_all()
+        db_instance.configure_from(plugin_config.configs)
+        if not capacity:
+            return f"已取消{table_name}的容量上限"
+        return f"已将{table_name}的容量上限设为{capacity}条，当前{len(db_instance.data.get(table_name, {}))}条"
+
+    def handle_alias_command(args: list) -> str:
+        """处理别名命令（别名和目标都会先规范化）"""
+        if not args or args[0].lower() == "list":
+            table_name = args[1] if len(args) > 1 else None
+            items = FDCanonical.aliases.items(table_name)
+            if not items:
+                return "没有别名"
+            return f"别名（{len(items)}条）：\n" + "\n".join(
+                f"{table}: {alias} -> {target}（{source}）" for table, alias, target, source in items[:50])
+        operation = args[0].lower()
+        if operation == "add" and len(args) == 4:
+            table_name, alias, target = args[1], args[2], args[3]
+            if table_name not in FDCanonical.CANONICALIZERS:
+                return f"未知的表：{table_name}"
+            alias = FDCanonical.canonical_key(table_name, alias, resolve_alias=False)
+            target = FDCanonical.canonical_key(table_name, target)
+            if not db_instance.peek(table_name, target):
+                return f"{table_name}中没有{target}的记录"
+            if FDCanonical.aliases.add(table_name, alias, target, source="admin"):
+                return f"已添加别名：{table_name}: {alias} -> {target}"
+            return "别名未改变"
+        if operation == "remove" and len(args) == 3:
+            alias = FDCanonical.canonical_key(args[1], args[2], resolve_alias=False)
+            if FDCanonical.aliases.remove(args[1], alias):
+                return f"已删除别名：{args[1]}: {alias}"
+            return "别名不存在"
+        return "别名命令格式：/database alias add <表名> <别名> <料号> | remove <表名> <别名> | list [表名]"
+
+    def handle_progressive_command(args: list, session_id: str) -> str:
+        """处理渐进式回复设置命令"""
+        if not args or args[0].lower() == "list":
+            groups = plugin_config.progressive_group
+            result = ["渐进式回复已开启的群："]
+            result.extend([f"- {id_}" for id_ in groups]) if groups else result.append("(空)")
+            if plugin_config.configs.get("progressive_reply", False):
+                result.append("（配置项progressive_reply已为所有会话开启）")
+            return "\n".join(result)
+        operation = args[0].lower()
+        if operation not in ("on", "off"):
+            return f"未知操作：{operation}，支持on/off/list"
+        parts = session_id.split("_")
+        group_id = args[1].strip() if len(args) > 1 else (parts[1] if len(parts) >= 3 and parts[0] == "group" else None)
+        if not group_id:
+            return f"请指定群号：/progressive {operation} <群号>"
+        groups = plugin_config.progressive_group
+        if operation == "on":
+            if group_id in groups:
+                return f"群{group_id}已开启渐进式回复"
+            groups.append(group_id)
+        else:
+            if group_id not in groups:
+                return f"群{group_id}未开启渐进式回复"
+            groups.remove(group_id)
+        plugin_config.save_all()
+        return f"已为群{group_id}{'开启' if operation == 'on' else '关闭'}渐进式回复"
+
     def handle_list_command(list_type: str, args: list) -> str:
         """处理黑白名单命令"""
         # 如果没有参数，默认执行list操作
@@ -838,6 +1144,9 @@ def classification(arg: dict[str, int]) -> str:
 def flashId(arg: list[str]) -> str:
     return "" if not arg else f"{translations['availableID']}{', '.join(arg)}\n"
 
+def availablePn(arg: list[str]) -> str:
+    return "" if not arg else f"{translations['availablePn']}{', '.join(arg)}\n"
+
 
 translations = {
     "id": "", "vendor": "厂商：", "die": "Die数量：", "plane": "平面数：","totalPlane": "总平面数/Ce：",
@@ -849,12 +1158,13 @@ translations = {
     "vendor_code": "厂商代码：","version": "版本：","width": "位宽："
 }
 
-data_parsers = {"classification": classification, "flashId": flashId}
+data_parsers = {"classification": classification, "flashId": flashId, "availablePn": availablePn}
 
 
 def result_to_text(arg: dict, debug: bool=False, **kwargs) -> str:
     if not arg.get("result", False):
         return f"未能查询到结果：{arg.get('error', '未知错误')+"" if not debug else str(arg)}"
+    render_start = time.perf_counter()
     result = ""
     data=arg.get("data", {})
     if isinstance(data,dict):
@@ -875,6 +1185,7 @@ def result_to_text(arg: dict, debug: bool=False, **kwargs) -> str:
             result=""
     elif isinstance(data, list) and data:
         result += f"{translations['availablePn']}{', '.join(data)}\n"
+    FDMetrics.observe_stage("render", time.perf_counter() - render_start)
     return result
 
 def all_numbers_alpha(string: str) -> bool:
@@ -888,6 +1199,9 @@ def ID(arg: str, **kwargs) -> str:
     result = result_to_text(raw_result, **kwargs)
     if result and "accept" in raw_result:
         raw_result["accept"]()
+    if result and kwargs.get("local") is not True:
+        # 用户接下来多半会查询其中的料号，在后台先取到缓存中
+        FDPrefetch.speculative.submit('flash_detail', raw_result["data"].get("availablePn") or [])
     if not result and len(arg)>3:
         if all_numbers_alpha(arg):
             result = "无结果"
@@ -904,19 +1218,33 @@ def 查(arg: str, retry: bool=True, **kwargs) -> str:
         phison=phison_handler(arg, **kwargs)
         if phison and not phison.startswith("无结果"):
             return phison
+    access_log.record('flash_detail', arg)
+    FDPrefetch.speculative.record_query('flash_detail', FDCanonical.canonical_key('flash_detail', arg))
     raw_result=FDQueryMethods.get_detail(arg=arg, **kwargs)
     result = result_to_text(raw_result, **kwargs)
     if result and "accept" in raw_result:
         raw_result["accept"]()
-    if not result and retry:
-        search_result = FDQueryMethods.search(arg=arg, **kwargs)
+    # 查不到（包括接口返回未找到）时才回退到搜索
+    if retry and not is_answer(result):
+        # 先在本地缓存中按子串搜索（输入不完整），找不到再容错匹配（输入有错字），最后请求远程搜索
+        with FDTrace.span("fallback", branch="local"):
+            search_result = FDQueryMethods.search_local_database(arg, debug=kwargs.get("debug", False))
+        if not search_result.get("result", False):
+            with FDTrace.span("fallback", branch="fuzzy"):
+                search_result = FDQueryMethods.search_fuzzy(arg, count=1, debug=kwargs.get("debug", False))
+        if not search_result.get("result", False) and kwargs.get("local") is not True:
+            with FDTrace.span("fallback", branch="search"):
+                search_result = FDQueryMethods.search(arg=arg, **{**kwargs, "local": False})
         if search_result.get("result", False) and search_result.get("data", []):
+            FDDeadline.add_partial(f"可能的料号：{', '.join(item.split()[-1] for item in search_result['data'][:5])}")
             result = f"可能的料号：{search_result["data"][0].split()[-1]}\n{查(search_result["data"][0].split()[-1], False,**kwargs)}"
-    if not result and len(arg.strip())==5:
+    if not is_answer(result) and len(arg.strip())==5:
         micron_kwargs=kwargs.copy()
         micron_kwargs["url"]=None
-        micron_result=FDQueryMethods.parse_micron_pn(arg.strip(), **micron_kwargs)
+        with FDTrace.span("fallback", branch="micron"):
+            micron_result=FDQueryMethods.parse_micron_pn(arg.strip(), **micron_kwargs)
         if micron_result.get("result", False) and micron_result.get("data", {}).get("part-number", ""):
+            FDDeadline.add_partial(f"镁光料号：{micron_result['data']['part-number']}")
             if "accept" in micron_result:
                 micron_result["accept"]()
             result = f"镁光料号：{micron_result.get('data', {}).get('part-number', '')}\n{查(micron_result.get('data', {}).get('part-number', ''), False,**kwargs)}"
@@ -930,16 +1258,28 @@ def 搜(arg: str,**kwargs) -> str:
     arg = arg.lower()
     raw_result = FDQueryMethods.search(arg,**kwargs)
     result = result_to_text(raw_result, **kwargs)
+    if raw_result.get("result", False) and kwargs.get("local") is not True:
+        # 用户接下来多半会查询其中的料号，在后台先取到缓存中
+        FDPrefetch.speculative.submit('flash_detail', [item.split()[-1] for item in raw_result.get("data", [])])
     if not result or result=="未能查询到结果：找不到相关料号":
         if not all_numbers_alpha(arg):
             result = ""
     return result
 
+def 筛(arg: str, count: int=20, **kwargs) -> str:
+    raw_result = FDQueryMethods.filter_records(arg, count=count, **kwargs)
+    if not raw_result.get("result", False):
+        return f"未能查询到结果：{raw_result.get('error', '未知错误')}"
+    total = raw_result["total"]
+    shown = len(raw_result["data"])
+    header = f"符合条件的料号（共{total}条{f'，显示前{shown}条' if shown < total else ''}）："
+    return header + "\n" + "\n".join(raw_result["data"])
 
 
 def 查DRAM(arg: str, debug: bool=False, **kwargs) -> str:
     # 转换为小写进行处理，确保不区分大小写
     arg = arg.lower()
+    access_log.record('dram_detail', arg)
     raw_result=FDQueryMethods.get_dram_detail(arg=arg, debug=debug, **kwargs)
     result = result_to_text(raw_result, debug=debug, **kwargs)
     if result and "accept" in raw_result:
@@ -982,7 +1322,37 @@ def phison_handler(arg: str, debug: bool=False, **kwargs):
     return result
 
 
-def get_message_result(message: str) -> str:
+# 查询命令标识 → 处理函数
+query_handlers = {
+    "micron": micron_handler,
+    "phison": phison_handler,
+    "dram": 查DRAM,
+    "id": ID,
+    "查": 查,
+    "搜": 搜,
+    "筛": 筛,
+}
+
+
+def resolved_part_number(result: str) -> str:
+    """回复中的料号行（判断渐进式回复的两轮查询是否解析到同一个料号）"""
+    return next((line for line in result.splitlines() if line.startswith(translations["partNumber"])), "")
+
+
+def is_answer(result: str) -> bool:
+    """回复是否包含实际结果（而不是无结果、错误提示）"""
+    result = result.strip() if result else ""
+    return bool(result) and result != "无结果" and not result.startswith(("未能查询到结果", "处理错误", "查询超过"))
+
+
+def get_message_result(message: str, local: bool | None = None, quick: bool = False) -> str:
+    """处理一条查询消息
+
+    Args:
+        message: 消息文本（可带--参数）
+        local: 消息未指定--local/--online时使用的本地模式（渐进式回复的两轮查询分别指定）
+        quick: 渐进式回复的第一轮：查不到时不回退到搜索和容错匹配
+    """
     try:
         
         # 如果有参数且长度超过72，则返回错误信息
@@ -993,8 +1363,9 @@ def get_message_result(message: str) -> str:
         message=args[0]
         refresh_flag=True if "refresh" in args else None
         debug_flag=True if "debug" in args else None
+        trace_flag=debug_flag or "trace" in args
         save_flag=True if "save" in args else False if "nosave" in args else None
-        local_flag=True if "local" in args else False if "online" in args else None
+        local_flag=True if "local" in args else False if "online" in args else local
         if(debug_flag):
             print(args)
         count="".join([(arg.split("=")[-1].strip() if arg.startswith("count") else "") for arg in args])
@@ -1021,20 +1392,23 @@ def get_message_result(message: str) -> str:
         if url is not None:
             kwargs["url"] = url
 
-        if message.lower().startswith("/micron"):
-            result = micron_handler(message[7:].strip(), **kwargs)
-        elif message.lower().startswith("/phison"):
-            result = phison_handler(message[7:].strip(), **kwargs)
-        elif message.lower().startswith("dram"):
-            result = 查DRAM(message[5:].strip(), **kwargs)
-        elif message.lower().startswith("查dram"):
-            result = 查DRAM(message[6:].strip(), **kwargs)
-        elif message.lower().startswith(("id")):
-            result = ID(message[2:].strip(), **kwargs)
-        elif message.startswith(("查")):
-            result = 查(message[1:].strip(), **kwargs) 
-        elif message.startswith(("搜")):
-            result = 搜(message[1:].strip(),**kwargs)
+        command = query_router.match(message)
+        handler = query_handlers.get(command.token) if command else None
+        if quick and command and command.token == "查":
+            kwargs["retry"] = False
+        if handler:
+            # 整条查询链共享一个处理时限，用完后回复已取得的部分结果
+            with FDDeadline.deadline_context(plugin_config.configs.get("query_deadline", 20)) as deadline:
+                if trace_flag:
+                    with FDTrace.start_trace() as trace:
+                        with FDTrace.span(command.token, arg=command.rest):
+                            result = handler(command.rest, **kwargs)
+                else:
+                    result = handler(command.rest, **kwargs)
+            if deadline and deadline.cut_short:
+                result = deadline.render(result)
+            if trace_flag:
+                result = f"{result}\n{trace.render()}"
         else:
             result = "未知命令(请使用/help获取帮助)"
         output = False if "nooutput" in args else True
@@ -1053,6 +1427,11 @@ def instance():
         except Exception as e:
             print(f"错误：{e}")
 
+def serve(host: str = "127.0.0.1", port: int = 8089, workers: int = 8):
+    """HTTP服务模式：以JSON接口提供与机器人相同的查询和缓存（详见FDServer）"""
+    from . import FDServer
+    FDServer.run_server(host, port, workers)
+
 
 if __name__ == "__main__":
     if 'plugin_config' not in globals():
@@ -1,5 +1,9 @@
+import html
+import re
+import threading
+import time
+
 import requests
-from bs4 import BeautifulSoup
 import urllib3
 import ssl
 
@@ -15,66 +19,182 @@ class TLSAdapter(requests.adapters.HTTPAdapter):
         kwargs['ssl_context'] = ctx
         return super(TLSAdapter, self).init_poolmanager(*args, **kwargs)
 
-def decode_spectek_mark(mark_code):
+
+# 轻量级HTML提取（只处理Spectek页面用到的结构，避免完整解析整个页面）
+_INPUT_RE = re.compile(r'<input\b[^>]*>', re.IGNORECASE)
+_ATTR_RE = re.compile(r'([\w:$.-]+)\s*=\s*"([^"]*)"')
+_TABLE_RE = re.compile(r'<table\b[^>]*\bid="MainCPH_MarkCodeGridView"[^>]*>(.*?)</table>', re.IGNORECASE | re.DOTALL)
+_ROW_RE = re.compile(r'<tr\b[^>]*>(.*?)</tr>', re.IGNORECASE | re.DOTALL)
+_CELL_RE = re.compile(r'<t[dh]\b[^>]*>(.*?)</t[dh]>', re.IGNORECASE | re.DOTALL)
+_TAG_RE = re.compile(r'<[^>]+>')
+
+HIDDEN_FIELDS = ("__VIEWSTATE", "__VIEWSTATEGENERATOR", "__EVENTVALIDATION")
+
+
+def extract_hidden_fields(page: str) -> dict:
+    """从页面中提取ASP.NET的隐藏字段"""
+    fields = {}
+    for tag in _INPUT_RE.findall(page):
+        attrs = dict(_ATTR_RE.findall(tag))
+        name = attrs.get("id") or attrs.get("name")
+        if name in HIDDEN_FIELDS:
+            fields[name] = html.unescape(attrs.get("value", ""))
+    return fields
+
+
+def extract_result_table(page: str) -> list | None:
+    """从页面中提取解码结果表格
+
+    Returns:
+        表格的行列表（每行是单元格文本列表），找不到表格返回None
     """
-    解码Spectek的Mark Code，返回产品信息。
+    table = _TABLE_RE.search(page)
+    if not table:
+        return None
+    results = []
+    for row in _ROW_RE.findall(table.group(1)):
+        cols = [html.unescape(_TAG_RE.sub("", cell)).strip() for cell in _CELL_RE.findall(row)]
+        if cols:
+            results.append(cols)
+    return results
 
-    :param mark_code: Spectek的Mark Code字符串，例如 "PE812"
-    :return: 包含Mark Code、Part Number和Product Family的列表，例如[['Mark Code', 'Part Number', 'Product Family'], ['PE812', 'SGG64M16V68AG8GNF', 'DDR3']]
+
+class SpectekClient:
+    """长连接的Spectek Mark Code解码客户端
+
+    复用同一个TLS会话，并缓存ASP.NET隐藏字段，过期或失效前不再重复GET页面
     """
-    url = "https://www.spectek.com/menus/mark_code.aspx"
-    session = requests.Session()
-    session.mount('https://', TLSAdapter())
-    
-    session.headers.update({
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
-        "Accept-Language": "en-US,en;q=0.9",
-        "Referer": "https://www.spectek.com/menus/mark_code.aspx"
-    })
-    
-    try:
-        # 1. 发送 GET 请求以获取初始页面和隐藏的状态字段
-        response = session.get(url, verify=False, timeout=15)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # 提取 ASP.NET 必需的隐藏字段
-        viewstate = soup.find('input', {'id': '__VIEWSTATE'})['value']
-        viewstate_gen = soup.find('input', {'id': '__VIEWSTATEGENERATOR'})['value']
-        event_validation_el = soup.find('input', {'id': '__EVENTVALIDATION'})
-        event_validation = event_validation_el['value'] if event_validation_el else ""
-        
-        # 2. 构建 POST 数据
+
+    URL = "https://www.spectek.com/menus/mark_code.aspx"
+
+    def __init__(self, state_ttl: float = 1800, timeout: float = 15):
+        """初始化客户端
+
+        Args:
+            state_ttl: 隐藏字段的缓存有效期（秒）
+            timeout: 请求超时时间（秒）
+        """
+        self.url = self.URL
+        self.state_ttl = state_ttl
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self._session = None
+        self._fields = {}
+        self._fields_time = 0.0
+
+    @property
+    def session(self) -> requests.Session:
+        if self._session is None:
+            session = requests.Session()
+            session.mount('https://', TLSAdapter())
+            session.headers.update({
+                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
+                "Accept-Language": "en-US,en;q=0.9",
+                "Referer": self.url
+            })
+            self._session = session
+        return self._session
+
+    def _update_fields(self, page: str) -> None:
+        fields = extract_hidden_fields(page)
+        if "__VIEWSTATE" in fields:
+            self._fields = fields
+            self._fields_time = time.monotonic()
+
+    def _timeout(self, deadline: float | None) -> float:
+        """单次请求的超时：不超过deadline（time.monotonic()时刻）前的剩余时间"""
+        if deadline is None:
+            return self.timeout
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("已超过查询时限")
+        return min(self.timeout, remaining)
+
+    def _hidden_fields(self, force: bool = False, deadline: float | None = None) -> dict:
+        """获取隐藏字段，缓存未过期时直接返回缓存"""
+        if force or not self._fields or time.monotonic() - self._fields_time > self.state_ttl:
+            response = self.session.get(self.url, verify=False, timeout=self._timeout(deadline))
+            self._update_fields(response.text)
+            if not self._fields:
+                raise ValueError("页面中找不到__VIEWSTATE字段")
+        return self._fields
+
+    def _post(self, mark_code: str, force_refresh: bool = False, deadline: float | None = None) -> list | None:
+        """提交解码表单
+
+        Args:
+            deadline: 所有请求须在此time.monotonic()时刻前完成，None表示只使用默认超时
+
+        Returns:
+            结果表格列表（无结果时为空列表），隐藏字段失效时返回None
+        """
+        fields = self._hidden_fields(force_refresh, deadline)
         payload = {
-            '__VIEWSTATE': viewstate,
-            '__VIEWSTATEGENERATOR': viewstate_gen,
-            '__EVENTVALIDATION': event_validation,
+            '__VIEWSTATE': fields.get("__VIEWSTATE", ""),
+            '__VIEWSTATEGENERATOR': fields.get("__VIEWSTATEGENERATOR", ""),
+            '__EVENTVALIDATION': fields.get("__EVENTVALIDATION", ""),
             'ctl00$MainCPH$MarkCodeTextBox': mark_code,
             'ctl00$MainCPH$MarkCodeButton.x': '10',
             'ctl00$MainCPH$MarkCodeButton.y': '10'
         }
-        
-        # 3. 发送 POST 请求
-        response = session.post(url, data=payload, verify=False, timeout=15)
-        
-        # 4. 解析返回的 HTML 以提取结果
-        soup = BeautifulSoup(response.text, 'html.parser')
-        table = soup.find('table', {'id': 'MainCPH_MarkCodeGridView'})
-        
-        if not table:
-            return "未找到解码结果，请检查代码是否正确。"
-        
-        results = []
-        rows = table.find_all('tr')
-        for row in rows:
-            cols = row.find_all(['td', 'th'])
-            cols = [ele.text.strip() for ele in cols]
-            if cols:
-                results.append(cols)
-                
-        return results
-    except Exception as e:
-        return f"请求失败: {str(e)}"
+        response = self.session.post(self.url, data=payload, verify=False, timeout=self._timeout(deadline))
+        # 回发页面会带回新的隐藏字段，直接用于下一次请求
+        self._update_fields(response.text)
+        if response.status_code != 200:
+            # 隐藏字段失效时ASP.NET会返回错误页
+            return None
+        return extract_result_table(response.text) or []
+
+    def use_url(self, url: str) -> None:
+        """切换表单地址（如指向本地模拟服务器），切换后丢弃会话和隐藏字段"""
+        if url != self.url:
+            with self.lock:
+                self.url = url
+                self._session = None
+                self._fields = {}
+
+    def decode(self, mark_code: str, deadline: float | None = None):
+        """解码Mark Code
+
+        Args:
+            deadline: 所有请求须在此time.monotonic()时刻前完成，None表示只使用默认超时
+
+        Returns:
+            结果表格列表，失败时返回错误信息字符串
+        """
+        try:
+            with self.lock:
+                results = self._post(mark_code, deadline=deadline)
+                if results is None:
+                    # 隐藏字段已失效，重新获取后再试一次
+                    results = self._post(mark_code, force_refresh=True, deadline=deadline)
+            if not results:
+                return "未找到解码结果，请检查代码是否正确。"
+            return results
+        except TimeoutError as e:
+            # 时限用完时还没有发出请求，会话仍然有效
+            return f"请求失败: {str(e)}"
+        except Exception as e:
+            # 连接异常时丢弃会话，下次重新建立
+            self._session = None
+            self._fields = {}
+            return f"请求失败: {str(e)}"
+
+
+# 创建全局客户端实例
+client = SpectekClient()
+
+
+def decode_spectek_mark(mark_code, deadline=None):
+    """
+    解码Spectek的Mark Code，返回产品信息。
+
+    :param mark_code: Spectek的Mark Code字符串，例如 "PE812"
+    :param deadline: 所有请求须在此time.monotonic()时刻前完成，None表示只使用默认超时
+    :return: 包含Mark Code、Part Number和Product Family的列表，例如[['Mark Code', 'Part Number', 'Product Family'], ['PE812', 'SGG64M16V68AG8GNF', 'DDR3']]
+    """
+    return client.decode(mark_code, deadline)
 
 if __name__ == "__main__":
     test_code = "PE812"